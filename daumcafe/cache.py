@@ -1,10 +1,15 @@
 import os
-from typing import List
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
 
 from daumcafe.structs import Cafe, Board, Article
 from util.fileutil import read_tsv, read_txt
 import time
 
+# an article list is refreshed once it is older than this
+FRESH_SECONDS = 30 * 24 * 60 * 60
+
 
 def read_cafe_cachefile(cafe: Cafe) -> List[Board]:
     if not os.path.isfile(cafe.boardlist_cache):
@@ -20,17 +25,23 @@ def read_cafe_cachefile(cafe: Cafe) -> List[Board]:
     return boards
 
 
-def read_board_cachefile(board: Board) -> List[Article]:
+def read_board_aids(board: Board) -> Optional[List[str]]:
     if not os.path.isfile(board.articlelist_cache):
         return None
-    # if file has been updated more than 30 days ago, we regard it as stale.
-    if (time.time() - os.path.getmtime(board.articlelist_cache)) > 30 * 24 * 60 * 60:
-        return None
     entries = read_txt(board.articlelist_cache)
     if len(entries) == 0:
         return []
     if entries[0] == "<<Unauthorized>>":
         return []
+    return entries
+
+
+def read_board_cachefile(board: Board) -> List[Article]:
+    """Reads the cached article list, newest first. Whether it is fresh or
+    complete is in the board meta"""
+    entries = read_board_aids(board)
+    if entries is None:
+        return None
     articles = map(lambda entry: Article(board, entry), entries)
     return list(articles)
 
@@ -52,3 +63,82 @@ def write_articlelist_cachefile(
             return
         for article in articlelist:
             f.write(f"{article.aid}\n")
+
+
+def read_board_meta(board: Board) -> Dict[str, Any]:
+    """Returns the board meta: listed (time the article list was last
+    fetched or refreshed), complete (whether it was paged to the end),
+    newest (highest article id in it), articles and checksum of the list,
+    and finished, written by write_board_finished. Lists written before the
+    meta were always paged to the end, and were listed when last modified"""
+    if os.path.isfile(board.meta_cache):
+        with open(board.meta_cache, "r", encoding="utf-8") as f:
+            return json.loads(f.read())
+    aids = read_board_aids(board)
+    if aids is None:
+        return {}
+    return {
+        "listed": os.path.getmtime(board.articlelist_cache),
+        "complete": True,
+        "newest": newest_article(aids),
+        "articles": len(aids),
+        "checksum": articlelist_checksum(aids),
+    }
+
+
+def write_board_meta(board: Board, meta: Dict[str, Any]):
+    with open(board.meta_cache, "w", encoding="utf-8") as f:
+        f.write(json.dumps(meta))
+
+
+def listed_meta(articlelist: List[Article], complete: bool, meta=None) -> Dict[str, Any]:
+    """Meta of a freshly listed or refreshed article list. A finished record
+    of an older list is kept, its checksum no longer matches"""
+    aids = [article.aid for article in articlelist]
+    meta = dict(meta or {})
+    meta.update(
+        listed=time.time(),
+        complete=complete,
+        newest=newest_article(aids),
+        articles=len(aids),
+        checksum=articlelist_checksum(aids),
+    )
+    return meta
+
+
+def write_board_finished(board: Board, aids: List[str], saved: int,
+                         meta: Optional[Dict[str, Any]] = None):
+    """Records that every article of the list was handled, saved of them
+    with a document"""
+    if meta is None:
+        meta = read_board_meta(board)
+    meta["finished"] = {
+        "time": time.time(),
+        "articles": len(aids),
+        "saved": saved,
+        "checksum": articlelist_checksum(aids),
+    }
+    write_board_meta(board, meta)
+
+
+def articlelist_checksum(aids: List[str]) -> str:
+    digest = hashlib.sha1()
+    for aid in aids:
+        digest.update(aid.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def newest_article(aids: List[str]) -> Optional[int]:
+    return max((int(aid) for aid in aids), default=None)
+
+
+def is_fresh(meta: Dict[str, Any]) -> bool:
+    listed = meta.get("listed")
+    return listed is not None and time.time() - listed <= FRESH_SECONDS
+
+
+def merge_articlelists(newer: List[Article], articlelist: List[Article]) -> List[Article]:
+    """Puts newer articles in front of the cached list, newest first"""
+    aids = {article.aid for article in newer}
+    return newer + [article for article in articlelist if article.aid not in aids]
@@ -1,29 +1,70 @@
+"""Completion checks of daumcafe cafes and boards.
+
+They read the small files under cache/daumcafe only: boards.tsv of a cafe
+and board.json of each board, whose finished record handle_board writes
+with the article count and checksum of the list it went through. So
+filtering the cafe list at startup does not read any data file.
+"""
 import os
 
 from daumcafe.structs import Cafe, Board
 from util.fileutil import count_file_lines
-from daumcafe.cache import read_cafe_cachefile, read_board_cachefile
-import time
+from daumcafe.cache import (
+    read_cafe_cachefile,
+    read_board_aids,
+    read_board_meta,
+    write_board_finished,
+    is_fresh,
+)
+
+SKIP_WORDS = [
+    "출석 체크",
+    "출첵",
+    "출석체크",
+    "가입인사",
+    "가입 인사",
+    "등업",
+    "신청",
+    "승급",
+]
+
+
+def is_skipped(board: Board) -> bool:
+    """Boards handle_board does not crawl"""
+    if board.btype != "normal":
+        return True
+    return any(word in board.bname for word in SKIP_WORDS)
+
+
+def legacy_board_is_processed(board: Board, meta) -> bool:
+    """Boards finished by earlier versions have a board.jsonl with a line
+    per listed article. A match is recorded, so the file is counted once"""
+    if not os.path.isfile(board.board_jsonl_savepath):
+        return False
+    aids = read_board_aids(board)
+    line_count = count_file_lines(board.board_jsonl_savepath)
+    if len(aids) != line_count:
+        return False
+    write_board_finished(board, aids, line_count, meta)
+    return True
 
 
 def board_is_processed(board: Board):
     if not os.path.isdir(board.cache_dir):
         return False
-    if not os.path.isfile(board.board_jsonl_savepath):
-        return False
     if not os.path.isfile(board.articlelist_cache):
         return False
 
-    # check if board cache file is up-to-date. We regard it is stale if 1 month has passed since the last update.
-    if (time.time() - os.path.getmtime(board.articlelist_cache)) > 30 * 24 * 60 * 60:
+    # check if the article list is up-to-date. It is refreshed after a month
+    meta = read_board_meta(board)
+    if not is_fresh(meta) or not meta.get("complete", False):
         return False
 
-    articles = read_board_cachefile(board)
-    article_count = len(articles)
-    line_count = count_file_lines(board.board_jsonl_savepath)
-    if article_count != line_count:
-        return False
-    return True
+    finished = meta.get("finished")
+    if finished is None:
+        return legacy_board_is_processed(board, meta)
+    # the list may have been refreshed after the board was finished
+    return finished.get("checksum") == meta.get("checksum")
 
 
 def cafe_is_processed(cafe: Cafe):
@@ -40,12 +81,19 @@ def cafe_is_processed(cafe: Cafe):
         return False
 
     for board in boards:
+        if is_skipped(board):
+            continue
         if not board_is_processed(board):
             return False
 
     return True
 
 
+def is_pending(task: Cafe | Board) -> bool:
+    """Task filter of daumcafeCrawler"""
+    return not is_processed(task)
+
+
 def is_processed(task: Cafe | Board) -> bool:
     if isinstance(task, Cafe):
         return cafe_is_processed(task)
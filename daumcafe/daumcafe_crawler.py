@@ -2,7 +2,7 @@ from typing import List
 import yaml
 from model.crawler import Crawler
 
-from daumcafe.checker import is_processed
+from daumcafe.checker import is_pending
 from daumcafe.structs import Cafe
 from util.fileutil import read_txt
 from util.argcheck import parse_iplist
@@ -16,13 +16,14 @@ class daumcafeCrawler(Crawler):
         super(daumcafeCrawler, self).__init__()
         self.save_id = "daumcafe"
         self.save_dir = "data/daumcafe_merged"
+        self.task_filter = is_pending
 
     def _build_cafelist(self, cafelist_path: str) -> List[Cafe]:
         script_dir = os.path.dirname(os.path.realpath(__file__))
         cafelist_path = os.path.join(script_dir, cafelist_path)
         cids = read_txt(cafelist_path, header=False)
-        cafes = map(lambda cid: Cafe(cid), cids)
-        return [cafe for cafe in cafes if not is_processed(cafe)]
+        # processed cafes are filtered by task_filter
+        return [Cafe(cid) for cid in cids]
 
     def load_configuration(self, config_file: str):
         with open(config_file, "r") as file:
@@ -42,10 +43,15 @@ class daumcafeCrawler(Crawler):
         for ip, interval in zip(ips, intervals):
             argv = {"ip": ip, "interval": interval}
             private_args.append(argv)
-        shared_argv = {}
+        shared_argv = {
+            "concurrency": data_dict.get("concurrency", 1),
+            "split_boards": data_dict.get("split_boards", True),
+        }
 
         cafelist_txt_path = data_dict["cafelist"]
-        cafes = self._build_cafelist(cafelist_txt_path)
+        cafes = []
+        if self.build_tasks:
+            cafes = self._build_cafelist(cafelist_txt_path)
 
         return cafes, shared_argv, private_args
 
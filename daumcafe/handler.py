@@ -16,9 +16,13 @@ from daumcafe.parser import (
     is_erroneous_article,
     extract_board_info,
 )
-from daumcafe.checker import is_processed
-from util.misc import get_interval
+from daumcafe.checker import is_processed, SKIP_WORDS
+from util.misc import get_interval, get_concurrency
 from util.connection import get_html
+from util.htmlparse import make_soup
+from util.customexception import TooManyRequestsError
+from util.aio import get_fetcher, chunks, raise_critical
+from engine.scheduler import Subtask, UNKNOWN_COST
 from urllib.parse import urlencode, urlunparse
 import json
 
@@ -76,8 +80,12 @@ def peek_article(article: Article, ip: str, logger: Logger, interval=1):
 
 
 def build_board_articlelist(
-    board: Board, ip: Optional[str] = None, logger: Optional[Logger] = None, interval=1
-) -> List[Article]:
+    board: Board, ip: Optional[str] = None, logger: Optional[Logger] = None, interval=1,
+    since: Optional[int] = None,
+) -> Optional[List[Article]]:
+    """Lists the articles of the board, newest first. With since, only the
+    articles newer than since are listed, and paging stops at the first page
+    without any. Returns None if a page could not be fetched"""
     btype = board.btype
     if btype != "normal":
         logger.warning("Board %s is not normal board", board)
@@ -100,7 +108,7 @@ def build_board_articlelist(
     except Exception as e:
         msg = f"Failed to parse board_info from {uri}"
         logger.error(msg)
-        return []
+        return None
     uri = build_board_uri(board_info, page=target_page)
     while True:
         status, html = get_html(
@@ -115,7 +123,7 @@ def build_board_articlelist(
             logger.warning("Board %s is not accessible", board)
             return []
         if html is None:
-            return []
+            return None
         try:
             data = json.loads(html)
             if 'code' in data and data['code'] == 0:
@@ -124,19 +132,27 @@ def build_board_articlelist(
         except:
             msg = f"Failed to parse json from {uri}"
             logger.error(msg)
-            return []
+            return None
         # error check
         # selector = "#mArticle > div.cafe_error > h4.tit_error > span.txt_error"
         # tag = soup.select_one(selector)
-        articles.extend(extract_single_page(data, board))
+        page_articles = extract_single_page(data, board)
+        if since is not None:
+            page_articles = [article for article in page_articles
+                             if int(article.aid) > since]
+            if not page_articles:
+                # older articles are in the cached list
+                break
+        articles.extend(page_articles)
 
         if len(articles) == 0:
             logger.warning("Board %s is empty", board)
             return []
 
         if not accessible:
+            # a refreshed board was peeked when it was first listed
             trial_article = articles[0]
-            if not peek_article(trial_article, ip, logger, interval=interval):
+            if since is None and not peek_article(trial_article, ip, logger, interval=interval):
                 logger.error(
                     "Failed to peek article %s. Member only", trial_article)
                 return []
@@ -168,14 +184,17 @@ def build_cafe_boardlist(
     return parse_cafe(soup, cafe)
 
 
-def handle_article(article: Article, ip: str, interval: int, logger: Logger):
-
+def handle_article(
+    article: Article, ip: str, interval: int, logger: Logger, headers=None
+):
+    if headers is None:
+        headers = daumheader
     html = article.load_from_file()
     logger.info("Handling article %s", article)
     if html is None:
         _, html = get_html(
             article.uri,
-            daumheader,
+            headers,
             interval=interval,
             ip=ip,
             logger=logger,
@@ -187,7 +206,7 @@ def handle_article(article: Article, ip: str, interval: int, logger: Logger):
         article.save_html(html)
 
     try:
-        soup = BeautifulSoup(html, "html.parser")
+        soup = make_soup(html)
     except Exception as e:
         msg = f"Failed to parse html from {article.uri}"
         logger.error(msg)
@@ -195,20 +214,46 @@ def handle_article(article: Article, ip: str, interval: int, logger: Logger):
     parse_article(article, soup, logger)
 
 
-SKIP_WORDS = [
-    "출석 체크",
-    "출첵",
-    "출석체크",
-    "가입인사",
-    "가입 인사",
-    "등업",
-    "신청",
-    "승급",
-]
+def update_articlelist(board: Board, ip: str, logger: Logger, interval=1) -> List[Article]:
+    """Returns the article list of the board. A list paged to the end is only
+    refreshed with the articles newer than it once it is no longer fresh,
+    other lists are built again"""
+    articlelist = dcache.read_board_cachefile(board)
+    meta = dcache.read_board_meta(board)
+    if articlelist is not None and meta.get("complete", False):
+        if dcache.is_fresh(meta):
+            logger.info(f"Read {len(articlelist)} articles from cache")
+            return articlelist
+        since = meta.get("newest")
+        if since is not None:
+            newer = build_board_articlelist(
+                board, ip, logger, interval=interval, since=since)
+            if newer is None:
+                logger.error("Failed to refresh board %s, using the cached list", board)
+                return articlelist
+            logger.info("Board %s has %d articles newer than %d", board, len(newer), since)
+            articlelist = dcache.merge_articlelists(newer, articlelist)
+            dcache.write_articlelist_cachefile(board, articlelist)
+            dcache.write_board_meta(board, dcache.listed_meta(articlelist, True, meta))
+            return articlelist
+
+    articlelist = build_board_articlelist(board, ip, logger, interval=interval)
+    complete = articlelist is not None
+    if not complete:
+        # listed again by the next run
+        articlelist = []
+    dcache.write_articlelist_cachefile(board, articlelist)
+    dcache.write_board_meta(board, dcache.listed_meta(articlelist, complete))
+    return articlelist
 
 
 def handle_board(
-    board: Board, ip: str, interval: int, logger: Logger, save_queue: mp.Queue
+    board: Board,
+    ip: str,
+    interval: int,
+    logger: Logger,
+    save_queue: mp.Queue,
+    concurrency: int = 1,
 ):
     if is_processed(board):
         logger.warning("Board %s is already processed", board)
@@ -224,38 +269,81 @@ def handle_board(
             return
 
     logger.warning("Handling board %s", board)
-    articlelist = dcache.read_board_cachefile(board)
-    if articlelist is None:
-        articlelist = build_board_articlelist(
-            board, ip, logger, interval=interval)
-        dcache.write_articlelist_cachefile(board, articlelist)
-    else:
-        logger.info(f"Read {len(articlelist)} articles from cache")
+    articlelist = update_articlelist(board, ip, logger, interval=interval)
 
-    ema = 1
-    ratio = 0.1
-    handled_consecutive = 0
+    pending = []
     for article in articlelist:
         if article.is_downloaded():
             logger.info("Article %s is already handled", article)
-            handled_consecutive += 1
-            if handled_consecutive > 5:
-                msg = f"The rest of the board {bname} seems to be handled"
-                logger.warning(msg)
-                break
             continue
-        handled_consecutive = 0
-        handle_article(article, ip, interval, logger)
-        dump = article.to_json()
-        if dump:
-            save_queue.put(dump)
-            ema = ema * (1 - ratio) + 1 * ratio
+        pending.append(article)
+
+    # with concurrency > 1, up to concurrency articles are fetched at once.
+    # Request starts are still spaced by the ip's rate limiter
+    fetcher = None
+    if concurrency > 1:
+        fetcher = get_fetcher(ip, concurrency)
+
+    def fetch(article):
+        handle_article(article, ip, interval, logger, headers=dict(daumheader))
+
+    ema = 1
+    ratio = 0.1
+    saved = len(articlelist) - len(pending)
+    for chunk in chunks(pending, concurrency):
+        if fetcher is None:
+            handle_article(chunk[0], ip, interval, logger)
         else:
-            ema = ema * (1 - ratio)
-        if ema < 0.2:
-            msg = f"Too many errors. Abort handling board {bname}"
-            logger.error(msg)
-            break
+            results = fetcher.map(fetch, chunk)
+            raise_critical(results, (TooManyRequestsError,))
+            for article, result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to handle {article}, Exception: {result}")
+        for article in chunk:
+            dump = article.to_json()
+            if dump:
+                save_queue.put(dump)
+                saved += 1
+                ema = ema * (1 - ratio) + 1 * ratio
+            else:
+                ema = ema * (1 - ratio)
+            if ema < 0.2:
+                msg = f"Too many errors. Abort handling board {bname}"
+                logger.error(msg)
+                return
+    dcache.write_board_finished(board, [article.aid for article in articlelist], saved)
+
+
+def handle_board_subtask(
+    board: Board,
+    shared_argv: Dict[str, Any],
+    private_argv: Dict[str, Any],
+    logger: Logger,
+    save_queue=None,
+):
+    """Handles one board split off handle_cafe, with the ip of the worker
+    that took it"""
+    ip = private_argv["ip"]
+    interval = get_interval(shared_argv, private_argv)
+    concurrency = get_concurrency(shared_argv, private_argv)
+    handle_board(board, ip, interval, logger, save_queue,
+                 concurrency=concurrency)
+
+
+def split_cafe(cafe: Cafe, boardlist: List[Board], scheduler, logger: Logger):
+    """Submits the unprocessed boards of a cafe as sub-tasks.
+    Boards with a cached article list are estimated by its length"""
+    subtasks = []
+    for board in boardlist:
+        if is_processed(board):
+            continue
+        articlelist = dcache.read_board_cachefile(board)
+        cost = UNKNOWN_COST if articlelist is None else len(articlelist)
+        subtasks.append(Subtask(handle_board_subtask, board, cost))
+    scheduler.submit(subtasks)
+    total = sum(subtask.cost for subtask in subtasks)
+    logger.warning("Split cafe %s into %d boards, ~%d requests",
+                   cafe, len(subtasks), total)
 
 
 def handle_cafe(
@@ -271,6 +359,7 @@ def handle_cafe(
     logger.warning("Handling cafe %s", cafe)
     ip = private_argv["ip"]
     interval = get_interval(shared_argv, private_argv)
+    concurrency = get_concurrency(shared_argv, private_argv)
 
     # if board list cachefile is available, use it.
     if osp.isfile(cafe.boardlist_cache):
@@ -280,6 +369,13 @@ def handle_cafe(
         boardlist = build_cafe_boardlist(cafe, ip, logger, interval=interval)
         dcache.write_cafe_cachefile(cafe, boardlist)
 
+    # let every worker take the boards of this cafe
+    scheduler = shared_argv.get("scheduler")
+    if scheduler is not None and shared_argv.get("split_boards", True):
+        split_cafe(cafe, boardlist, scheduler, logger)
+        return
+
     # handle each boards
     for board in boardlist:
-        handle_board(board, ip, interval, logger, save_queue)
+        handle_board(board, ip, interval, logger, save_queue,
+                     concurrency=concurrency)
@@ -4,6 +4,8 @@ import json
 import gzip
 import functools
 
+from util.archive import ARCHIVE_DIR, get_archive, has_archive
+
 CACHE_BASE = "cache/daumcafe"
 DATA_BASE = "data/daumcafe"
 
@@ -34,6 +36,7 @@ class Board:
     bname: str
     cache_dir: str
     articlelist_cache = None  # type: str
+    meta_cache = None  # type: str
     board_jsonl_savepath = None  # type: str
 
     def __init__(self, cafe: Cafe, bid: str, btype: str, bname: str):
@@ -45,16 +48,14 @@ class Board:
 
         self.cache_dir = os.path.join(cafe.cache_dir, bid)
         self.articlelist_cache = os.path.join(self.cache_dir, "aids.txt")
+        self.meta_cache = os.path.join(self.cache_dir, "board.json")
         data_dir = os.path.join(DATA_BASE, cafe.cafeid, bid)
         self.board_jsonl_savepath = os.path.join(data_dir, "board.jsonl")
 
-        # make board cache dir and data dir if not exists
+        # make board cache dir if not exists. The data dir is made by
+        # the archive of its first article, so checking boards reads no data
         if not os.path.isdir(self.cache_dir):
             os.makedirs(self.cache_dir, exist_ok=True)
-        if not os.path.isdir(data_dir):
-            os.makedirs(data_dir, exist_ok=True)
-        if not os.path.isdir(os.path.join(data_dir, "htmls")):
-            os.makedirs(os.path.join(data_dir, "htmls"), exist_ok=True)
 
     def __str__(self):
         return f"{self.cafe.cafeid} {self.bname}({self.bid})"
@@ -80,6 +81,7 @@ class Article:
     posted = None  # type: str
     text = None  # type: str
     html_data_path = None  # type: str
+    archive_dir = None  # type: str
     uri = None
 
     def __init__(self, board: Board, aid: str):
@@ -91,6 +93,8 @@ class Article:
             DATA_BASE, board.cafe.cafeid, board.bid, "htmls", aid + ".html"
         )
         self.gz_path = self.html_data_path + ".gz"
+        self.archive_dir = os.path.join(
+            DATA_BASE, board.cafe.cafeid, board.bid, ARCHIVE_DIR)
         self.uri = f"https://m.cafe.daum.net/{board.cafe.cafeid}/{board.bid}/{aid}"
 
     def to_json(self, ignore=True):
@@ -115,7 +119,12 @@ class Article:
     def __hash__(self) -> int:
         return hash(self.uri)
 
+    def in_archive(self):
+        return has_archive(self.archive_dir) and self.aid in get_archive(self.archive_dir)
+
     def is_downloaded(self):
+        if self.in_archive():
+            return True
         if os.path.exists(self.html_data_path):
             # self.convert_html_to_gzip() TODO: we need to convert all html to gzip, but not now, as of 24-11.
             return True
@@ -129,6 +138,12 @@ class Article:
         return False
 
     def load_from_file(self):
+        """Reads the html from the board archive, or from the htmls
+        files written by earlier versions"""
+        if has_archive(self.archive_dir):
+            html = get_archive(self.archive_dir).get_text(self.aid)
+            if html is not None:
+                return html
         if os.path.exists(self.html_data_path):
             with open(self.html_data_path, "r") as f:
                 return f.read()
@@ -138,8 +153,7 @@ class Article:
         return None
 
     def save_html(self, html):
-        with gzip.open(self.gz_path, "wt") as f:
-            f.write(html)
+        get_archive(self.archive_dir).put(self.aid, html)
 
     def _convert_html_to_gzip(self):
         with open(self.html_data_path, "r") as f:
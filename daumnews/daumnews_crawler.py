@@ -26,7 +26,7 @@ class daumnewsCrawler(Crawler):
             data_dict = yaml.safe_load(file)
         if data_dict["excludes"] is None:
             data_dict["excludes"] = []
-        office_dict = build_office_dictionary()
+        office_dict = self.OFFICEDICT
         if data_dict["offices"] == "*":
             offices = list(office_dict.keys())
             offices = list(set(offices) - set(data_dict["excludes"]))
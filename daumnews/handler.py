@@ -1,11 +1,14 @@
 import urllib.parse
-from time import sleep
+from time import sleep, monotonic
 import gzip
 import http.client
 from bs4 import BeautifulSoup
 import logging
 import requests
 
+from util.connection import CONNECTION_POOL
+from util.ratelimit import RATE_CONTROLLER
+
 HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
     "Accept-Encoding": "gzip, deflate, br",
@@ -32,7 +35,7 @@ def make_conn(netloc, ip):
     return conn
 
 
-def _fetch_html(uri, logger, ip, retry=5, retry_interval=15):
+def _fetch_html(uri, logger, ip, retry=5, retry_interval=15, interval=0.7):
     if logger is None:
         logger = logging.getLogger(__name__)
     parsed_uri = urllib.parse.urlparse(uri)
@@ -42,22 +45,32 @@ def _fetch_html(uri, logger, ip, retry=5, retry_interval=15):
     sendpath = path + "?" + query
     headers = HEADERS
 
+    failed = False
     for i in range(retry):
-        conn = None
         resp = None
-        if i > 0:
+        # non-200 responses already slowed (ip, host) down in the rate
+        # controller; connection failures and bans also wait retry_interval
+        if failed:
             sleep(retry_interval)
             retry_interval *= 1.5
+        failed = False
         try:
-            conn = make_conn(netloc, ip)
+            RATE_CONTROLLER.wait(ip, netloc, interval)
             logger.info("uri: " + str(uri) + ", retry: " + str(i))
-            conn.request("GET", sendpath, headers=headers)
-            resp = conn.getresponse()
+            started = monotonic()
+            try:
+                resp, raw = CONNECTION_POOL.request(netloc, sendpath, headers, ip=ip)
+            except Exception:
+                RATE_CONTROLLER.record(ip, netloc, interval, None)
+                raise
+            RATE_CONTROLLER.record(
+                ip, netloc, interval, resp.status, monotonic() - started)
             # headers["Referer"] = uri
 
             # handle redirection
             if resp.status == 302 and "Location" in resp.headers:
-                html = fetch_html(resp.headers["Location"], logger, ip)
+                html = fetch_html(resp.headers["Location"], logger, ip,
+                                  interval=interval)
                 return html
 
             # check status
@@ -80,24 +93,25 @@ def _fetch_html(uri, logger, ip, retry=5, retry_interval=15):
 
             encoding = resp.getheader("Content-Encoding")
             if encoding == "gzip":
-                data = gzip.decompress(resp.read())
+                data = gzip.decompress(raw)
             else:
-                data = resp.read()
+                data = raw
             return data.decode("utf-8", errors="ignore")
         except Exception as e:
+            failed = True
             logger.error(f"Exception: {e}, uri: {uri}, retry: {i}")
     logger.critical(f"Failed to fetch {uri}, retry: {retry} times")
     raise Exception(f"Failed to fetch {uri}, retry: {retry} times")
 
 
 def fetch_html(uri, logger, ip=None, retry=5, interval=0.7, retry_interval=15):
-    sleep(interval)
-    return _fetch_html(uri, logger, ip, retry=retry, retry_interval=retry_interval)
+    """Requests to a host are paced by RATE_CONTROLLER, starting at one per interval seconds"""
+    return _fetch_html(uri, logger, ip, retry=retry,
+                       retry_interval=retry_interval, interval=interval)
 
 
 def get_soup(uri, logger=None, ip=None, conn=None, interval=0.7):
-    sleep(interval)
-    data = fetch_html(uri, logger, ip)
+    data = fetch_html(uri, logger, ip, interval=interval)
     if data is None:
         return None
     soup = BeautifulSoup(data, "lxml")
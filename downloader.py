@@ -4,6 +4,9 @@ import time
 import traceback
 from argparse import ArgumentParser
 from engine.engine import Engine
+from engine.ledger import TaskLedger, TASK, SUBTASK
+from engine.transport import TRANSPORTS, MANAGER
+from util.compression import COMPRESSIONS, NONE, check_compression
 from util.slack import send_slack_message
 from daumcafe.daumcafe_crawler import daumcafeCrawler
 from daumnews.daumnews_crawler import daumnewsCrawler
@@ -12,10 +15,11 @@ from navernews.navernews_crawler import navernewsCrawler
 from naverblog.naverblog_crawler import naverblogCrawler
 from cafelist.navercafe_id_crawler import navercafeIDCrawler
 from daumcafelist.crawler import daumcafeIDCrawler  
+from reparse.reparse_crawler import reparseCrawler
 
 crawling_tasks = {"daumcafe": daumcafeCrawler, "navercafe": navercafeCrawler,
                   "daumnews": daumnewsCrawler, "navernews": navernewsCrawler,
-                  "naverblog": naverblogCrawler}
+                  "naverblog": naverblogCrawler, "reparse": reparseCrawler}
 onetime_tasks = {"navercafe_id": navercafeIDCrawler, 
                  "daumcafe_id": daumcafeIDCrawler}
 
@@ -24,6 +28,31 @@ def init():
     parser.add_argument("--config", required=True,
                         help="Task Configuration File")
     parser.add_argument("--task", required=True, help="Task Name")
+    parser.add_argument("--transport", default=MANAGER, choices=TRANSPORTS,
+                        help="Queue transport between processes")
+    parser.add_argument("--savers", type=int, default=1,
+                        help="Number of saver processes writing disjoint shards")
+    parser.add_argument("--parsers", type=int, default=0,
+                        help="Parser processes parsing fetched pages between the "
+                        "workers and the savers, 0 parses in the workers")
+    parser.add_argument("--feeders", type=int, default=None,
+                        help="Processes filtering the task list of cafe tasks while "
+                        "workers start, one per CPU by default")
+    parser.add_argument("--compression", default=NONE, choices=COMPRESSIONS,
+                        help="Compression of the saved jsonl shards")
+    parser.add_argument("--compression-level", type=int, default=None,
+                        help="Compression level, codec default if omitted")
+    parser.add_argument("--frame-documents", type=int, default=1000,
+                        help="Documents per independently readable frame")
+    parser.add_argument("--ledger", default=None,
+                        help="SQLite task ledger. A run with an existing ledger "
+                        "resumes its pending tasks without rebuilding the task list")
+    parser.add_argument("--retry-failed", nargs="?", const="*", default=None,
+                        metavar="PATTERN",
+                        help="Retry failed ledger tasks, optionally only keys "
+                        "matching a glob pattern")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Rebuild the task list and add it to the ledger")
     args = parser.parse_args()
     return args
 
@@ -43,17 +72,51 @@ def main(args):
         crawler = crawling_tasks[crawling_task]()
     else:
         crawler = onetime_tasks[crawling_task]()
+    ledger = None
+    if args.ledger is not None:
+        ledger = TaskLedger(args.ledger)
+        reclaimed = ledger.reclaim()
+        retried = 0
+        if args.retry_failed is not None:
+            retried = ledger.retry_failed(args.retry_failed)
+        known = sum(ledger.counts().values())
+        crawler.build_tasks = known == 0 or args.rescan
+        print(f"Ledger {args.ledger}: {known} tasks, "
+              f"{reclaimed} leases reclaimed, {retried} failed tasks retried")
     tasks, shared_argv, private_args = crawler.load_configuration(config_path)
+    subtasks = []
+    if ledger is not None:
+        if crawler.build_tasks:
+            # rebuilt tasks split again, so their old sub-tasks are not queued
+            ledger.add(tasks, reset=True)
+        else:
+            subtasks = ledger.pending(SUBTASK)
+        tasks = ledger.pending(TASK)
+        print(f"Ledger {args.ledger}: {len(tasks)} tasks, "
+              f"{len(subtasks)} sub-tasks pending")
     save_id = crawler.save_id
     save_dir = crawler.save_dir
 
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
-    engine = Engine(use_saver=True, task_name=crawling_task)
+    # fail before launching workers if the codec is unavailable
+    check_compression(args.compression)
+    engine = Engine(use_saver=True, task_name=crawling_task,
+                    transport=args.transport, ledger=ledger)
+    if args.parsers > 0:
+        engine.launch_parsers(args.parsers)
     engine.launch_workers(crawler.worker_routine, shared_argv, private_args)
-    engine.enqueue_tasks(tasks)
+    # ledger tasks were filtered by the run that built them
+    if crawler.task_filter is not None and crawler.build_tasks:
+        engine.launch_feeders(tasks, crawler.task_filter, count=args.feeders)
+    else:
+        engine.enqueue_tasks(tasks)
+    engine.scheduler.submit(subtasks)
     engine.enqueue_stopwork()
-    engine.launch_saver(save_id, save_dir)
+    engine.launch_savers(save_id, save_dir, count=args.savers,
+                         compression=args.compression,
+                         level=args.compression_level,
+                         frame_documents=args.frame_documents)
 
     while True:
         time.sleep(5)
@@ -9,17 +9,29 @@ import socket
 
 from engine.saver import JsonAggregator
 from engine.command import StopCommand
+from engine.scheduler import Scheduler, Subtask
+from engine.ledger import TaskLedger, get_owner
+from engine.transport import Transport, MANAGER
+from engine.metrics import ThroughputMeter
+from engine.pipeline import ParseSink, PARSE_QUEUE_FACTOR, PARSE_REPORT_INTERVAL
 from util.logger import setup_logger
 from util.customexception import *
+from util.connection import CONNECTION_POOL
+from util.ratelimit import RATE_CONTROLLER
 from util.slack import send_slack_message
 
 DATA_BASE = "data"
+CRITICAL_ERRORS = (TooManyRequestsError, NoResponseError)
+SAVE_BATCH_SIZE = 256
+SAVE_TIMEOUT = 1.0
+SAVE_REPORT_INTERVAL = 60
+SUBTASK_POLL_INTERVAL = 1.0
+RESTART_DELAY = 30
 
 
-def set_queues_to_argv(private):
-    m = mp.Manager()
-    control_queue = m.Queue()
-    exception_queue = m.Queue()
+def set_queues_to_argv(private, transport: Transport):
+    control_queue = transport.make_queue()
+    exception_queue = transport.make_queue()
     private["control_queue"] = control_queue
     private["exception_queue"] = exception_queue
     return control_queue, exception_queue
@@ -65,11 +77,21 @@ class Engine:
 
     queue = None  # type: mp.Queue
     save_queue = None  # type: mp.Queue
+    parse_queue = None  # type: mp.Queue
+    transport = None  # type: Transport
+    scheduler = None  # type: Scheduler
+    ledger = None  # type: TaskLedger
 
     logger = None  # type: Logger
 
     workers = []  # type: List[Worker]
-    saver = None  # type: mp.Process
+    savers = []  # type: List[mp.Process]
+    parsers = []  # type: List[mp.Process]
+    feeders = []  # type: List[mp.Process]
+    stop_after_feed = False
+    saver_stop_sent = False
+    parser_stop_sent = False
+    worker_stop_sent = False
 
     task_name = "Engine"  # type: str
     task_function = None  # type: callable
@@ -79,49 +101,158 @@ class Engine:
     rank = "Master"
     worker_count = 0
 
-    def __init__(self, use_saver=False, task_name="Engine"):
+    save_batch_size = SAVE_BATCH_SIZE  # type: int
+    save_timeout = SAVE_TIMEOUT  # type: float
+    restart_delay = RESTART_DELAY  # type: float
+
+    def __init__(self, use_saver=False, task_name="Engine", transport=MANAGER,
+                 ledger: TaskLedger = None):
+        """With a ledger, workers record every task and sub-task they take
+        as leased, then done or failed"""
         self.task_name = task_name
-        m = mp.Manager()
-        self.queue = m.Queue()
-        # self.queue = mp.Queue()
+        self.transport = Transport(transport)
+        self.workers = []
+        self.savers = []
+        self.parsers = []
+        self.feeders = []
+        self.queue = self.transport.make_queue()
+        self.scheduler = Scheduler(self.transport)
+        self.ledger = ledger
+        self.scheduler.ledger = ledger
         if use_saver:
-            # self.save_queue = mp.Queue()
-            self.save_queue = m.Queue()
+            self.save_queue = self.transport.make_queue()
         self.logger = setup_logger(self.task_name)
 
-    def saver_wrapper(self, saver_id, save_dir):
-        """Wrapper function for saver processes"""
+    def saver_wrapper(self, saver_id, save_dir, aggregator_options=None):
+        """Wrapper function for saver processes.
+        Blocks on the save queue, then drains up to save_batch_size documents
+        and hands them to the aggregator as one write.
+        Buffered frames are flushed whenever the queue goes idle."""
         self.logger = setup_logger(saver_id)
-        aggregator = JsonAggregator(save_dir, saver_id, self.logger)
-        while True:
-            if self.save_queue.empty():
-                time.sleep(0.5)
+        aggregator = JsonAggregator(save_dir, saver_id, self.logger,
+                                    **(aggregator_options or {}))
+        meter = ThroughputMeter(saver_id, self.logger,
+                                interval=SAVE_REPORT_INTERVAL)
+        stop = False
+        while not stop:
+            try:
+                task = self.save_queue.get(timeout=self.save_timeout)
+            except queue.Empty:
+                try:
+                    aggregator.flush()
+                except Exception as e:
+                    self.logger.error(f"Exception occured while flushing: {e}")
+                    self.logger.exception(e)
+                if meter.due():
+                    meter.report(self.save_queue)
                 continue
-            task = self.save_queue.get()
-            if isinstance(task, StopCommand):
-                self.logger.warning("Received stop command")
-                break
+
+            batch = []
+            while True:
+                if isinstance(task, StopCommand):
+                    self.logger.warning("Received stop command")
+                    stop = True
+                    break
+                batch.append(task)
+                if len(batch) >= self.save_batch_size:
+                    break
+                try:
+                    task = self.save_queue.get_nowait()
+                except queue.Empty:
+                    break
+
             try:
-                aggregator.write(task)
+                aggregator.write_batch(batch)
             except Exception as e:
                 self.logger.error(f"Exception occured while saving: {e}")
                 self.logger.exception(e)
-
-    def launch_saver(self, saver_id, save_dir):
+            meter.update(len(batch))
+            if meter.due():
+                meter.report(self.save_queue)
+        aggregator.close()
+        meter.report(self.save_queue)
+
+    def launch_saver(self, saver_id, save_dir, **aggregator_options):
+        """aggregator_options are passed to JsonAggregator,
+        e.g. compression="zstd", level=3, frame_documents=1000"""
         saver = mp.Process(target=self.saver_wrapper,
-                           args=(saver_id, save_dir))
-        self.saver = saver
+                           args=(saver_id, save_dir, aggregator_options))
+        self.savers.append(saver)
         saver.start()
 
+    def launch_savers(self, save_id, save_dir, count=1, **aggregator_options):
+        """Launches count saver processes sharing the save queue.
+        With more than one saver, saver k writes {save_id}-{k}_{nnnnn}.jsonl"""
+        if count == 1:
+            self.launch_saver(save_id, save_dir, **aggregator_options)
+            return
+        for k in range(count):
+            self.launch_saver(f"{save_id}-{k}", save_dir, **aggregator_options)
+
+    def parser_wrapper(self, parser_id):
+        """Wrapper function for parser processes.
+        Runs the parse jobs of the workers and puts the documents they
+        return on the save queue"""
+        self.logger = setup_logger(parser_id)
+        meter = ThroughputMeter(parser_id, self.logger,
+                                interval=PARSE_REPORT_INTERVAL)
+        while True:
+            try:
+                job = self.parse_queue.get(timeout=self.save_timeout)
+            except queue.Empty:
+                if meter.due():
+                    meter.report(self.parse_queue)
+                continue
+            if isinstance(job, StopCommand):
+                self.logger.warning("Received stop command")
+                break
+
+            try:
+                document = job.run(self.logger)
+            except Exception as e:
+                self.logger.error(f"Exception occured while running {job}: {e}")
+                self.logger.exception(e)
+                document = None
+            if document is not None:
+                self.save_queue.put(document)
+            meter.update()
+            if meter.due():
+                meter.report(self.parse_queue)
+        meter.report(self.parse_queue)
+
+    def launch_parsers(self, count, maxsize=None):
+        """Launches count parser processes between the workers and the savers.
+        Must be called before launch_workers. The parse queue holds maxsize
+        jobs, count * PARSE_QUEUE_FACTOR by default"""
+        if self.save_queue is None:
+            raise ValueError("Parsers need an engine with use_saver=True")
+        if maxsize is None:
+            maxsize = count * PARSE_QUEUE_FACTOR
+        self.parse_queue = self.transport.make_queue(maxsize=maxsize)
+        for k in range(count):
+            parser = mp.Process(target=self.parser_wrapper,
+                                args=(f"{self.task_name}-parser{k}",))
+            self.parsers.append(parser)
+            parser.start()
+
     def worker_wrapper(
         self,
         task_function: callable,
         shared_argv: Dict[str, Any],
         private_argv: Dict[str, Any],
     ):
-        """Wrapper function for worker processes"""
+        """Wrapper function for worker processes.
+        Sub-tasks split off by any worker are taken before new tasks.
+        After a stop command, the worker keeps taking sub-tasks until no
+        task or sub-task is left in the engine"""
         self.logger = setup_logger(private_argv["ip"])
         wq, sq, cq, eq = get_wq_sq_cq_eq(shared_argv, private_argv)
+        if self.parse_queue is not None:
+            # task functions hand raw pages to the parsers through sq
+            sq = ParseSink(self.parse_queue, sq, private_argv["ip"], self.logger)
+        scheduler = shared_argv.get("scheduler")  # type: Scheduler
+        holding = private_argv.get("holding")
+        stopping = False
         try:
             while True:
                 # if there is a command in the control queue, process it
@@ -131,22 +262,83 @@ class Engine:
                         break
                     else:
                         raise ValueError(f"Unknown command {command}")
+                # process sub-tasks first
+                subtask = None
+                if scheduler is not None:
+                    timeout = SUBTASK_POLL_INTERVAL if stopping else None
+                    subtask = scheduler.get(timeout=timeout)
+                if subtask is not None:
+                    self.run_subtask(subtask, scheduler, shared_argv,
+                                     private_argv, sq)
+                    continue
+                if stopping:
+                    if scheduler is None or scheduler.idle():
+                        break
+                    continue
+
                 # process task
                 task = wq.get()
                 if isinstance(task, StopCommand):
                     self.logger.warning("Received stop command")
-                    break
-
-                task_function(
-                    task,
-                    shared_argv,
-                    private_argv,
-                    self.logger,
-                    save_queue=sq,
-                )
+                    stopping = True
+                    continue
+
+                if scheduler is not None:
+                    scheduler.take(holding)
+                try:
+                    self.run_recorded(
+                        task,
+                        task_function,
+                        task,
+                        shared_argv,
+                        private_argv,
+                        self.logger,
+                        save_queue=sq,
+                    )
+                finally:
+                    if scheduler is not None:
+                        scheduler.end_task(holding)
+                CONNECTION_POOL.report(self.logger)
+                RATE_CONTROLLER.report(self.logger)
         except Exception as e:
             eq.put(e)
             raise e
+        finally:
+            CONNECTION_POOL.report(self.logger, force=True)
+            CONNECTION_POOL.close_all()
+            RATE_CONTROLLER.report(self.logger, force=True)
+            RATE_CONTROLLER.save()
+
+    def run_subtask(self, subtask: Subtask, scheduler: Scheduler,
+                    shared_argv, private_argv, save_queue):
+        self.logger.info("Taking %s (%d active, ~%d requests left)", subtask,
+                         scheduler.active.value, scheduler.remaining_requests())
+        holding = private_argv.get("holding")
+        scheduler.start(subtask, holding)
+        try:
+            self.run_recorded(subtask, subtask.run, shared_argv, private_argv,
+                              self.logger, save_queue=save_queue)
+        finally:
+            scheduler.finish(subtask, holding)
+        CONNECTION_POOL.report(self.logger)
+        RATE_CONTROLLER.report(self.logger)
+
+    def run_recorded(self, task, function, *args, **kwargs):
+        """Calls function, recording task in the ledger if there is one"""
+        if self.ledger is None:
+            return function(*args, **kwargs)
+        self.ledger.lease(task)
+        try:
+            result = function(*args, **kwargs)
+        except CRITICAL_ERRORS as e:
+            # the engine stops on these, the task itself did not fail
+            self.ledger.release(task)
+            raise e
+        except Exception as e:
+            self.ledger.fail(task, e)
+            raise e
+        self.ledger.done(task)
+        return result
 
     def launch_workers(
         self,
@@ -161,6 +353,7 @@ class Engine:
         self.worker_count = len(private_argv)
 
         shared_argv["queue"] = self.queue
+        shared_argv["scheduler"] = self.scheduler
         if self.save_queue is not None:
             shared_argv["save_queue"] = self.save_queue
         else:
@@ -168,7 +361,8 @@ class Engine:
 
         for i, argv in enumerate(private_argv):
             argv["rank"] = i
-            set_queues_to_argv(argv)
+            argv["holding"] = self.scheduler.make_holding()
+            set_queues_to_argv(argv, self.transport)
             worker_process = mp.Process(
                 target=self.worker_wrapper, args=(
                     task_function, shared_argv, argv)
@@ -178,11 +372,58 @@ class Engine:
             worker = Worker(shared_argv, argv, worker_process)
             self.workers.append(worker)
 
+    def feeder_wrapper(self, feeder_id, tasks, task_filter):
+        """Wrapper function for feeder processes.
+        Queues the tasks task_filter keeps, one at a time as they pass"""
+        self.logger = setup_logger(feeder_id)
+        begin = time.time()
+        queued = 0
+        for task in tasks:
+            if not task_filter(task):
+                if self.ledger is not None:
+                    self.ledger.done(task)
+                continue
+            self.enqueue_task(task)
+            queued += 1
+            if queued == 1:
+                self.logger.info("Queued the first task after %.2fs",
+                                 time.time() - begin)
+        self.logger.info("Queued %d of %d tasks in %.1fs", queued, len(tasks),
+                         time.time() - begin)
+
+    def launch_feeders(self, tasks, task_filter, count=None):
+        """Queues the tasks task_filter keeps from count feeder processes
+        (one per CPU by default), so workers start on the first tasks while
+        the rest are filtered. Feeder k takes every count-th task from the
+        k-th, so tasks are still queued roughly in order. Tasks skipped are
+        done in the ledger. Stop commands of enqueue_stopwork follow the
+        last task"""
+        if count is None:
+            count = mp.cpu_count()
+        count = max(1, min(count, len(tasks)))
+        for k in range(count):
+            feeder = mp.Process(target=self.feeder_wrapper,
+                                args=(f"{self.task_name}-feeder{k}",
+                                      tasks[k::count], task_filter))
+            self.feeders.append(feeder)
+            feeder.start()
+
     def poll_routine(self):
         """Checks if there are any exceptions in the exception queue"""
-        __CRITICALS = (TooManyRequestsError, NoResponseError)
+        __CRITICALS = CRITICAL_ERRORS
         stop_engine = False
 
+        # stop commands are queued once the feeders queued their tasks
+        for feeder in list(self.feeders):
+            if feeder.is_alive():
+                continue
+            feeder.join()
+            if feeder.exitcode != 0:
+                self.logger.error("Feeder exited with %s", feeder.exitcode)
+            self.feeders.remove(feeder)
+            if not self.feeders and self.stop_after_feed:
+                self.enqueue_stopwork()
+
         # 1st stage: check if there are any exceptions
         for worker in self.workers:
             eq = worker.exception_queue  # type: mp.Queue
@@ -209,32 +450,44 @@ class Engine:
                 if process.is_alive():
                     process.terminate()
                 process.join(timeout=1)
+                self.release_worker(worker)
 
                 del worker.exception_queue
                 del worker.control_queue
 
                 private_argv = worker.private_argv
-                cq, eq = set_queues_to_argv(private_argv)
+                cq, eq = set_queues_to_argv(private_argv, self.transport)
                 process = mp.Process(
                     target=self.worker_wrapper,
                     args=(self.task_function, self.shared_argv, private_argv),
                 )
                 process.start()
                 worker.set_restart_info(process, cq, eq)
-                time.sleep(30)
-
-        # 2nd stage: check if there are any remaining tasks
+                if self.worker_stop_sent:
+                    # the dead worker may have consumed its stop command
+                    self.queue.put(StopCommand())
+                time.sleep(self.restart_delay)
+
+        # keep the ledger leases of live workers from expiring
+        if self.ledger is not None:
+            self.ledger.renew(get_owner(worker.process.pid)
+                              for worker in self.workers
+                              if worker.process.is_alive())
+
+        # 2nd stage: check if there are any remaining tasks. Sub-tasks are
+        # left out, the queue size still counts those a killed worker lost
         remaining_tasks = self.queue.qsize()
-        if remaining_tasks > self.worker_count:
+        if self.feeders or remaining_tasks > self.worker_count:
             stop_engine = False
             return stop_engine
 
         # 3rd stage: check if there are any alive workers
         any_alive = False
-        for worker in self.workers:
+        for worker in list(self.workers):
             process = worker.process
             if not process.is_alive():
                 process.join(timeout=0.1)
+                self.release_worker(worker)
                 self.workers.remove(worker)
             else:
                 any_alive = True
@@ -243,34 +496,82 @@ class Engine:
             return stop_engine
 
         # 4th stage: Now all workers are dead
-        # Saver process may quit after all tasks are done
-        if self.saver is None:
+        # Parsers run the queued parse jobs first, then savers save what they put
+        if self.parsers:
+            self.stop_parsers()
+            for parser in list(self.parsers):
+                parser.join(timeout=1)
+                if not parser.is_alive():
+                    self.parsers.remove(parser)
+            if self.parsers:
+                stop_engine = False
+                return stop_engine
+
+        # Savers drain the save queue and quit when each receives a stop command
+        if not self.savers:
             stop_engine = True
             return stop_engine
 
-        self.save_queue.put(StopCommand())
-
-        self.saver.join(timeout=1)
-        if not self.saver.is_alive():
-            self.saver = None
+        self.stop_savers()
+        for saver in list(self.savers):
+            saver.join(timeout=1)
+            if not saver.is_alive():
+                self.savers.remove(saver)
+        if self.savers:
             stop_engine = False
             return stop_engine
 
         stop_engine = True
         return stop_engine
 
+    def release_worker(self, worker: Worker):
+        """Ends the tasks and sub-tasks a dead worker was running, so the
+        workers waiting for the scheduler to go idle can stop"""
+        holding = worker.private_argv.get("holding")
+        if holding is None or worker.process.is_alive():
+            return
+        released = self.scheduler.release(holding)
+        if released:
+            self.logger.warning("Worker %s died running %d tasks and sub-tasks",
+                                worker.private_argv["ip"], released)
+
     def stop_allworkers(self):
+        for feeder in self.feeders:
+            feeder.terminate()
         for worker in self.workers:
             worker.control_queue.put(StopCommand())
-        self.save_queue.put(StopCommand())
+        self.stop_parsers()
+        self.stop_savers()
+
+    def stop_parsers(self):
+        """Sends one stop command per parser, queued after the pending jobs"""
+        if self.parser_stop_sent or self.parse_queue is None:
+            return
+        for _ in self.parsers:
+            self.parse_queue.put(StopCommand())
+        self.parser_stop_sent = True
+
+    def stop_savers(self):
+        """Sends one stop command per saver. Each saver consumes exactly one,
+        so every shard drains the documents queued before it and closes its file"""
+        if self.saver_stop_sent or self.save_queue is None:
+            return
+        for _ in self.savers:
+            self.save_queue.put(StopCommand())
+        self.saver_stop_sent = True
 
     def enqueue_stopwork(self):
+        if self.feeders:
+            self.stop_after_feed = True
+            return
         for _ in self.workers:
             self.queue.put(StopCommand())
+        self.worker_stop_sent = True
 
     def enqueue_task(self, task):
+        self.scheduler.add_tasks(1)
         self.queue.put(task)
 
     def enqueue_tasks(self, tasks):
         for task in tasks:
-            self.queue.put(task)
+            self.enqueue_task(task)
@@ -0,0 +1,180 @@
+"""Persistent task ledger so an interrupted run resumes where it stopped.
+
+Every task and sub-task of a run is a row keyed by task_key(). A row is
+pending until a worker leases it, then done or failed. Leases carry the
+owner (host:pid) and an expiry that the engine renews while the owner is
+alive. On restart, leases of dead owners or expired leases go back to
+pending, and only pending rows are queued, so the crawler does not rescan
+its caches to rebuild the task list.
+"""
+import os
+import time
+import pickle
+import socket
+from typing import Any, Dict, Iterable, List, Optional
+
+from util.sqlitedb import SqliteStore
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+STATES = [PENDING, LEASED, DONE, FAILED]
+
+TASK = "task"
+SUBTASK = "subtask"
+
+LEASE_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    state TEXT NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, kind);
+"""
+
+
+def task_key(task: Any) -> str:
+    """Stable key of a task: strings as is, tuples joined by "/",
+    sub-tasks by function name and payload, anything else by str()"""
+    if isinstance(task, str):
+        return task
+    if isinstance(task, tuple):
+        return "/".join(str(item) for item in task)
+    function = getattr(task, "function", None)
+    if function is not None and hasattr(task, "payload"):
+        return f"{function.__name__}:{task_key(task.payload)}"
+    return str(task)
+
+
+def get_owner(pid: Optional[int] = None) -> str:
+    return f"{socket.gethostname()}:{os.getpid() if pid is None else pid}"
+
+
+def owner_alive(owner: str) -> bool:
+    """Only owners on this host can be checked. Others are assumed alive
+    until their lease expires"""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+class TaskLedger(SqliteStore):
+    SCHEMA = SCHEMA
+    lease_seconds = LEASE_SECONDS  # type: float
+
+    def __init__(self, path: str, lease_seconds: float = LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        super(TaskLedger, self).__init__(path)
+
+    def add(self, tasks: Iterable[Any], kind: str = TASK, reset: bool = False) -> int:
+        """Records new tasks as pending. Known keys keep their state,
+        unless reset is set: then done and failed ones become pending again"""
+        now = time.time()
+        rows = [(task_key(task), kind, pickle.dumps(task), PENDING, now)
+                for task in tasks]
+        query = ("INSERT INTO tasks (key, kind, payload, state, updated) "
+                 "VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO ")
+        if reset:
+            query += ("UPDATE SET payload = excluded.payload, state = excluded.state, "
+                      f"updated = excluded.updated WHERE state != '{LEASED}'")
+        else:
+            query += "NOTHING"
+        with self.connection:
+            cursor = self.connection.executemany(query, rows)
+        return cursor.rowcount
+
+    def pending(self, kind: str = TASK) -> List[Any]:
+        rows = self.connection.execute(
+            "SELECT payload FROM tasks WHERE state = ? AND kind = ? ORDER BY rowid",
+            (PENDING, kind))
+        return [pickle.loads(payload) for payload, in rows]
+
+    def counts(self, kind: Optional[str] = None) -> Dict[str, int]:
+        query = "SELECT state, COUNT(*) FROM tasks"
+        params = ()
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        counts = {state: 0 for state in STATES}
+        counts.update(self.connection.execute(query + " GROUP BY state", params))
+        return counts
+
+    def failures(self) -> List[tuple]:
+        return self.connection.execute(
+            "SELECT key, attempts, error FROM tasks WHERE state = ? ORDER BY rowid",
+            (FAILED,)).fetchall()
+
+    def lease(self, task: Any):
+        """Marks a task as taken by this process"""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE tasks SET state = ?, owner = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated = ? WHERE key = ?",
+                (LEASED, get_owner(), time.time() + self.lease_seconds,
+                 time.time(), task_key(task)))
+
+    def release(self, task: Any):
+        """Returns a task to pending, e.g. when the engine stops mid-task"""
+        self._finish(task, PENDING, None)
+
+    def done(self, task: Any):
+        self._finish(task, DONE, None)
+
+    def fail(self, task: Any, error: Any):
+        self._finish(task, FAILED, repr(error))
+
+    def _finish(self, task, state, error):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, lease_until = NULL, "
+                "error = ?, updated = ? WHERE key = ?",
+                (state, error, time.time(), task_key(task)))
+
+    def renew(self, owners: Iterable[str]) -> int:
+        """Extends the leases held by owners, e.g. the engine's live workers"""
+        owners = list(owners)
+        if not owners:
+            return 0
+        marks = ",".join("?" * len(owners))
+        with self.connection:
+            cursor = self.connection.execute(
+                f"UPDATE tasks SET lease_until = ? WHERE state = ? AND owner IN ({marks})",
+                (time.time() + self.lease_seconds, LEASED, *owners))
+        return cursor.rowcount
+
+    def reclaim(self) -> int:
+        """Returns expired leases and leases of dead owners to pending"""
+        rows = self.connection.execute(
+            "SELECT key, owner, lease_until FROM tasks WHERE state = ?", (LEASED,))
+        now = time.time()
+        keys = [key for key, owner, lease_until in rows
+                if (lease_until or 0) < now or not owner_alive(owner or "")]
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE tasks SET state = ?, owner = NULL, lease_until = NULL "
+                "WHERE key = ?", [(PENDING, key) for key in keys])
+        return len(keys)
+
+    def retry_failed(self, pattern: str = "*") -> int:
+        """Returns failed tasks whose key matches the glob pattern to pending"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE tasks SET state = ?, updated = ? WHERE state = ? AND key GLOB ?",
+                (PENDING, time.time(), FAILED, pattern))
+        return cursor.rowcount
@@ -0,0 +1,53 @@
+"""Lightweight throughput accounting for engine stages"""
+
+import time
+from logging import Logger
+
+
+class ThroughputMeter:
+    """Counts processed items and periodically logs items/sec and queue depth"""
+
+    name = None  # type: str
+    logger = None  # type: Logger
+    interval = 60  # type: float
+    total = 0  # type: int
+    window_count = 0  # type: int
+    window_start = 0  # type: float
+    started = 0  # type: float
+
+    def __init__(self, name: str, logger: Logger, interval: float = 60):
+        self.name = name
+        self.logger = logger
+        self.interval = interval
+        self.total = 0
+        self.window_count = 0
+        self.started = time.time()
+        self.window_start = self.started
+
+    def update(self, count: int = 1):
+        self.total += count
+        self.window_count += count
+
+    def due(self) -> bool:
+        return time.time() - self.window_start >= self.interval
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.time() - self.window_start
+        if elapsed <= 0:
+            return 0.0
+        return self.window_count / elapsed
+
+    def report(self, queue=None):
+        """Logs the rate over the current window and starts a new one"""
+        depth = "n/a"
+        if queue is not None:
+            try:
+                depth = queue.qsize()
+            except (NotImplementedError, OSError):
+                pass
+        msg = f"{self.name}: {self.rate:.1f} items/s, total {self.total}, queue depth {depth}"
+        self.logger.info(msg)
+        self.window_count = 0
+        self.window_start = time.time()
+        return msg
@@ -0,0 +1,85 @@
+"""Parse stage between the fetch workers and the savers.
+
+Without parsers, workers parse what they fetch before the next request, so
+the politeness interval of their ip passes while they use the CPU. With
+Engine.launch_parsers(count), workers hand raw pages to parser processes
+through a bounded parse queue instead:
+
+    workers --ParseJob--> parse queue --> parsers --document--> save queue --> savers
+
+A full parse queue blocks the worker handing in a page, so fetching slows
+down to what the parsers keep up with. Workers and parsers log their rate
+and the parse queue depth like the savers do.
+
+Task functions call submit_parse(save_queue, logger, function, *args), which
+parses in place when the engine runs no parsers.
+"""
+
+import queue
+from logging import Logger
+from typing import Any, Callable, Dict, Tuple
+
+from engine.metrics import ThroughputMeter
+
+# parse queue slots per parser
+PARSE_QUEUE_FACTOR = 4
+PARSE_REPORT_INTERVAL = 60
+
+
+class ParseJob:
+    """function(*args, logger=logger, **kwargs) run in a parser process.
+    function must be importable at module level and return the document
+    to save, or None"""
+
+    function = None  # type: Callable
+    args = None  # type: Tuple[Any, ...]
+    kwargs = None  # type: Dict[str, Any]
+
+    def __init__(self, function: Callable, args: Tuple[Any, ...], kwargs: Dict[str, Any]):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self, logger: Logger):
+        return self.function(*self.args, logger=logger, **self.kwargs)
+
+    def __str__(self):
+        return f"ParseJob({self.function.__name__})"
+
+
+class ParseSink:
+    """Handed to task functions as their save_queue when the engine runs
+    parsers. put() still saves a finished document directly"""
+
+    parse_queue = None  # type: queue.Queue
+    save_queue = None  # type: queue.Queue
+    meter = None  # type: ThroughputMeter
+
+    def __init__(self, parse_queue, save_queue, name: str, logger: Logger):
+        self.parse_queue = parse_queue
+        self.save_queue = save_queue
+        self.meter = ThroughputMeter(f"{name} -> parsers", logger,
+                                     interval=PARSE_REPORT_INTERVAL)
+
+    def put(self, document):
+        self.save_queue.put(document)
+
+    def parse(self, function: Callable, *args, **kwargs):
+        # blocks while the parse queue is full
+        self.parse_queue.put(ParseJob(function, args, kwargs))
+        self.meter.update()
+        if self.meter.due():
+            self.meter.report(self.parse_queue)
+
+
+def submit_parse(save_queue, logger: Logger, function: Callable, *args, **kwargs):
+    """Saves function(*args, logger=logger, **kwargs), computed by a parser
+    process if the engine runs them, or here otherwise"""
+    if save_queue is None:
+        return
+    if isinstance(save_queue, ParseSink):
+        save_queue.parse(function, *args, **kwargs)
+        return
+    document = function(*args, logger=logger, **kwargs)
+    if document is not None:
+        save_queue.put(document)
@@ -1,86 +1,216 @@
 import os
+import json
 import os.path as osp
 
 from logging import Logger
 
+from util import compression as codec
+from util.sanitize import encode_utf8
+
+# criteria for rotation: 1GiB of bytes written to the file
+MAX_FILE_BYTES = 1024 * 1024 * 1024
+# a frame is closed after this many documents or raw bytes, whichever first
+FRAME_DOCUMENTS = 1000
+FRAME_RAW_BYTES = 8 * 1024 * 1024
+
+MANIFEST_SUFFIX = ".manifest"
+
+
+def read_manifest(path: str):
+    """Returns the frame entries of a shard manifest, oldest first"""
+    entries = []
+    if not osp.exists(path):
+        return entries
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def read_frame(save_filename: str, entry, compression: str):
+    """Reads the documents of one manifest entry without touching the rest of the shard"""
+    with open(save_filename, "rb") as f:
+        f.seek(entry["offset"])
+        data = f.read(entry["length"])
+    return codec.decompress(data, compression).decode("utf-8").splitlines()
+
 
 class JsonAggregator:
+    """Writes documents to rotating {save_id}_{nnnnn}.jsonl[.gz|.zst] shards.
+
+    Documents are buffered and written as frames of up to frame_documents
+    lines. Each frame is a self-contained gzip member / zstd frame, so a
+    shard decompresses as one stream and any frame can be read on its own
+    from the byte range recorded in {shard}.manifest.
+    """
+
     save_dir = None
     save_filename = None
+    manifest_filename = None
     save_id = None
     document_count_in_file = 0
+    bytes_in_file = 0
+    frame_count_in_file = 0
     file_count_in_dir = 0
     file_io = None
+    manifest_io = None
     logger = None
 
-    def __init__(self, save_dir: str, save_id: str, logger: Logger):
+    compression = codec.NONE  # type: str
+    level = None  # type: int
+    frame_documents = FRAME_DOCUMENTS  # type: int
+    max_file_bytes = MAX_FILE_BYTES  # type: int
+
+    frame_lines = []  # type: list
+    frame_raw_bytes = 0
+
+    def __init__(
+        self,
+        save_dir: str,
+        save_id: str,
+        logger: Logger,
+        compression: str = codec.NONE,
+        level: int = None,
+        frame_documents: int = FRAME_DOCUMENTS,
+        max_file_bytes: int = MAX_FILE_BYTES,
+    ):
+        codec.check_compression(compression)
         self.logger = logger
         self.save_dir = save_dir
         self.save_id = save_id
+        self.compression = compression
+        self.level = level
+        self.frame_documents = max(1, frame_documents)
+        self.max_file_bytes = max_file_bytes
+        self.frame_lines = []
+        self.frame_raw_bytes = 0
 
         logger.info("Start JsonAggregator")
 
-        # count jsonl files in the directory
-        jsonl_files = [
+        # count shards of this save_id and compression in the directory.
+        # Several savers may share save_dir, each with its own save_id
+        suffix = self.extension
+        shard_files = [
             f
             for f in os.listdir(save_dir)
-            if osp.isfile(osp.join(save_dir, f)) and f.endswith(".jsonl")
+            if osp.isfile(osp.join(save_dir, f))
+            and f.startswith(f"{save_id}_")
+            and f.endswith(suffix)
         ]
-        self.file_count_in_dir = len(jsonl_files)
+        self.file_count_in_dir = len(shard_files)
         logger.info(f"file_count_in_dir: {self.file_count_in_dir}")
         # if there is no file, create one
         self.__set_save_filename()
-        if self.file_count_in_dir == 0:
-            self.proceed_to_the_next_file()
-        elif self.need_to_proceed_to_the_next_file():
+        if self.file_count_in_dir == 0 or not self.__resume_last_file():
             self.proceed_to_the_next_file()
         msg = f"JsonAggregator: {self.save_filename}"
         logger.info(msg)
 
     def __del__(self):
+        self.close()
+
+    @property
+    def extension(self):
+        return ".jsonl" + codec.EXTENSIONS[self.compression]
+
+    def close(self):
         if self.file_io is not None:
-            self.file_io.close()
+            try:
+                self.flush()
+            finally:
+                self.file_io.close()
+                self.manifest_io.close()
         self.file_io = None
+        self.manifest_io = None
 
     def write(self, document_line, newline=True):
-        def replace_surrogates(s: str, placeholder='�') -> str:
-            return ''.join(c if not (0xD800 <= ord(c) <= 0xDFFF) else placeholder for c in s)
-        if self.file_io is None:
-            self.file_io = open(self.save_filename, "a")
-        try:
-            self.file_io.write(replace_surrogates(document_line))
-        except Exception as e:
-            self.logger.error(f"Error writing to file: {e}")
-        if newline:
-            self.file_io.write("\n")
-        self.document_count_in_file += 1
-        if (
-            self.document_count_in_file % 1000
-            and self.need_to_proceed_to_the_next_file()
-        ):
+        """Writes a single document. newline is kept for compatibility;
+        every document is stored as one line"""
+        self.write_batch([document_line])
+
+    def write_batch(self, document_lines):
+        """Buffers documents and writes every frame that fills up"""
+        for line in document_lines:
+            if not line:
+                continue
+            data = encode_utf8(line) + b"\n"
+            self.frame_lines.append(data)
+            self.frame_raw_bytes += len(data)
+            if (
+                len(self.frame_lines) >= self.frame_documents
+                or self.frame_raw_bytes >= FRAME_RAW_BYTES
+            ):
+                self.flush()
+
+    def flush(self):
+        """Writes buffered documents as one frame and records it in the manifest"""
+        if not self.frame_lines:
+            return
+        raw = b"".join(self.frame_lines)
+        frame = codec.compress(raw, self.compression, self.level)
+        entry = {
+            "frame": self.frame_count_in_file,
+            "offset": self.bytes_in_file,
+            "length": len(frame),
+            "first_document": self.document_count_in_file,
+            "documents": len(self.frame_lines),
+            "raw_bytes": len(raw),
+        }
+        self.file_io.write(frame)
+        self.file_io.flush()
+        self.manifest_io.write(json.dumps(entry) + "\n")
+        self.manifest_io.flush()
+
+        self.bytes_in_file += len(frame)
+        self.document_count_in_file += len(self.frame_lines)
+        self.frame_count_in_file += 1
+        self.frame_lines = []
+        self.frame_raw_bytes = 0
+
+        if self.need_to_proceed_to_the_next_file():
             self.proceed_to_the_next_file()
 
     def proceed_to_the_next_file(self):
         if self.file_io is not None:
             self.file_io.close()
+            self.manifest_io.close()
         self.file_count_in_dir += 1
 
         self.__set_save_filename()
         msg = f"save_filename: {self.save_filename}"
         self.logger.info(msg)
 
-        self.file_io = open(self.save_filename, "a")
-        self.document_count_in_file = 0
+        self.__open(0, 0, 0)
         self.logger.info(f"JsonAggregator: {self.save_filename}")
 
     def need_to_proceed_to_the_next_file(self):
-        file_size = osp.getsize(self.save_filename)
+        return self.bytes_in_file >= self.max_file_bytes
+
+    def __resume_last_file(self):
+        """Continues the last shard when its manifest covers the whole file.
+        Shards without a manifest, or with a torn last frame, are left as is"""
+        entries = read_manifest(self.manifest_filename)
+        if not entries or not osp.exists(self.save_filename):
+            return False
+        last = entries[-1]
+        end = last["offset"] + last["length"]
+        if end != osp.getsize(self.save_filename) or end >= self.max_file_bytes:
+            return False
+        self.__open(end, last["first_document"] + last["documents"], len(entries))
+        return True
 
-        # criteria: 1GiB
-        return file_size > 1024 * 1024 * 1024
+    def __open(self, bytes_in_file, document_count, frame_count):
+        self.file_io = open(self.save_filename, "ab")
+        self.manifest_io = open(self.manifest_filename, "a")
+        self.bytes_in_file = bytes_in_file
+        self.document_count_in_file = document_count
+        self.frame_count_in_file = frame_count
 
     def __set_save_filename(self):
         self.save_filename = osp.join(
             self.save_dir,
-            f"{self.save_id}_{str(self.file_count_in_dir).zfill(5)}.jsonl",
+            f"{self.save_id}_{str(self.file_count_in_dir).zfill(5)}{self.extension}",
         )
+        self.manifest_filename = self.save_filename + MANIFEST_SUFFIX
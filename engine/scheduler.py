@@ -0,0 +1,142 @@
+"""Splits tasks into sub-tasks that any worker of the engine can pick up"""
+
+import queue
+import multiprocessing as mp
+from typing import Any, Callable, Iterable, Optional
+
+from engine.transport import Transport
+from engine.ledger import TaskLedger, SUBTASK
+
+# cost assumed for a sub-task whose size is not known yet, e.g. an unseen board
+UNKNOWN_COST = 1000
+
+
+class Subtask:
+    """A unit of work split off a task.
+
+    Runs as function(payload, shared_argv, private_argv, logger, save_queue=...)
+    in whichever worker takes it, so it uses that worker's ip and interval.
+    function must be importable at module level. cost is the estimated
+    number of requests the sub-task needs."""
+
+    function = None  # type: Callable
+    payload = None  # type: Any
+    cost = 0  # type: int
+
+    def __init__(self, function: Callable, payload: Any, cost: int = UNKNOWN_COST):
+        self.function = function
+        self.payload = payload
+        self.cost = int(cost)
+
+    def run(self, shared_argv, private_argv, logger, save_queue=None):
+        return self.function(self.payload, shared_argv, private_argv, logger,
+                             save_queue=save_queue)
+
+    def __str__(self):
+        return f"Subtask({self.payload}, cost={self.cost})"
+
+
+class Scheduler:
+    """Shares sub-tasks between the workers of an engine.
+
+    Workers take queued sub-tasks before new tasks, so a large task split
+    into sub-tasks is worked on by every idle worker. The sub-tasks of one
+    submit() are queued largest estimated cost first, so long ones start
+    early and the run does not end on one long sub-task.
+
+    active counts queued and running tasks, and running sub-tasks. A
+    sub-task counts once a worker takes it: with the native transport the
+    sub-tasks a worker submits are sent by a thread of the queue, and those
+    a killed worker had not sent yet would be counted forever. A worker that
+    received a stop command keeps taking sub-tasks until none is queued and
+    active drops to zero, since a running task may still split off more.
+    budget is the estimated number of requests left in queued and running
+    sub-tasks, which sub-tasks lost that way stay in.
+    Every worker also counts what it has taken in a holding of its own, so
+    the engine can end the tasks of a worker that died without ending them.
+    With a ledger, submitted sub-tasks are recorded so a later run resumes them.
+    """
+
+    queue = None  # type: queue.Queue
+    active = None  # type: mp.Value
+    budget = None  # type: mp.Value
+    ledger = None  # type: Optional[TaskLedger]
+
+    def __init__(self, transport: Transport):
+        self.queue = transport.make_queue()
+        self.active = mp.Value("q", 0)
+        self.budget = mp.Value("q", 0)
+
+    def add(self, count: int, cost: int = 0):
+        if count:
+            with self.active.get_lock():
+                self.active.value += count
+        if cost:
+            with self.budget.get_lock():
+                self.budget.value += cost
+
+    def add_tasks(self, count: int):
+        """Called by the engine for tasks put on its task queue"""
+        self.add(count)
+
+    def make_holding(self):
+        """Count and cost of the tasks and sub-tasks one worker has taken and
+        not ended. Only that worker writes it while alive, and the engine
+        only after it died, so it has no lock a killed worker could keep"""
+        return mp.Array("q", 2, lock=False)
+
+    def take(self, holding, cost: int = 0):
+        if holding is not None:
+            holding[0] += 1
+            holding[1] += cost
+
+    def drop(self, holding, cost: int = 0):
+        if holding is not None:
+            holding[0] -= 1
+            holding[1] -= cost
+
+    def release(self, holding) -> int:
+        """Ends what a dead worker held, returns how many tasks and sub-tasks"""
+        count, cost = holding[0], holding[1]
+        holding[0] = holding[1] = 0
+        if count:
+            self.add(-count, -cost)
+        return count
+
+    def end_task(self, holding=None):
+        self.drop(holding)
+        self.add(-1)
+
+    def submit(self, subtasks: Iterable[Subtask]) -> int:
+        subtasks = sorted(subtasks, key=lambda subtask: subtask.cost,
+                          reverse=True)
+        if self.ledger is not None:
+            self.ledger.add(subtasks, kind=SUBTASK)
+        self.add(0, sum(subtask.cost for subtask in subtasks))
+        for subtask in subtasks:
+            self.queue.put(subtask)
+        return len(subtasks)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Subtask]:
+        """Returns a queued sub-task or None. Waits up to timeout if given"""
+        try:
+            if timeout is None:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def start(self, subtask: Subtask, holding=None):
+        """Called by the worker that took subtask off the queue"""
+        self.take(holding, subtask.cost)
+        self.add(1)
+
+    def finish(self, subtask: Subtask, holding=None):
+        self.drop(holding, subtask.cost)
+        self.add(-1, -subtask.cost)
+
+    def idle(self) -> bool:
+        return self.active.value <= 0
+
+    def remaining_requests(self) -> int:
+        return self.budget.value
@@ -0,0 +1,34 @@
+"""Queue transports used by the engine to pass tasks and documents between processes"""
+
+import multiprocessing as mp
+
+MANAGER = "manager"
+NATIVE = "native"
+TRANSPORTS = [MANAGER, NATIVE]
+
+
+class Transport:
+    """Creates queues for one of the supported transports.
+
+    manager: queues live in a SyncManager server process. Every put/get is a
+             pickled RPC round-trip to that process.
+    native:  multiprocessing.Queue backed by a pipe and a feeder thread. Items
+             go straight from producer to consumer without a broker process.
+             A process killed while writing to a native queue may leave it
+             unusable, so prefer manager when workers are restarted often.
+    """
+
+    name = None  # type: str
+    manager = None  # type: mp.managers.SyncManager
+
+    def __init__(self, name: str = MANAGER):
+        if name not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {name}. Use one of {TRANSPORTS}")
+        self.name = name
+        if name == MANAGER:
+            self.manager = mp.Manager()
+
+    def make_queue(self, maxsize: int = 0):
+        if self.manager is not None:
+            return self.manager.Queue(maxsize)
+        return mp.Queue(maxsize)
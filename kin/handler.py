@@ -8,6 +8,7 @@ from util.misc import get_interval
 from kin.header import kinheader
 from kin.structs import KinBestDir, KinBestPage, Document, KinUser
 from kin.parser import parse_html
+from engine.pipeline import submit_parse
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -85,10 +86,9 @@ def best_dir_routine(dirId, logger):
             best_page.documents = documents
             best_page.save_to_cache()
         for doc in best_page.documents:
-            if not os.path.exists(doc.save_path):
+            if not doc.is_saved():
                 _, html = get_html(doc.url, kinheader, logger=logger)
-                with open(doc.save_path, "w") as f:
-                    f.write(html)
+                doc.save_html(html)
         best_page.done = True
         best_page.save_to_cache()
     kin_dir.done = True
@@ -110,13 +110,20 @@ def find_user_docs_page(user, dirId, page, logger, year=None, ip=None, interval=
     return documents
 
 
+def parse_document(html, doc, logger=None):
+    parsed = parse_html(html, doc)
+    if parsed is None:
+        return None
+    return parsed.to_json()
+
+
 def process_docs(
     docs, logger, ip=None, interval=1, save_queue=None, ignore_error=False
 ):
     # we track if any document is saved. If no document is processed, we do not need to proceed certain directory.
     cnt = 0
     for doc in docs:
-        if not os.path.exists(doc.save_path):
+        if not doc.is_saved():
             _, html = get_html(
                 doc.url, kinheader, logger=logger, ip=ip, interval=interval
             )
@@ -124,11 +131,8 @@ def process_docs(
                 if ignore_error:
                     continue
                 return
-            with open(doc.save_path, "w") as f:
-                f.write(html)
-            parsed = parse_html(html, doc)
-            if parsed is not None and save_queue is not None:
-                save_queue.put(parsed.to_json())
+            doc.save_html(html)
+            submit_parse(save_queue, logger, parse_document, html, doc)
             cnt += 1
     return cnt
 
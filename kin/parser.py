@@ -1,9 +1,14 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import json
 from io import StringIO
 import re
 import traceback
 
+from util.htmlparse import make_soup
+
+# every field parse_html reads is inside #content
+CONTENT = SoupStrainer(id="content")
+
 
 def remove_duplicate_whitespace(text):
     return re.sub(r"\s+", " ", text).strip()
@@ -95,7 +100,7 @@ def parse_html(html, document):
     # clean html
     try:
         html = remove_comment(html)
-        soup = BeautifulSoup(html, "html.parser")
+        soup = make_soup(html, parse_only=CONTENT)
 
         # badge area
         selector = "#content > div.endContentLeft._endContentLeft > div.contentArea._contentWrap > div.adoptBadgeArea"
@@ -4,6 +4,8 @@ import json
 import datetime
 import time
 
+from util.archive import ARCHIVE_DIR, get_archive, has_archive
+
 
 CACHE_BASE = "cache/kin"
 DATA_BASE = "data/kin"
@@ -51,6 +53,28 @@ class Document:
     def save_path(self):
         return os.path.join(DATA_BASE, str(self.dirId), f"{self.docId}.html")
 
+    @property
+    def archive_dir(self):
+        return os.path.join(DATA_BASE, str(self.dirId), ARCHIVE_DIR)
+
+    def is_saved(self):
+        if has_archive(self.archive_dir) and str(self.docId) in get_archive(self.archive_dir):
+            return True
+        return os.path.exists(self.save_path)
+
+    def save_html(self, html):
+        get_archive(self.archive_dir).put(str(self.docId), html)
+
+    def read_html(self):
+        if has_archive(self.archive_dir):
+            html = get_archive(self.archive_dir).get_text(str(self.docId))
+            if html is not None:
+                return html
+        if os.path.exists(self.save_path):
+            with open(self.save_path, "r") as f:
+                return f.read()
+        return None
+
     @property
     def url(self):
         return f"https://kin.naver.com/qna/detail.naver?dirId={self.dirId}&docId={self.docId}"
@@ -1,9 +1,16 @@
 import yaml
 from logging import Logger
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Optional
 
 
 class Crawler:
+    # False when the tasks come from a ledger: load_configuration may then
+    # skip building the task list, which often scans every cache
+    build_tasks = True  # type: bool
+    # module level function keeping the tasks still to do. When set,
+    # load_configuration returns every candidate task and the engine
+    # filters them in the background while workers start
+    task_filter = None  # type: Optional[Callable[[Any], bool]]
 
     def __init__(self):
         pass
@@ -1,49 +1,106 @@
 import os
 import json
 import re
+import queue
+import threading
 import http.client
 
 import time
 from datetime import datetime, timedelta
+from bs4 import BeautifulSoup
 
 # Replace the import from __utils with imports from util modules
 from util.logger import setup_logger
 from util.connection import get_html, make_https_connection
 from util.fileutil import read_txt
 from util.utils import get_retrieval_date
-from .__utils import update_bloginfo, load_html, scrap_html
+from util.sanitize import remove_surrogates
+from util.archive import ARCHIVE_DIR, Archive, get_archive, has_archive
+from .__utils import load_html, scrap_html
+from .completion import mark_completed
+
+# postlist pages listed ahead of the posts being scrapped
+POSTLIST_QUEUE_PAGES = 4
+
+
+def put_until_stopped(pages, item, stop):
+    """Puts item on the bounded queue unless stop is set while it is full"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def post_text(elements):
+    """Text of the elements with every text node on a line of its own, as
+    prettified pages laid it out, without their indentation. Raw and
+    prettified pages give the same text"""
+    text = "\n".join(element.get_text("\n") for element in elements)
+    return re.sub(r'\s*\n\s*', '\n', text.replace('\u200b', '')).strip()
+
 
 class NaverBlogScrapper():
-    def __init__(self, ip, config):
+    def __init__(self, ip, config, interval=1):
         self.bloglist_path = config["bloglist_path"]
         self.postlist_path = config["postlist_path"]
         self.html_path = config["html_path"]
         self.jsonl_path = config["jsonl_path"]
 
         self.ip = ip
+        # seconds between requests of the ip to a host, see RATE_CONTROLLER
+        self.interval = interval
         self.logger = setup_logger(ip)
     
-    def send_postlist_apicall(self, blogid, page):
-        path = f"/PostTitleListAsync.naver?blogId={blogid}&viewdate=&currentPage={page}&categoryNo=0&parentCategoryNo=&countPerPage=30"
-        save_path = os.path.join(self.html_path, f"{blogid}/postlist_{page}.html")
+    def archive_dir(self, blogid):
+        return os.path.join(self.html_path, blogid, ARCHIVE_DIR)
+
+    def load_page(self, blogid, key, archive=None):
+        """Parses a stored response: from the blog archive, or the prettified
+        html file written by earlier versions"""
+        if archive is None and has_archive(self.archive_dir(blogid)):
+            archive = get_archive(self.archive_dir(blogid))
+        if archive is not None:
+            data = archive.get(key)
+            if data is not None:
+                return BeautifulSoup(data, 'html.parser')
+        save_path = os.path.join(self.html_path, f"{blogid}/{key}.html")
         if os.path.exists(save_path):
             return load_html(save_path)
+        return None
+
+    def load_post(self, blogid, postid):
+        """Post parsed by an earlier attempt, {} if it was empty"""
+        if not has_archive(self.archive_dir(blogid)):
+            return None
+        dumped = get_archive(self.archive_dir(blogid)).get_text(f"{postid}.json")
+        return None if dumped is None else json.loads(dumped)
 
-        conn = http.client.HTTPSConnection("blog.naver.com", 443, source_address=(self.ip, 0))
+    def save_post(self, blogid, postid, js):
+        get_archive(self.archive_dir(blogid)).put(f"{postid}.json", json.dumps(js, ensure_ascii=False))
+
+    def send_postlist_apicall(self, blogid, page, archive):
+        path = f"/PostTitleListAsync.naver?blogId={blogid}&viewdate=&currentPage={page}&categoryNo=0&parentCategoryNo=&countPerPage=30"
+        key = f"postlist_{page}"
+        soup = self.load_page(blogid, key, archive)
+        if soup is not None:
+            return soup
 
-        soup, self.headers = scrap_html(conn, path, self.headers, save_path, self.logger)
-        conn.close()
+        soup, self.list_headers = scrap_html("blog.naver.com", self.ip, path, self.list_headers, archive, key,
+                                             self.logger, self.interval)
         return soup
     
     def get_post_html(self, blogid, postid):
         path = f"/PostView.naver?blogId={blogid}&logNo={postid}"
-        save_path = os.path.join(self.html_path, f"{blogid}/{postid}.html")
-        if os.path.exists(save_path):
-            return load_html(save_path)
+        soup = self.load_page(blogid, postid)
+        if soup is not None:
+            return soup
 
-        conn = http.client.HTTPSConnection("m.blog.naver.com", 443, source_address=(self.ip, 0))
-        soup, self.headers = scrap_html(conn, path, self.headers, save_path, self.logger)
-        conn.close()
+        archive = get_archive(self.archive_dir(blogid))
+        soup, self.post_headers = scrap_html("m.blog.naver.com", self.ip, path, self.post_headers, archive, postid,
+                                             self.logger, self.interval)
         return soup
 
     def handle_api_call(self, soup, retry_cnt, blogid, page, lock):
@@ -61,7 +118,7 @@ class NaverBlogScrapper():
         
         if parsed["resultCode"] == "E":
             self.logger.warning(f"{blogid} Empty")
-            update_bloginfo(None, blogid)
+            mark_completed(blogid)
             return [], 0
         
         return parsed["tagQueryString"].split("&logNo=")[1:], int(parsed["totalCount"]) // 30
@@ -88,16 +145,59 @@ class NaverBlogScrapper():
         return overlays, block_cnt
 
     def get_postlist(self, blogid, lock):
+        """Yields the logNos of a blog. Unless the list is cached, pages are
+        listed by a thread while the caller goes through the posts already
+        listed, at most POSTLIST_QUEUE_PAGES pages ahead of it"""
         save_path = os.path.join(self.postlist_path, f"{blogid}.txt")
+        postlist = None
         if os.path.exists(save_path):
             try:
                 with open(save_path, 'r') as f:
                     postlist = json.load(f)
-                return postlist
-            except:
-                pass
-        
-        self.headers = {
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Listing {blogid} again, cached postlist unreadable: {e}")
+        if postlist is not None:
+            yield from postlist
+            return
+
+        pages = queue.Queue(maxsize=POSTLIST_QUEUE_PAGES)
+        stop = threading.Event()
+        lister = threading.Thread(target=self.list_pages, args=(blogid, lock, pages, stop),
+                                  name=f"postlist-{blogid}", daemon=True)
+        lister.start()
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield from page
+        finally:
+            # the caller may stop early, e.g. on a skipped blog
+            stop.set()
+            lister.join()
+
+    def list_pages(self, blogid, lock, pages, stop):
+        """Puts the logNos of every postlist page on pages, then None, or the
+        exception that stopped the listing. Writes the postlist cache once
+        every page is listed"""
+        # archives are not shared between threads, this one has its own
+        archive = Archive(self.archive_dir(blogid))
+        try:
+            postlist = self.list_postlist(blogid, lock, pages, stop, archive)
+            if postlist:
+                with open(os.path.join(self.postlist_path, f"{blogid}.txt"), 'w') as f:
+                    json.dump(postlist, f)
+            put_until_stopped(pages, None, stop)
+        except Exception as e:
+            put_until_stopped(pages, e, stop)
+        finally:
+            archive.close()
+
+    def list_postlist(self, blogid, lock, pages, stop, archive):
+        """Returns the whole postlist, or None if the listing was stopped"""
+        self.list_headers = {
             "Accept": "*/*",
             "Accept-Encoding": "gzip, deflate, br",
             "Accept-Language": "ko,en-US;q=0.9,en;q=0.8,ja;q=0.7",
@@ -116,40 +216,33 @@ class NaverBlogScrapper():
             "user-agent" : "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
         }
 
-        soup = -998
-        retry_cnt = 0
-
-        while soup == -998 and retry_cnt < 10:
-            soup = self.send_postlist_apicall(blogid, 1)
-            retry_cnt += 1
-        
-        postlist, totalpage = self.handle_api_call(soup, retry_cnt, blogid, 1, lock)
-
-        if not postlist:
-            return postlist
-
-        for i in range(totalpage):
-            time.sleep(1)
-
+        postlist = []
+        page = 1
+        totalpage = 0
+        while page <= totalpage + 1:
             soup = -998
             retry_cnt = 0
             while soup == -998 and retry_cnt < 10:
-                soup = self.send_postlist_apicall(blogid, i + 2)
+                soup = self.send_postlist_apicall(blogid, page, archive)
                 retry_cnt += 1
-            
-            temp, _ = self.handle_api_call(soup, retry_cnt, blogid, i + 2, lock)
+
+            temp, total = self.handle_api_call(soup, retry_cnt, blogid, page, lock)
+            if page == 1:
+                if not temp:
+                    return postlist
+                totalpage = total
             postlist += temp
-        
-        with open(save_path, 'w') as f:
-            json.dump(postlist, f)
-        
+            if not put_until_stopped(pages, temp, stop):
+                return None
+            page += 1
+
         return postlist
 
     def parse_post(self, soup, overlays, uri):
         js = {"uri": uri}
         try:
             contents = soup.select_one(overlays[0])
-            js["title"] = re.sub(r'(\n)+', '\n', contents.text.replace('\u200b', ''))[1:-1].strip()
+            js["title"] = post_text([contents])
 
             contents = soup.select_one(".blog_date, .se_date")
             js["created_date"] = re.sub(r"[\n\t\u200b]", "", contents.text).strip()
@@ -173,7 +266,7 @@ class NaverBlogScrapper():
 
             hashtag = soup.select_one(".post_tag")
             if hashtag:
-                js["hashtag"] = soup.select_one(".post_tag").text[2:-2]
+                js["hashtag"] = " ".join(hashtag.stripped_strings)
             else:
                 js["hashtag"] = ""
             
@@ -185,19 +278,14 @@ class NaverBlogScrapper():
             js["type"] = "naver_blog"
             js["lang"] = "kor"
 
-            contents = soup.select(overlays[1])
-            js["text"] = ""
-            for i in range(len(contents)):
-                js["text"] += contents[i].text
-            
-            js["text"] = re.sub(r'(\n)+', '\n', js["text"].replace('\u200b', ''))[1:]
+            js["text"] = post_text(soup.select(overlays[1]))
 
             if js["text"] == "":
                 self.logger.warning(f"{uri}, Post empty")
                 return {}
 
             for key in js.keys():
-                js[key] = re.sub(r'[\ud800-\udbff\udc00-\udfff]', '', js[key])
+                js[key] = remove_surrogates(js[key])
 
         except Exception as e:
             self.logger.warning(f"Error occured while parsing {uri}, {e} occured")
@@ -205,22 +293,32 @@ class NaverBlogScrapper():
         
         return js
 
-    def scrap_naverblog(self, blogid, lock):
+    def resume_postlist(self, blogid, postlist, resume_after):
+        """Skips the logNos up to resume_after. If it is not listed,
+        e.g. the post was deleted, starts over"""
+        if resume_after is None:
+            yield from postlist
+            return
+        skipped = []
+        for postid in postlist:
+            if skipped is None:
+                yield postid
+            elif postid == resume_after:
+                self.logger.info(f"Resuming {blogid} after {resume_after}, skipped {len(skipped) + 1} posts")
+                skipped = None
+            else:
+                skipped.append(postid)
+        if skipped:
+            self.logger.warning(f"{resume_after} is not listed in {blogid}, starting over")
+            yield from skipped
+
+    def scrap_naverblog(self, blogid, lock, resume_after=None):
+        """Yields the parsed posts of a blog as they are scrapped. With
+        resume_after, a logNo handed out by an earlier attempt, starts after it"""
         start = time.time()
         self.logger.info(f"Scrapping {blogid}")
 
-        self.logger.info("Getting postlist")
-        postlist = self.get_postlist(blogid, lock)
-        if len(postlist) == 0:
-            return []
-        
-        jsonl = []
-        self.logger.info("Scrapping posts")
-
-        if not os.path.exists(os.path.join(self.html_path, f"{blogid}")):
-            os.makedirs(os.path.join(self.html_path, f"{blogid}"))
-
-        self.headers = {
+        self.post_headers = {
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
             "Accept-Encoding": "gzip, deflate, br",
             "Accept-Language": "ko,en-US;q=0.9,en;q=0.8,ja;q=0.7",
@@ -237,50 +335,73 @@ class NaverBlogScrapper():
             "user-agent" : "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
         }
 
+        self.logger.info("Getting postlist")
+        listing = self.get_postlist(blogid, lock)
+        postlist = self.resume_postlist(blogid, listing, resume_after)
+
+        scrapped = 0
+        self.logger.info("Scrapping posts")
+
         cnt = 0
         block_cnt = 0
         empty_post_cnt = 0
 
-        for postid in postlist:
-            if block_cnt > 10:
-                raise Exception(f"{self.ip} Blocked")
-            if cnt % 100 == 99:
-                self.logger.info(f"Progressing... {cnt + 1} / {len(postlist)}")
-            if cnt == 500:
-                if empty_post_cnt / cnt > 0.8:
-                    self.logger.warning(f"Skip {blogid}")
-                    update_bloginfo(None, blogid)
-                    return []
-            time.sleep(1)
-            cnt += 1
-
-            uri = f"m.blog.naver.com/{blogid}/{postid}"
-
-            soup = -998
-            retry_cnt = 0
-
-            while soup == -998 and retry_cnt < 10:
-                soup = self.get_post_html(blogid, postid)
-                retry_cnt += 1
+        try:
+            for postid in postlist:
+                if block_cnt > 10:
+                    raise Exception(f"{self.ip} Blocked")
+                if cnt % 100 == 99:
+                    self.logger.info(f"Progressing... {cnt + 1} posts")
+                if cnt == 500:
+                    if empty_post_cnt / cnt > 0.8:
+                        self.logger.warning(f"Skip {blogid}")
+                        if scrapped == 0 and resume_after is None:
+                            mark_completed(blogid)
+                        return
+                cnt += 1
+
+                uri = f"m.blog.naver.com/{blogid}/{postid}"
+
+                # Parsed by an earlier attempt, neither fetched nor parsed again
+                js = self.load_post(blogid, postid)
+                if js is not None:
+                    if not js:
+                        empty_post_cnt += 1
+                    else:
+                        scrapped += 1
+                        yield js
+                    continue
+
+                soup = -998
+                retry_cnt = 0
+
+                while soup == -998 and retry_cnt < 10:
+                    soup = self.get_post_html(blogid, postid)
+                    retry_cnt += 1
             
-            overlays, block_cnt = self.handle_http_call(soup, retry_cnt, block_cnt, postid)
-            if not overlays:
-                continue
+                overlays, block_cnt = self.handle_http_call(soup, retry_cnt, block_cnt, postid)
+                if not overlays:
+                    continue
             
-            self.headers["Referer"] = f"https://{uri}"
-
-            js = self.parse_post(soup, overlays, uri)
-            if not js:
-                empty_post_cnt += 1
-            else:
-                jsonl.append(js)
-            block_cnt = 0
-        
-        if not jsonl:
+                self.post_headers["Referer"] = f"https://{uri}"
+
+                js = self.parse_post(soup, overlays, uri)
+                self.save_post(blogid, postid, js)
+                block_cnt = 0
+                if not js:
+                    empty_post_cnt += 1
+                else:
+                    scrapped += 1
+                    yield js
+        finally:
+            listing.close()
+
+        if cnt == 0:
+            # nothing listed, or nothing left after resume_after
+            return
+        if scrapped == 0 and resume_after is None:
             self.logger.warning(f"{blogid} empty")
-            update_bloginfo(None, blogid)
-            return []
+            mark_completed(blogid)
+            return
 
         self.logger.info(f"Scrapped {blogid}, took {time.time()-start:.2f} seconds")
-
-        return jsonl
@@ -16,11 +16,14 @@ import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from util.env import get_iplist
-from filelock import FileLock
+from util.connection import CONNECTION_POOL
+from naverblog.frontier import BlogFrontier
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Collect Naver Blog IDs')
     parser.add_argument('--config', type=str, required=True, help='Path to the configuration file')
+    parser.add_argument('--follow', action='store_true',
+                        help='Also visit blogs discovered during this run')
     return parser.parse_args()
 
 def load_config(config_path):
@@ -28,48 +31,6 @@ def load_config(config_path):
         config = yaml.safe_load(f)
     return config
 
-def load_blog_list(path):
-    try:
-        lock_path = path + '.lock'
-        with FileLock(lock_path):
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    return json.load(f)
-            else:
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                return []
-    except Exception as e:
-        print(f"Error loading blog list: {e}")
-        return []
-
-def save_blog_list(blog_list, path):
-    lock_path = path + '.lock'
-    with FileLock(lock_path):
-        with open(path, 'w') as f:
-            json.dump(blog_list, f)
-    print(f"Saved {len(blog_list)} blogs to {path}")
-
-def load_visited_list(path):
-    try:
-        lock_path = path + '.lock'
-        with FileLock(lock_path):
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    return json.load(f)
-            else:
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                return []
-    except Exception as e:
-        print(f"Error loading visited list: {e}")
-        return []
-
-def save_visited_list(visited_list, path):
-    lock_path = path + '.lock'
-    with FileLock(lock_path):
-        with open(path, 'w') as f:
-            json.dump(visited_list, f)
-    print(f"Saved {len(visited_list)} visited blogs to {path}")
-
 def collect_neighbors(blogid, ip, interval=1):
     headers = {
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,/;q=0.8,application/signed-exchange;v=b3;q=0.7",
@@ -90,141 +51,89 @@ def collect_neighbors(blogid, ip, interval=1):
     }
     
     try:
-        conn = None
-        try:
-            conn = http.client.HTTPSConnection("m.blog.naver.com", 443, source_address=(ip, 0))
-            
-            headers["Referer"] = f"https://m.blog.naver.com/{blogid}/"
-            path = f"/BuddyList.naver?blogId={blogid}"
-            conn.request('GET', path, headers=headers)
-            
-            resp = conn.getresponse()
-            
-            if resp.status != 200:
-                print(f"Error status {resp.status} for blog {blogid} using IP {ip}")
-                if resp.status == 429:  # Too many requests
-                    print(f"IP {ip} is rate limited. Waiting longer...")
-                    time.sleep(interval * 5)  # Wait longer for rate limit
-                return []
-                
-            cookie = resp.getheader("Set-Cookie")
-            
-            try:
-                headers["Cookie"] = cookie[:cookie.find(";")] if cookie else ""
-            except:
-                headers["Cookie"] = ""
-                
-            encoding = resp.getheader("Content-Encoding")
+        headers["Referer"] = f"https://m.blog.naver.com/{blogid}/"
+        path = f"/BuddyList.naver?blogId={blogid}"
+        resp, raw = CONNECTION_POOL.request("m.blog.naver.com", path, headers, ip=ip)
+
+        if resp.status != 200:
+            print(f"Error status {resp.status} for blog {blogid} using IP {ip}")
+            if resp.status == 429:  # Too many requests
+                print(f"IP {ip} is rate limited. Waiting longer...")
+                time.sleep(interval * 5)  # Wait longer for rate limit
+            return []
             
-            if encoding == "gzip":
-                data = gzip.decompress(resp.read())
-            else:
-                data = resp.read()
-                
-            soup = BeautifulSoup(data, 'html.parser')
-            nbr_list = [a['href'].split("/")[-1] for a in soup.find_all('a') if 'href' in a.attrs]
+        cookie = resp.getheader("Set-Cookie")
+        
+        try:
+            headers["Cookie"] = cookie[:cookie.find(";")] if cookie else ""
+        except:
+            headers["Cookie"] = ""
             
-            processed_nbr_list = []
-            for nbr in nbr_list:
-                if "PostList.naver?blogId=" in nbr:
-                    match = re.search(r"blogId=([^&]+)", nbr)
-                    if match:
-                        processed_nbr_list.append(match.group(1))
-                elif "naver.com" not in nbr and "PostView.naver" not in nbr and len(nbr) > 0:
-                    processed_nbr_list.append(nbr)
+        encoding = resp.getheader("Content-Encoding")
+        
+        if encoding == "gzip":
+            data = gzip.decompress(raw)
+        else:
+            data = raw
             
-            time.sleep(interval)
-            return processed_nbr_list
-        finally:
-            if conn:
-                conn.close()
+        soup = BeautifulSoup(data, 'html.parser')
+        nbr_list = [a['href'].split("/")[-1] for a in soup.find_all('a') if 'href' in a.attrs]
+        
+        processed_nbr_list = []
+        for nbr in nbr_list:
+            if "PostList.naver?blogId=" in nbr:
+                match = re.search(r"blogId=([^&]+)", nbr)
+                if match:
+                    processed_nbr_list.append(match.group(1))
+            elif "naver.com" not in nbr and "PostView.naver" not in nbr and len(nbr) > 0:
+                processed_nbr_list.append(nbr)
+        
+        time.sleep(interval)
+        return processed_nbr_list
     except Exception as e:
         print(f"Error collecting neighbors for blog {blogid} using IP {ip}: {e}")
         time.sleep(interval)
         return []
 
-def worker(worker_id, blogids, ip, interval, blog_list_path, visited_list_path, save_frequency=100):
-    print(f"Worker {worker_id} starting with IP {ip}, processing {len(blogids)} blogs")
-    
-    all_blogs = load_blog_list(blog_list_path)
-    visited_blogs = load_visited_list(visited_list_path)
-    
-    local_new_blogs = []
-    local_visited_blogs = []
+def worker(worker_id, ip, interval, frontier_path, until=None, batch_size=100):
+    print(f"Worker {worker_id} starting with IP {ip}")
+
+    # Connections must not cross threads, each worker opens its own
+    frontier = BlogFrontier(frontier_path)
     processed_count = 0
     error_count = 0
-    
-    # Filter out already visited blogs
-    blogs_to_process = [blog for blog in blogids if blog not in visited_blogs]
-    print(f"Worker {worker_id}: {len(blogs_to_process)}/{len(blogids)} blogs need processing (others already visited)")
-    
-    for i, blogid in enumerate(blogs_to_process):
-        if i % 10 == 0:
-            print(f"Worker {worker_id}: Processing blog {i+1}/{len(blogs_to_process)}")
-        
-        # Mark this blog as visited
-        local_visited_blogs.append(blogid)
-        
-        # Collect neighbors
-        neighbors = collect_neighbors(blogid, ip, interval)
-        
-        if not neighbors:
-            error_count += 1
-            if error_count > 5:
-                print(f"Worker {worker_id}: Too many consecutive errors, trying longer delay")
-                time.sleep(interval * 10)  # Wait longer after multiple errors
+
+    while True:
+        blogids = frontier.claim(batch_size, until)
+        if not blogids:
+            break
+
+        visited = []
+        found = []
+        for blogid in blogids:
+            # Collect neighbors
+            neighbors = collect_neighbors(blogid, ip, interval)
+            visited.append(blogid)
+
+            if not neighbors:
+                error_count += 1
+                if error_count > 5:
+                    print(f"Worker {worker_id}: Too many consecutive errors, trying longer delay")
+                    time.sleep(interval * 10)  # Wait longer after multiple errors
+                    error_count = 0
+                continue
+            else:
                 error_count = 0
-            continue
-        else:
-            error_count = 0
-            
-        # Add new blogs to the local list
-        new_blogs = [blog for blog in neighbors if blog not in all_blogs and blog not in local_new_blogs]
-        if new_blogs:
-            local_new_blogs.extend(new_blogs)
-            
-        processed_count += 1
-            
-        # Save periodically
-        if processed_count % save_frequency == 0:
-            # Save the blog list - reload first to avoid conflicts with other workers
-            all_blogs = load_blog_list(blog_list_path)
-            really_new_blogs = [blog for blog in local_new_blogs if blog not in all_blogs]
-            if really_new_blogs:
-                all_blogs.extend(really_new_blogs)
-                save_blog_list(all_blogs, blog_list_path)
-                print(f"Worker {worker_id}: Added {len(really_new_blogs)} new blogs")
-                local_new_blogs = []
-            
-            # Save the visited list - reload first to avoid conflicts
-            visited_blogs = load_visited_list(visited_list_path)
-            really_new_visited = [blog for blog in local_visited_blogs if blog not in visited_blogs]
-            if really_new_visited:
-                visited_blogs.extend(really_new_visited)
-                save_visited_list(visited_blogs, visited_list_path)
-                print(f"Worker {worker_id}: Added {len(really_new_visited)} blogs to visited list")
-                local_visited_blogs = []
-            
-            print(f"Worker {worker_id}: Processed {processed_count}/{len(blogs_to_process)}")
-    
-    # Final save for blog list
-    if local_new_blogs:
-        all_blogs = load_blog_list(blog_list_path)
-        really_new_blogs = [blog for blog in local_new_blogs if blog not in all_blogs]
-        if really_new_blogs:
-            all_blogs.extend(really_new_blogs)
-            save_blog_list(all_blogs, blog_list_path)
-            print(f"Worker {worker_id}: Final save - added {len(really_new_blogs)} new blogs")
-    
-    # Final save for visited list
-    if local_visited_blogs:
-        visited_blogs = load_visited_list(visited_list_path)
-        really_new_visited = [blog for blog in local_visited_blogs if blog not in visited_blogs]
-        if really_new_visited:
-            visited_blogs.extend(really_new_visited)
-            save_visited_list(visited_blogs, visited_list_path)
-            print(f"Worker {worker_id}: Final save - added {len(really_new_visited)} blogs to visited list")
-    
+
+            found.extend(neighbors)
+            processed_count += 1
+
+        # Save the batch: visited blogs and their new neighbors together
+        added = frontier.visit(visited, found)
+        print(f"Worker {worker_id}: Visited {len(visited)} blogs, added {added} new blogs "
+              f"(processed {processed_count})")
+
+    frontier.close()
     return processed_count
 
 def main():
@@ -240,6 +149,8 @@ def main():
         os.path.dirname(blog_list_path),
         'visited_bloglist.json'
     )
+    frontier_path = config.get(
+        'frontier_path', os.path.join(os.path.dirname(blog_list_path), 'frontier.db'))
     
     # Ensure paths are absolute
     if not os.path.isabs(blog_list_path):
@@ -247,74 +158,69 @@ def main():
     
     if not os.path.isabs(visited_list_path):
         visited_list_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', visited_list_path)
+
+    if not os.path.isabs(frontier_path):
+        frontier_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', frontier_path)
     
     # Create directories if they don't exist
     os.makedirs(os.path.dirname(blog_list_path), exist_ok=True)
     
-    # Load the blog list and visited list
-    blog_list = load_blog_list(blog_list_path)
-    visited_list = load_visited_list(visited_list_path)
-    
-    print(f"Loaded {len(blog_list)} blogs from {blog_list_path}")
-    print(f"Loaded {len(visited_list)} visited blogs from {visited_list_path}")
+    # Open the frontier, importing the json lists of earlier versions once
+    frontier = BlogFrontier(frontier_path)
+    if frontier.import_lists(blog_list_path, visited_list_path):
+        print(f"Imported {blog_list_path} and {visited_list_path} into {frontier_path}")
+    released = frontier.release()
+    if released:
+        print(f"Released {released} blogs claimed by an earlier run")
+
+    counts = frontier.counts()
+    print(f"Loaded {len(frontier)} blogs from {frontier_path}, {counts['visited']} visited")
     
     # If blog list is empty, add some seed blogs
-    if not blog_list:
+    if len(frontier) == 0:
         print("Empty bloglist. Exiting.")
         return
     
-    # Filter out blogs that have already been visited
-    unvisited_blogs = [blog for blog in blog_list if blog not in visited_list]
-    print(f"Found {len(unvisited_blogs)} unvisited blogs out of {len(blog_list)} total blogs")
-    
-    # Split work among available IPs
     num_ips = len(ips)
     if num_ips == 0:
         print("No IPs available. Exiting.")
         return
+
+    # Without --follow, visit only the blogs found before this run
+    until = None if args.follow else frontier.last_rowid()
+    print(f"Starting collection with {num_ips} IPs, {counts['pending']} unvisited blogs")
     
-    print(f"Starting collection with {num_ips} IPs, processing {len(unvisited_blogs)} unvisited blogs")
-    
-    blogs_per_ip = len(unvisited_blogs) // num_ips
-    remainder = len(unvisited_blogs) % num_ips
-    
-    blog_chunks = []
-    start = 0
-    for i in range(num_ips):
-        chunk_size = blogs_per_ip + (1 if i < remainder else 0)
-        blog_chunks.append(unvisited_blogs[start:start+chunk_size])
-        start += chunk_size
-    
-    # Process blogs using multiple workers (one per IP)
-    with ThreadPoolExecutor(max_workers=num_ips) as executor:
-        futures = []
-        for i, (chunk, ip) in enumerate(zip(blog_chunks, ips)):
-            save_frequency = min(100, max(10, len(chunk) // 10))  # Dynamic save frequency
-            future = executor.submit(
-                worker, 
-                i+1, 
-                chunk, 
-                ip, 
-                interval, 
-                blog_list_path, 
-                visited_list_path,
-                save_frequency
-            )
-            futures.append(future)
-        
-        # Collect results
-        total_processed = 0
-        for future in as_completed(futures):
-            total_processed += future.result()
+    # Process blogs using multiple workers (one per IP), each claiming batches
+    batch_size = config.get('batch_size', 100)
+    try:
+        with ThreadPoolExecutor(max_workers=num_ips) as executor:
+            futures = []
+            for i, ip in enumerate(ips):
+                future = executor.submit(
+                    worker,
+                    i+1,
+                    ip,
+                    interval,
+                    frontier_path,
+                    until,
+                    batch_size
+                )
+                futures.append(future)
+
+            # Collect results
+            total_processed = 0
+            for future in as_completed(futures):
+                total_processed += future.result()
+    finally:
+        # The crawler reads the json list
+        frontier.write_bloglist(blog_list_path)
     
     # Final stats
-    final_blog_list = load_blog_list(blog_list_path)
-    final_visited_list = load_visited_list(visited_list_path)
-    
-    print(f"Finished collection. Total blogs in list: {len(final_blog_list)}")
-    print(f"Total visited blogs: {len(final_visited_list)}")
+    counts = frontier.counts()
+    print(f"Finished collection. Total blogs in list: {len(frontier)}")
+    print(f"Total visited blogs: {counts['visited']}")
     print(f"Processed {total_processed} blogs in this run")
-    print(f"Blogs yet to visit: {len(final_blog_list) - len(final_visited_list)}")
+    print(f"Blogs yet to visit: {counts['pending']}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+"""Completion log of naverblog: one tab separated line per finished blog.
+
+Workers append a line with a single O_APPEND write, so concurrent workers
+need no lock and a blog costs one small write whatever the size of the log.
+Blogs scrapped again append another line, the last one wins. The log is
+compacted to one line per blog before a run, when no worker appends to it.
+"""
+import os
+import csv
+from typing import Dict, Iterator, Optional, Tuple
+
+COMPLETION_LOG = "cache/naverblog/completed.tsv"
+# pandas csv of earlier versions, folded into the log by compact_completion_log
+LEGACY_BLOG_INFO = "cache/naverblog/blog_info.csv"
+
+# last logNo saved of blogs being scrapped, removed once they are completed
+CHECKPOINT_DIR = "cache/naverblog/checkpoint"
+
+# save_path and checkpoint of blogs finished without a post
+NO_POSTS = "-1"
+
+
+def mark_completed(blogid: str, save_path: str = NO_POSTS,
+                   checkpoint: str = NO_POSTS, path: str = COMPLETION_LOG):
+    line = f"{blogid}\t{save_path}\t{checkpoint}\n".encode("utf-8")
+    save_dir = os.path.dirname(path)
+    if save_dir and not os.path.isdir(save_dir):
+        os.makedirs(save_dir, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def read_completion_log(path: str = COMPLETION_LOG) -> Iterator[Tuple[str, str, str]]:
+    """Yields (blogid, save_path, checkpoint) in the order they were
+    appended. A line cut short by a crash is skipped"""
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            entry = line[:-1].split("\t")
+            if len(entry) == 3 and entry[0]:
+                yield entry[0], entry[1], entry[2]
+
+
+def read_legacy_blog_info(path: str = LEGACY_BLOG_INFO) -> Iterator[Tuple[str, str, str]]:
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("blogid"):
+                yield row["blogid"], row.get("save_path", NO_POSTS), row.get("checkpoint", NO_POSTS)
+
+
+def load_completion(path: str = COMPLETION_LOG,
+                    legacy: str = LEGACY_BLOG_INFO) -> Dict[str, Tuple[str, str]]:
+    """Last (save_path, checkpoint) of every completed blog"""
+    entries = {}
+    for source in (read_legacy_blog_info(legacy), read_completion_log(path)):
+        for blogid, save_path, checkpoint in source:
+            entries[blogid] = (save_path, checkpoint)
+    return entries
+
+
+def compact_completion_log(path: str = COMPLETION_LOG,
+                           legacy: str = LEGACY_BLOG_INFO) -> Dict[str, Tuple[str, str]]:
+    """Rewrites the log with the last line of every blog, including the
+    legacy blog_info.csv, which is then renamed to .imported. Must not run
+    while workers append. Returns the entries it wrote"""
+    entries = load_completion(path, legacy)
+    save_dir = os.path.dirname(path)
+    if save_dir and not os.path.isdir(save_dir):
+        os.makedirs(save_dir, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for blogid, (save_path, checkpoint) in entries.items():
+            f.write(f"{blogid}\t{save_path}\t{checkpoint}\n")
+    os.replace(temp_path, path)
+    if os.path.isfile(legacy):
+        os.replace(legacy, legacy + ".imported")
+    return entries
+
+
+def checkpoint_path(blogid: str, checkpoint_dir: str = CHECKPOINT_DIR) -> str:
+    return os.path.join(checkpoint_dir, blogid)
+
+
+def read_checkpoint(blogid: str, checkpoint_dir: str = CHECKPOINT_DIR) -> Optional[str]:
+    """Last logNo of the blog handed to the saver by an earlier attempt"""
+    path = checkpoint_path(blogid, checkpoint_dir)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def write_checkpoint(blogid: str, postid: str, checkpoint_dir: str = CHECKPOINT_DIR):
+    if not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    path = checkpoint_path(blogid, checkpoint_dir)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(postid)
+    os.replace(path + ".tmp", path)
+
+
+def clear_checkpoint(blogid: str, checkpoint_dir: str = CHECKPOINT_DIR):
+    path = checkpoint_path(blogid, checkpoint_dir)
+    if os.path.isfile(path):
+        os.remove(path)
@@ -0,0 +1,119 @@
+"""Crawl frontier of collect_blogs.py: every blog id found so far.
+
+A blog is pending until a worker claims it to collect its neighbors, then
+visited. The blog id is the primary key, so the table is the visited set
+and the deduplicated queue at once: lookups go through the index, and new
+neighbors are inserted with INSERT OR IGNORE in batches, one short write
+transaction per batch, instead of rewriting json lists under a file lock.
+"""
+import os
+import json
+from typing import Dict, Iterable, List, Optional
+
+from util.sqlitedb import SqliteStore
+
+PENDING = "pending"
+CLAIMED = "claimed"
+VISITED = "visited"
+STATES = [PENDING, CLAIMED, VISITED]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blogs (
+    blogid TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blogs_state ON blogs (state);
+"""
+
+
+class BlogFrontier(SqliteStore):
+    """Connections are per process and must not be shared by threads, so
+    every thread opens its own BlogFrontier on the same path"""
+
+    SCHEMA = SCHEMA
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM blogs").fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {state: 0 for state in STATES}
+        counts.update(self.connection.execute(
+            "SELECT state, COUNT(*) FROM blogs GROUP BY state"))
+        return counts
+
+    def last_rowid(self) -> int:
+        return self.connection.execute("SELECT MAX(rowid) FROM blogs").fetchone()[0] or 0
+
+    def add(self, blogids: Iterable[str]) -> int:
+        """Queues blog ids not seen before. Returns how many were new"""
+        with self.connection:
+            cursor = self.connection.executemany(
+                "INSERT OR IGNORE INTO blogs (blogid, state) VALUES (?, ?)",
+                ((blogid, PENDING) for blogid in blogids))
+        return cursor.rowcount
+
+    def claim(self, count: int, until: Optional[int] = None) -> List[str]:
+        """Takes up to count pending blogs in the order they were found,
+        only those found up to rowid until if given"""
+        query = "SELECT blogid FROM blogs WHERE state = ?"
+        params = (PENDING,)
+        if until is not None:
+            query += " AND rowid <= ?"
+            params += (until,)
+        with self.transaction() as connection:
+            blogids = [blogid for blogid, in connection.execute(
+                query + " ORDER BY rowid LIMIT ?", params + (count,))]
+            connection.executemany(
+                "UPDATE blogs SET state = ? WHERE blogid = ?",
+                [(CLAIMED, blogid) for blogid in blogids])
+        return blogids
+
+    def visit(self, visited: Iterable[str], found: Iterable[str]) -> int:
+        """Records a batch of visited blogs and the neighbors found on them
+        in one transaction, so a crash loses both or neither. Returns how
+        many neighbors were new"""
+        with self.connection:
+            cursor = self.connection.executemany(
+                "INSERT OR IGNORE INTO blogs (blogid, state) VALUES (?, ?)",
+                ((blogid, PENDING) for blogid in found))
+            added = cursor.rowcount
+            self.connection.executemany(
+                "INSERT INTO blogs (blogid, state) VALUES (?, ?) "
+                "ON CONFLICT (blogid) DO UPDATE SET state = excluded.state",
+                ((blogid, VISITED) for blogid in visited))
+        return added
+
+    def release(self) -> int:
+        """Returns blogs claimed by a run that stopped to pending"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE blogs SET state = ? WHERE state = ?", (PENDING, CLAIMED))
+        return cursor.rowcount
+
+    def import_lists(self, blog_list_path: str, visited_list_path: str) -> int:
+        """Imports the json lists of earlier versions into an empty frontier"""
+        if len(self) > 0:
+            return 0
+        for path, state in [(blog_list_path, PENDING), (visited_list_path, VISITED)]:
+            if not os.path.isfile(path):
+                continue
+            with open(path, "r") as f:
+                blogids = json.load(f)
+            if state == PENDING:
+                self.add(blogids)
+            else:
+                self.visit(blogids, [])
+        return len(self)
+
+    def write_bloglist(self, path: str):
+        """Writes every blog id found, as the json list naverblog reads"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write("[")
+            rows = self.connection.execute("SELECT blogid FROM blogs ORDER BY rowid")
+            for i, (blogid,) in enumerate(rows):
+                if i:
+                    f.write(", ")
+                f.write(json.dumps(blogid))
+            f.write("]")
+        os.replace(temp_path, path)
@@ -7,10 +7,15 @@ from logging import Logger
 from typing import Dict, Any, List
 import os
 import traceback
-import pandas as pd
 
 from .NaverBlogScrapper import NaverBlogScrapper
-from .__utils import load_bloginfos
+from .completion import (
+    mark_completed,
+    compact_completion_log,
+    read_checkpoint,
+    write_checkpoint,
+    clear_checkpoint,
+)
 from util.env import get_iplist
 from util.argcheck import parse_iplist
 from util.slack import send_slack_message
@@ -52,15 +57,15 @@ class naverblogCrawler(Crawler):
         os.makedirs(html_path, exist_ok=True)
         os.makedirs(jsonl_path, exist_ok=True)
         
-        with open(bloglist_path, 'r') as f:
-            blogids = json.loads(f.read())
-        
-        # Build task list
-        blog_info = load_bloginfos()
-        completed_blog = set(list(blog_info["blogid"]))
-        
-        # Filter out completed blogs
-        tasks = [blogid for blogid in blogids if blogid not in completed_blog]
+        if self.build_tasks:
+            with open(bloglist_path, 'r') as f:
+                blogids = json.loads(f.read())
+
+            # Build task list, no worker appends to the completion log yet
+            completed_blog = compact_completion_log()
+
+            # Filter out completed blogs
+            tasks = [blogid for blogid in blogids if blogid not in completed_blog]
         
         shared_argv.update({
             "configuration": data_dict
@@ -83,36 +88,40 @@ class naverblogCrawler(Crawler):
             configuration = shared_argv["configuration"]
             
             logger.info(f"Start processing blog ID: {blogid}")
-            scrapper = NaverBlogScrapper(ip, configuration)
-            results = scrapper.scrap_naverblog(blogid, None)  # No lock needed with engine
+            scrapper = NaverBlogScrapper(ip, configuration, interval)
+            # Posts handed to the saver by an earlier attempt of this blog
+            checkpoint = read_checkpoint(blogid)
+            if checkpoint is not None:
+                logger.info(f"Resuming blog ID {blogid} after post {checkpoint}")
+            
+            # Stream posts to the engine's save queue as they are scrapped
+            count = 0
+            for result in scrapper.scrap_naverblog(blogid, None, checkpoint):  # No lock needed with engine
+                if save_queue is None:
+                    continue
+                # The saver_wrapper in engine.py expects JSON strings
+                json_str = json.dumps(result, ensure_ascii=False)
+                save_queue.put(json_str)
+                _, _, checkpoint = result["uri"].split("/")
+                write_checkpoint(blogid, checkpoint)
+                count += 1
             
             time.sleep(interval)
             
-            # Pass results to the engine's save queue for the saver process to handle
-            if save_queue is not None and results:
-                # Update blog_info.csv to mark this blog as completed
+            if save_queue is not None and checkpoint is not None:
+                # Append to the completion log to mark this blog as completed
                 try:
-                    # Get the first post's ID to use as checkpoint
-                    first_result = results[0]
-                    uri = first_result["uri"]
-                    _, _, postid = uri.split("/")
-                    
-                    # Update blog info with the save path and post ID
+                    # Update blog info with the save path and the last post ID
                     save_path = os.path.join(self.save_dir, f"{self.save_id}_00000.jsonl")
-                    self._update_blog_info(blogid, save_path, postid)
+                    mark_completed(blogid, save_path, checkpoint)
+                    clear_checkpoint(blogid)
                     
-                    logger.info(f"Updated blog_info.csv for blog ID: {blogid}")
+                    logger.info(f"Marked blog ID {blogid} as completed")
                 except Exception as e:
-                    logger.error(f"Failed to update blog_info.csv: {str(e)}")
+                    logger.error(f"Failed to update the completion log: {str(e)}")
                 
-                # Send results to save queue
-                for result in results:
-                    # The saver_wrapper in engine.py expects JSON strings
-                    json_str = json.dumps(result, ensure_ascii=False)
-                    save_queue.put(json_str)
-                
-            logger.info(f"Finished processing blog ID: {blogid}")
-            return results
+            logger.info(f"Finished processing blog ID: {blogid}, {count} posts")
+            return count
             
         except Exception as e:
             error_msg = f"Exception occurred while scrapping naver blog: {str(e)}"
@@ -124,26 +133,3 @@ class naverblogCrawler(Crawler):
                 time.sleep(3600)
                 
             raise e
-            
-    def _update_blog_info(self, blogid, save_path, checkpoint):
-        """Update the blog_info.csv file to mark a blog as processed"""
-        blog_info_path = os.path.join(self.cache_dir, "blog_info.csv")
-        
-        try:
-            blog_info = pd.read_csv(blog_info_path, index_col=0)
-        except:
-            blog_info = pd.DataFrame(columns=["blogid", "save_path", "checkpoint"])
-            
-        # Check if blogid already exists
-        if blogid in blog_info["blogid"].values:
-            # Update existing entry
-            idx = blog_info.index[blog_info["blogid"] == blogid][0]
-            blog_info.at[idx, "save_path"] = save_path
-            blog_info.at[idx, "checkpoint"] = checkpoint
-        else:
-            # Add new entry
-            new_data = {"blogid": [blogid], "save_path": [save_path], "checkpoint": [checkpoint]}
-            blog_info = pd.concat([blog_info, pd.DataFrame(new_data)], ignore_index=True)
-            
-        # Save updated dataframe
-        blog_info.to_csv(blog_info_path)
\ No newline at end of file
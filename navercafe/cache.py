@@ -1,24 +1,179 @@
+"""Progress of navercafe cafes, boards and pages.
+
+State lives in one SQLite database, cache/navercafe/state.db. Cafe and board
+status are small JSON rows. Board pages are rows of their own, so finishing
+a page writes that page instead of rewriting the whole board. A cafe or
+board that still has a legacy cafecache.json/boardcache.json file and no
+row is imported on first read. scripts/navercafe/migrate_cache.py imports
+them all at once.
+"""
 import os
 import json
+from typing import Any, Dict, List, Optional
+
+from navercafe.structs import Cafe, Board, CACHE_BASE
+from util.sqlitedb import SqliteStore
+
+STATE_DB = os.path.join(CACHE_BASE, "state.db")
+
+
+class StateStore(SqliteStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS status (
+        key TEXT PRIMARY KEY,
+        payload TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS pages (
+        board TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        articles TEXT NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (board, page)
+    ) WITHOUT ROWID;
+    """
+
+    def read_status(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            "SELECT payload FROM status WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def write_status(self, key: str, payload: Dict[str, Any]):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO status (key, payload) VALUES (?, ?)",
+                (key, json.dumps(payload, ensure_ascii=False)))
+
+    def read_pages(self, key: str) -> List[Dict[str, Any]]:
+        rows = self.connection.execute(
+            "SELECT page, articles, done FROM pages WHERE board = ? ORDER BY page",
+            (key,))
+        pages = []
+        for page, articles, done in rows:
+            entry = {"page": page, "articles": json.loads(articles)}
+            if done:
+                entry["done"] = True
+            pages.append(entry)
+        return pages
+
+    def write_page(self, key: str, entry: Dict[str, Any]):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (board, page, articles, done) "
+                "VALUES (?, ?, ?, ?)",
+                (key, entry["page"], json.dumps(entry.get("articles", [])),
+                 int(entry.get("done", False))))
+
+    def set_page_done(self, key: str, page: int):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE pages SET done = 1 WHERE board = ? AND page = ?", (key, page))
+
+    def replace_pages(self, key: str, pages: List[Dict[str, Any]]):
+        rows = []
+        for index, entry in enumerate(pages):
+            # legacy files may hold entries of pages that were never listed
+            if "articles" not in entry:
+                continue
+            rows.append((key, entry.get("page", index + 1),
+                         json.dumps(entry["articles"]),
+                         int(entry.get("done", False))))
+        with self.connection:
+            self.connection.execute("DELETE FROM pages WHERE board = ?", (key,))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pages (board, page, articles, done) "
+                "VALUES (?, ?, ?, ?)", rows)
+
+
+_STORES = {}
+
+
+def get_store() -> StateStore:
+    path = os.path.abspath(STATE_DB)
+    if path not in _STORES:
+        _STORES[path] = StateStore(path)
+    return _STORES[path]
+
+
+def task_key(task: Cafe | Board) -> str:
+    if isinstance(task, Cafe):
+        return task.cafeid
+    if isinstance(task, Board):
+        return f"{task.cafe.cafeid}/{task.bid}"
+    raise TypeError(f"Invalid type: {type(task)}")
+
+
+def read_legacy_cache(task: Cafe | Board) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(task.cache):
+        return None
+    with open(task.cache, "r", encoding="utf-8") as f:
+        return json.loads(f.read())
+
+
+def import_legacy_cache(task: Cafe | Board) -> Optional[Dict[str, Any]]:
+    """Copies a cafecache.json/boardcache.json file into the state store"""
+    payload = read_legacy_cache(task)
+    if payload is None:
+        return None
+    write_cache(task, payload)
+    return read_cache(task)
+
+
+def read_cache(task: Cafe | Board) -> Dict[str, Any]:
+    key = task_key(task)
+    store = get_store()
+    status = store.read_status(key)
+    if status is None:
+        return import_legacy_cache(task) or {}
+    if isinstance(task, Board):
+        status["pages"] = store.read_pages(key)
+    return status
+
+
+def write_cache(task: Cafe | Board, payload: Dict[str, Any]):
+    """Writes the whole status. Boards rewrite all their pages, so handle_board
+    uses write_status and the page functions below instead"""
+    write_payload(task_key(task), payload, board=isinstance(task, Board))
+
+
+def write_payload(key: str, payload: Dict[str, Any], board: bool = False):
+    store = get_store()
+    if board and "pages" in payload:
+        store.replace_pages(key, payload["pages"])
+    status = {name: value for name, value in payload.items() if name != "pages"}
+    store.write_status(key, status)
+
+
+def write_status(task: Cafe | Board, payload: Dict[str, Any]):
+    """Writes the status without the pages of a board"""
+    write_payload(task_key(task), payload)
+
+
+def write_page(board: Board, entry: Dict[str, Any]):
+    get_store().write_page(task_key(board), entry)
+
 
-from navercafe.structs import Cafe, Board
+def set_page_done(board: Board, entry: Dict[str, Any]):
+    entry["done"] = True
+    get_store().set_page_done(task_key(board), entry["page"])
 
 
-def read_cache(task: Cafe | Board):
-    if not isinstance(task, Cafe) and not isinstance(task, Board):
-        raise TypeError(f"Invalid type: {type(task)}")
-    cache_path = task.cache
-    if not os.path.isfile(cache_path):
-        return {}
-    with open(cache_path, "r", encoding="utf-8") as f:
-        json_str = f.read()
-    return json.loads(json_str)
+def clear_pages(board: Board):
+    get_store().replace_pages(task_key(board), [])
 
 
-def write_cache(task: Cafe | Board, payload):
-    if not isinstance(task, Cafe) and not isinstance(task, Board):
-        raise TypeError(f"Invalid type: {type(task)}")
-    cache_path = task.cache
-    json_str = json.dumps(payload, ensure_ascii=False, indent=2)
-    with open(cache_path, "w", encoding="utf-8") as f:
-        f.write(json_str)
+def update_cache(task: Cafe | Board, update):
+    """Applies update(status) to the status in one transaction.
+    Used when several workers write the same status, e.g. the boards of one cafe"""
+    key = task_key(task)
+    store = get_store()
+    if store.read_status(key) is None:
+        import_legacy_cache(task)
+    with store.transaction() as connection:
+        row = connection.execute(
+            "SELECT payload FROM status WHERE key = ?", (key,)).fetchone()
+        payload = {} if row is None else json.loads(row[0])
+        payload = update(payload)
+        connection.execute(
+            "INSERT OR REPLACE INTO status (key, payload) VALUES (?, ?)",
+            (key, json.dumps(payload, ensure_ascii=False)))
+    return payload
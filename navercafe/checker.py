@@ -1,5 +1,5 @@
 import os
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import datetime
 from dateutil.relativedelta import relativedelta
 
@@ -26,6 +26,22 @@ def duration_passed(entry: Dict[str, Any]) -> bool:
     return False
 
 
+def highest_article(pages: List[Dict[str, Any]], default: Optional[int] = None) -> Optional[int]:
+    ids = [int(aid) for page in pages for aid in page.get("articles", [])]
+    return max(ids, default=default)
+
+
+def listed_watermark(entry: Dict[str, Any]) -> Optional[int]:
+    """Highest article id of a board listed to the end, None if the board
+    was not. Boards finished before watermarks take it from their pages"""
+    if not entry.get("done", False):
+        return None
+    watermark = entry.get("watermark")
+    if watermark is None:
+        watermark = highest_article(entry.get("pages", []))
+    return watermark
+
+
 def check_done(entry: Dict[str, Any]):
     done = entry.get("done", False)
     if not done:
@@ -35,6 +51,11 @@ def check_done(entry: Dict[str, Any]):
     return True
 
 
+def is_pending(task: Cafe | Board) -> bool:
+    """Task filter of navercafeCrawler"""
+    return not is_processed(task)
+
+
 def is_processed(task: Cafe | Board) -> bool:
     if not isinstance(task, Cafe) and not isinstance(task, Board):
         raise TypeError(f"Invalid type: {type(task)}")
@@ -14,9 +14,12 @@ from navercafe.header import ncafeheader
 import navercafe.checker as nchecker
 from navercafe.json_util import get_response
 
-from util.misc import get_interval
+from util.misc import get_interval, get_concurrency
+from util.htmlparse import make_soup
 from util.customexception import *
 from util.ema import Ema
+from util.aio import get_fetcher, chunks, raise_critical
+from engine.scheduler import Subtask, UNKNOWN_COST
 
 IGNORES = [
     "SE-TEXT",
@@ -30,6 +33,9 @@ IGNORES = [
     "[data-hwpjson]",
 ]
 
+# articles per page of ArticleListV2dot1.json
+PER_PAGE = 50
+
 BANNED_CLASSES = [r'"hwp_editor_board_content"']
 BANNED_IDS = [r'"SL_locer"', '"SL_BBL_locer"']
 
@@ -73,7 +79,7 @@ def recursive_text(tag, buf):
 
 
 def extract_text(given_html: str) -> str:
-    soup = BeautifulSoup(given_html, "html.parser")
+    soup = make_soup(given_html)
     buf = StringIO()
     recursive_text(soup, buf)
     text = buf.getvalue().strip()
@@ -89,12 +95,14 @@ def get_article_json(article: Article, ip: str, logger: Logger, interval: int =
     url = f"https://apis.naver.com/cafe-web/cafe-articleapi/v2.1/cafes/{iid}/articles/{aid}?menuId={mid}&tc=cafe_article_list&useCafeId=true"
 
     referer = f"https://m.cafe.naver.com/ca-fe/web/cafes/{iid}/articles/{aid}?fromList=true&menuId={mid}&tc=cafe_article_list"
-    ncafeheader["Referer"] = referer
+    # copied so that articles fetched concurrently keep their own referer
+    headers = dict(ncafeheader)
+    headers["Referer"] = referer
     try:
         logger.info(f"get article json : referer: {referer}")
         json_message = get_response(
             url,
-            ncafeheader,
+            headers,
             interval=interval,
             ip=ip,
             logger=logger,
@@ -126,7 +134,13 @@ def set_article(
         msg = f"Failed to get article json for {article}"
         logger.error(msg)
         return None
+    return parse_article_json(article, json_message, logger)
+
 
+def parse_article_json(
+    article: Article, json_message: Dict[str, Any], logger: Logger
+) -> Optional[Article]:
+    """Sets the article fields from its article api response"""
     try:
         article_html = json_message["article"]["contentHtml"]
 
@@ -156,22 +170,58 @@ def handle_page(
     logger: Logger,
     interval: int,
     save_queue: mp.Queue,
+    concurrency: int = 1,
 ):
     ema = Ema(10)
-    articles = page_entry.get("articles", [])
-    for aid in articles:
-        article = Article(board, aid)
+    articles = [Article(board, aid) for aid in page_entry.get("articles", [])]
+    if concurrency > 1:
+        return handle_page_concurrently(
+            articles, ip, logger, interval, save_queue, concurrency, ema)
+    for article in articles:
         result = set_article(article, ip, logger, interval=interval)
-        if result:
-            save_queue.put(result.to_json())
-            ema.update(len(result.text) > 10)
-        else:
-            ema.update(False)
-        if ema.value < 0.15:
+        if not save_article(result, save_queue, ema):
             return False
     return True
 
 
+def handle_page_concurrently(
+    articles: List[Article],
+    ip: str,
+    logger: Logger,
+    interval: int,
+    save_queue: mp.Queue,
+    concurrency: int,
+    ema: Ema,
+):
+    """Fetches up to concurrency articles at once. Request starts are still
+    spaced by the ip's rate limiter"""
+    fetcher = get_fetcher(ip, concurrency)
+
+    def fetch(article):
+        return set_article(article, ip, logger, interval=interval)
+
+    for chunk in chunks(articles, concurrency):
+        results = fetcher.map(fetch, chunk)
+        raise_critical(results, (TooManyRequestsError,))
+        for article, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to handle {article}, Exception: {result}")
+                result = None
+            if not save_article(result, save_queue, ema):
+                return False
+    return True
+
+
+def save_article(result: Optional[Article], save_queue: mp.Queue, ema: Ema) -> bool:
+    """Saves the article and returns False once the page looks empty"""
+    if result:
+        save_queue.put(result.to_json())
+        ema.update(len(result.text) > 10)
+    else:
+        ema.update(False)
+    return ema.value >= 0.15
+
+
 def can_read_article(entry: Dict[str, Any]) -> bool:
     blindArticle = entry.get("blindArticle", True)
     openArticle = entry.get("openArticle", False)
@@ -183,7 +233,7 @@ def get_page_json(board: Board, page: int, ip: str, logger: Logger, interval: in
     path = "/cafe-web/cafe2/ArticleListV2dot1.json"
     bid = board.bid
     internalid = board.cafe.cafe_internalid
-    query = f"search.clubid={internalid}&search.queryType=lastArticle&search.menuid={bid}&search.page={page}&search.perPage=50"
+    query = f"search.clubid={internalid}&search.queryType=lastArticle&search.menuid={bid}&search.page={page}&search.perPage={PER_PAGE}"
 
     url = f"https://{host}{path}?{query}"
     referer = f"https://m.cafe.naver.com/ca-fe/web/cafes/{internalid}/menus/{bid}"
@@ -202,8 +252,11 @@ def get_page_json(board: Board, page: int, ip: str, logger: Logger, interval: in
 
 
 def build_page_entries(
-    board: Board, page_num: int, ip: str, logger: Logger, interval: int = 1
+    board: Board, page_num: int, ip: str, logger: Logger, interval: int = 1,
+    since: Optional[int] = None,
 ) -> Tuple[List[str], bool]:
+    """Lists the readable articles of a page. With since, only articles
+    newer than since are listed, and a page without any ends the listing"""
     json_message = get_page_json(
         board, page_num, ip, logger, interval=interval)
     if json_message is None:
@@ -218,12 +271,20 @@ def build_page_entries(
         logger.error(msg)
         return None, None
 
+    newer = False
     for entry in article_list:
+        if since is not None:
+            if int(entry["articleId"]) <= since:
+                continue
+            newer = True
         if not can_read_article(entry):
             continue
         articleId = str(entry["articleId"])
         new_list.append(articleId)
 
+    if since is not None and not newer:
+        # older articles were listed by the previous pass
+        has_next = False
     return new_list, has_next
 
 
@@ -263,6 +324,7 @@ def handle_board(
     logger: Logger,
     interval: int = 1,
     save_queue: mp.Queue = None,
+    concurrency: int = 1,
 ):
     if save_queue is None:
         raise ValueError("save_queue is None")
@@ -275,25 +337,35 @@ def handle_board(
         member_only = check_board_memberonly(
             board, ip, logger, interval=interval)
         board_status["member_only"] = member_only
-        ncache.write_cache(board, board_status)
+        ncache.write_status(board, board_status)
 
     if member_only:
         msg = f"Board {board} is member only. Skip"
         logger.warning(msg)
         nchecker.mark_done(board_status)
-        ncache.write_cache(board, board_status)
+        ncache.write_status(board, board_status)
         return
 
     # fetch cached page
     pages = board_status.get("pages", [])
 
-    # if rebuild is needed, rebuild the page
-    need_rebuild = nchecker.duration_passed(board_status)
+    # if rebuild is needed, list the articles newer than the watermark
+    # of a board listed to the end, or the whole board otherwise
+    since = board_status.get("since")
+    need_rebuild = since is None and nchecker.duration_passed(board_status)
     is_processed = nchecker.check_done(board_status)
     if need_rebuild:
+        since = nchecker.listed_watermark(board_status)
         pages = []
-        logger.warning("Rebuilding board %s", board)
-        ncache.write_cache(board, board_status)
+        if since is None:
+            logger.warning("Rebuilding board %s", board)
+        else:
+            logger.warning("Refreshing board %s above article %d", board, since)
+            # kept until the refresh ends, so a resumed run does not restart it
+            board_status["since"] = since
+            board_status["done"] = False
+            ncache.write_status(board, board_status)
+        ncache.clear_pages(board)
     elif is_processed:
         msg = f"Board {board} is already processed"
         logger.warning(msg)
@@ -311,9 +383,9 @@ def handle_board(
             if done:
                 logger.info("Page %d is already processed", page)
                 continue
-            handle_page(board, cached_page, ip, logger, interval, save_queue)
-            cached_page["done"] = True
-            ncache.write_cache(board, board_status)
+            handle_page(board, cached_page, ip, logger,
+                        interval, save_queue, concurrency=concurrency)
+            ncache.set_page_done(board, cached_page)
 
     has_next = True
     while has_next:
@@ -323,17 +395,16 @@ def handle_board(
             page_entry = {}
             pages.append(page_entry)
             article_entries, has_next = build_page_entries(
-                board, page, ip, logger, interval
+                board, page, ip, logger, interval, since=since
             )
             if article_entries is None:
                 return
             page_entry["page"] = page
             page_entry["articles"] = article_entries
-            ncache.write_cache(board, board_status)
-            res = handle_page(board, page_entry, ip,
-                              logger, interval, save_queue)
-            page_entry["done"] = True
-            ncache.write_cache(board, board_status)
+            ncache.write_page(board, page_entry)
+            res = handle_page(board, page_entry, ip, logger,
+                              interval, save_queue, concurrency=concurrency)
+            ncache.set_page_done(board, page_entry)
             page += 1
             if not res:
                 logger.warning("Board %s seems to contain empty pages", board)
@@ -343,8 +414,10 @@ def handle_board(
             logger.error(msg)
             return
 
+    board_status["watermark"] = nchecker.highest_article(pages, since)
+    board_status.pop("since", None)
     nchecker.mark_done(board_status)
-    ncache.write_cache(board, board_status)
+    ncache.write_status(board, board_status)
 
 
 SKIP_WORDS = [
@@ -442,6 +515,71 @@ def get_cafe_internalid(cafe: Cafe, ip: str, logger: Logger, interval: int = 1)
     return str(cafeId)
 
 
+def estimate_board_requests(board_status: Dict[str, Any]) -> int:
+    """Estimates the requests handle_board still needs from the board cache"""
+    if board_status.get("member_only"):
+        return 1
+    pages = board_status.get("pages", [])
+    if board_status.get("since") is None and nchecker.duration_passed(board_status):
+        if nchecker.listed_watermark(board_status) is not None:
+            # new articles of a month usually fit in the first pages
+            return 2 * (PER_PAGE + 1)
+        return UNKNOWN_COST
+    if not pages:
+        return UNKNOWN_COST
+    # one listing request per page plus one per article of unfinished pages
+    left = sum(len(page.get("articles", [])) + 1
+               for page in pages if not page.get("done", False))
+    return left + 1
+
+
+def handle_board_subtask(
+    board: Board,
+    shared_argv: Dict[str, Any],
+    private_argv: Dict[str, Any],
+    logger: Logger,
+    save_queue: Optional[mp.Queue] = None,
+):
+    """Handles one board split off handle_cafe, with the ip of the worker
+    that took it. The last board of a cafe marks the cafe done"""
+    ip = private_argv["ip"]
+    interval = get_interval(shared_argv, private_argv)
+    concurrency = get_concurrency(shared_argv, private_argv)
+    handle_board(board, ip, logger, interval=interval,
+                 save_queue=save_queue, concurrency=concurrency)
+
+    def remove_board(cafe_status):
+        pending = cafe_status.get("pending_boards", [])
+        if board.bid in pending:
+            pending.remove(board.bid)
+        cafe_status["pending_boards"] = pending
+        if not pending:
+            logger.warning("All boards of cafe %s are handled", board.cafe)
+            nchecker.mark_done(cafe_status)
+        return cafe_status
+
+    ncache.update_cache(board.cafe, remove_board)
+
+
+def split_cafe(cafe: Cafe, boards: List[Dict[str, str]], scheduler, logger: Logger):
+    """Submits the boards of a cafe as sub-tasks, largest estimate first"""
+    subtasks = []
+    for entry in boards:
+        board = Board(cafe, entry["bid"], entry["bname"])
+        cost = estimate_board_requests(ncache.read_cache(board))
+        subtasks.append(Subtask(handle_board_subtask, board, cost))
+
+    def set_pending(cafe_status):
+        cafe_status["pending_boards"] = [entry["bid"] for entry in boards]
+        return cafe_status
+
+    ncache.update_cache(cafe, set_pending)
+    scheduler.submit(subtasks)
+    total = sum(subtask.cost for subtask in subtasks)
+    logger.warning("Split cafe %s into %d boards, ~%d requests",
+                   cafe, len(subtasks), total)
+
+
 def handle_cafe(
     cafe: Cafe,
     shared_argv: Dict[str, Any],
@@ -456,6 +594,7 @@ def handle_cafe(
     logger.warning("Handling cafe %s", cafe)
     ip = private_argv["ip"]
     interval = get_interval(shared_argv, private_argv)
+    concurrency = get_concurrency(shared_argv, private_argv)
     cafe_status = ncache.read_cache(cafe)
     cafe_status["cafeid"] = cafe.cafeid
 
@@ -480,11 +619,17 @@ def handle_cafe(
         logger.error("Failed to get boardlist for %s", cafe)
         return
 
+    # let every worker take the boards of this cafe
+    scheduler = shared_argv.get("scheduler")
+    if scheduler is not None and shared_argv.get("split_boards", True) and boards:
+        split_cafe(cafe, boards, scheduler, logger)
+        return
+
     # handle each boards
     for entry in boards:
         board = Board(cafe, entry["bid"], entry["bname"])
         handle_board(board, ip, logger, interval=interval,
-                     save_queue=save_queue)
+                     save_queue=save_queue, concurrency=concurrency)
 
     nchecker.mark_done(cafe_status)
     ncache.write_cache(cafe, cafe_status)
@@ -0,0 +1,218 @@
+"""Per-board index of the article ids that are already processed.
+
+Checking an article used to stat json_files/{aid}.json and .json.gz and read
+the legacy cache/{bid}_{batch}.txt files, which is slow for boards with
+millions of files on network storage. The index is built once from those
+files and the board archive, and kept next to them in the board's data
+directory:
+
+    processed.idx   sorted int64 ids, memory-mapped for lookup
+    processed.log   ids added since the last build, appended as int64
+
+Both are in native byte order, so a data directory shared between machines
+must only be shared between machines of the same byte order. The files
+only index what is in the directory, so deleting them forces a rebuild.
+
+The log is merged into the index when the board is opened and the log has
+grown past MERGE_THRESHOLD ids. If files appeared in json_files or cache
+after the index and log were last written, e.g. by another tool, the index
+is rebuilt from the directories.
+"""
+import os
+import mmap
+import array
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Set
+
+from util.archive import ARCHIVE_DIR, Archive, has_archive
+
+INDEX_NAME = "processed.idx"
+LOG_NAME = "processed.log"
+ID_TYPE = "q"
+ID_BYTES = 8
+MERGE_THRESHOLD = 4096
+MAX_OPEN_INDEXES = 64
+
+# guards get_index, which fetcher threads call. Replaced in a forked child,
+# where a thread of the parent may have left it held
+_LOCK = threading.Lock()
+
+
+def _reset_lock():
+    global _LOCK
+    _LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+def _read_ids(path: str) -> array.array:
+    ids = array.array(ID_TYPE)
+    with open(path, "rb") as f:
+        data = f.read()
+    ids.frombytes(data[:len(data) - len(data) % ID_BYTES])
+    return ids
+
+
+def scan_processed_ids(data_dir: str) -> Set[int]:
+    """Reads the ids of the board archive, json_files/{aid}.json[.gz]
+    and cache/*.txt of a board"""
+    ids = set()
+    archive_dir = os.path.join(data_dir, ARCHIVE_DIR)
+    if has_archive(archive_dir):
+        archive = Archive(archive_dir)
+        ids.update(int(aid) for aid in archive.keys() if aid.isdigit())
+        archive.close()
+    json_dir = os.path.join(data_dir, "json_files")
+    if os.path.isdir(json_dir):
+        with os.scandir(json_dir) as entries:
+            for entry in entries:
+                aid = entry.name.split(".", 1)[0]
+                if aid.isdigit():
+                    ids.add(int(aid))
+    cache_dir = os.path.join(data_dir, "cache")
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if not name.endswith(".txt"):
+                continue
+            with open(os.path.join(cache_dir, name), "r") as f:
+                for line in f:
+                    aid = line.split(".")[0].strip()
+                    if aid.isdigit():
+                        ids.add(int(aid))
+    return ids
+
+
+def write_index(path: str, ids: Iterable[int]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        array.array(ID_TYPE, sorted(set(ids))).tofile(f)
+    os.replace(tmp_path, path)
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+class ProcessedIndex:
+    data_dir = None  # type: str
+    index_path = None  # type: str
+    log_path = None  # type: str
+    ids = None  # type: Optional[memoryview]
+    added = None  # type: Set[int]
+    _file = None
+    _mmap = None  # type: Optional[mmap.mmap]
+    _view = None  # type: Optional[memoryview]
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.index_path = os.path.join(data_dir, INDEX_NAME)
+        self.log_path = os.path.join(data_dir, LOG_NAME)
+        self.added = set()
+        if self.is_stale():
+            self.rebuild()
+        else:
+            self.added = self.read_log()
+            if len(self.added) > MERGE_THRESHOLD:
+                self.merge()
+        self.open()
+
+    def is_stale(self) -> bool:
+        if not os.path.isfile(self.index_path):
+            return True
+        if os.path.getsize(self.index_path) % ID_BYTES:
+            return True
+        written = max(_mtime(self.index_path), _mtime(self.log_path))
+        return any(_mtime(os.path.join(self.data_dir, name)) > written
+                   for name in ("json_files", "cache"))
+
+    def read_log(self) -> Set[int]:
+        if not os.path.isfile(self.log_path):
+            return set()
+        return set(_read_ids(self.log_path))
+
+    def rebuild(self):
+        write_index(self.index_path, scan_processed_ids(self.data_dir))
+        self._truncate_log()
+
+    def merge(self):
+        ids = set(self.added)
+        ids.update(_read_ids(self.index_path))
+        write_index(self.index_path, ids)
+        self._truncate_log()
+
+    def _truncate_log(self):
+        if os.path.isfile(self.log_path):
+            os.remove(self.log_path)
+        self.added = set()
+
+    def open(self):
+        self.close()
+        self._file = open(self.index_path, "rb")
+        if os.fstat(self._file.fileno()).st_size < ID_BYTES:
+            self.ids = memoryview(b"").cast(ID_TYPE)
+            return
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self.ids = self._view.cast(ID_TYPE)
+
+    def __contains__(self, aid: int) -> bool:
+        if aid in self.added:
+            return True
+        ids = self.ids
+        position = bisect.bisect_left(ids, aid)
+        return position < len(ids) and ids[position] == aid
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.added)
+
+    def add(self, aid: int):
+        if aid in self:
+            return
+        self.added.add(aid)
+        with open(self.log_path, "ab") as f:
+            array.array(ID_TYPE, [aid]).tofile(f)
+
+    def close(self):
+        if self.ids is not None:
+            self.ids.release()
+            self.ids = None
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_INDEXES = OrderedDict()
+_INDEXES_PID = None
+
+
+def get_index(data_dir: str) -> ProcessedIndex:
+    """Returns the index of a board's data dir, keeping the most recently
+    used MAX_OPEN_INDEXES open in this process"""
+    global _INDEXES, _INDEXES_PID
+    with _LOCK:
+        if _INDEXES_PID != os.getpid():
+            _INDEXES = OrderedDict()
+            _INDEXES_PID = os.getpid()
+        index = _INDEXES.get(data_dir)
+        if index is None:
+            # built under the lock, so threads of one board build it once
+            index = ProcessedIndex(data_dir)
+            _INDEXES[data_dir] = index
+            if len(_INDEXES) > MAX_OPEN_INDEXES:
+                _, evicted = _INDEXES.popitem(last=False)
+                evicted.close()
+        else:
+            _INDEXES.move_to_end(data_dir)
+    return index
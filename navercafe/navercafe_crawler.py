@@ -6,7 +6,7 @@ import os
 from util.env import get_iplist
 from util.argcheck import parse_iplist
 from navercafe.handler import handle_cafe
-from navercafe.checker import is_processed
+from navercafe.checker import is_pending
 from navercafe.structs import Cafe
 from util.fileutil import read_tsv
 from util.argcheck import parse_iplist
@@ -17,12 +17,13 @@ class navercafeCrawler(Crawler):
         super(navercafeCrawler, self).__init__()
         self.save_id = "navercafe"
         self.save_dir = "data/navercafe_merged"
+        self.task_filter = is_pending
 
     def _build_cafelist(self, cafelist_path: str) -> List[Cafe]:
         cids = read_tsv(cafelist_path, header=True)
         cids = [cid[0] for cid in cids]
-        cafes = map(lambda cid: Cafe(cid), cids)
-        return [cafe for cafe in cafes if not is_processed(cafe)]
+        # processed cafes are filtered by task_filter
+        return [Cafe(cid) for cid in cids]
 
     def load_configuration(self, config_file: str):
         with open(config_file, "r") as file:
@@ -42,10 +43,15 @@ class navercafeCrawler(Crawler):
         for ip, interval in zip(ips, intervals):
             argv = {"ip": ip, "interval": interval}
             private_args.append(argv)
-        shared_argv = {}
+        shared_argv = {
+            "concurrency": data_dict.get("concurrency", 1),
+            "split_boards": data_dict.get("split_boards", True),
+        }
 
         cafelist_txt_path = data_dict["cafelist"]
-        cafes = self._build_cafelist(cafelist_txt_path)
+        cafes = []
+        if self.build_tasks:
+            cafes = self._build_cafelist(cafelist_txt_path)
 
         return cafes, shared_argv, private_args
 
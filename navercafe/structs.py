@@ -2,27 +2,13 @@ import os
 from typing import List
 import json
 import gzip
-import functools
+
+from navercafe.index import get_index
+from util.archive import ARCHIVE_DIR, get_archive, has_archive
 
 CACHE_BASE = "cache/navercafe"
 DATA_BASE = "data/navercafe"
 
-CAFE_ARTICLE_CHECK = DATA_BASE
-BATCH_SIZE = 100000
-
-
-@functools.lru_cache(maxsize=256)
-def get_article_cache_content(cafe, board, batchid):
-    cafe_dir = os.path.join(CAFE_ARTICLE_CHECK, cafe)
-    board_dir = os.path.join(cafe_dir, board)
-    cache_dir = os.path.join(board_dir, "cache")
-    cache_path = os.path.join(cache_dir, f"{board}_{batchid}.txt")
-    if not os.path.exists(cache_path):
-        return set()
-    with open(cache_path, "r") as f:
-        lines = f.readlines()
-    return set([int(line.split(".")[0].strip()) for line in lines])
-
 
 class Cafe:
     cafeid: str
@@ -37,7 +23,7 @@ class Cafe:
 
         # make cache dir if not exists
         if not os.path.isdir(self.cache_dir):
-            os.makedirs(self.cache_dir)
+            os.makedirs(self.cache_dir, exist_ok=True)
 
     def __str__(self):
         return f"Cafe({self.cafeid})"
@@ -60,7 +46,7 @@ class Board:
 
         self.cache_dir = os.path.join(cafe.cache_dir, bid)
         self.cache = os.path.join(self.cache_dir, "boardcache.json")
-        data_dir = os.path.join(DATA_BASE, cafe.cafeid, bid)
+        data_dir = self.data_dir
         self.board_jsonl_savepath = os.path.join(data_dir, "board.jsonl")
 
         # make board cache dir and data dir if not exists
@@ -71,6 +57,14 @@ class Board:
         if not os.path.isdir(os.path.join(data_dir, "json_files")):
             os.makedirs(os.path.join(data_dir, "json_files"), exist_ok=True)
 
+    @property
+    def data_dir(self) -> str:
+        return os.path.join(DATA_BASE, self.cafe.cafeid, self.bid)
+
+    @property
+    def archive_dir(self) -> str:
+        return os.path.join(self.data_dir, ARCHIVE_DIR)
+
     def __str__(self):
         return f"{self.cafe.cafeid} {self.bname}({self.bid})"
 
@@ -120,26 +114,23 @@ class Article:
     def __hash__(self) -> int:
         return hash(self.uri)
 
-    def _cache_exist(self) -> bool:
-        batchid = int(self.aid) // BATCH_SIZE
-        cached_article_set = get_article_cache_content(
-            self.board.cafe.cafeid, self.board.bid, batchid
-        )
-        return int(self.aid) in cached_article_set
-
     def is_processed(self):
-        return (
-            os.path.exists(self.json_path)
-            or os.path.exists(self.gz_path)
-            or self._cache_exist()
-        )
+        """Looks the article up in the board's processed-id index
+        (see navercafe.index) instead of checking its files"""
+        return int(self.aid) in get_index(self.board.data_dir)
 
     def write_json(self, data):
         dumped = json.dumps(data, ensure_ascii=False, indent=2)
-        with gzip.open(self.gz_path, "wt") as f:
-            f.write(dumped)
+        get_archive(self.board.archive_dir).put(self.aid, dumped)
+        get_index(self.board.data_dir).add(int(self.aid))
 
     def read_json(self):
+        """Reads the article from the board archive, or from the
+        json_files written by earlier versions"""
+        if has_archive(self.board.archive_dir):
+            dumped = get_archive(self.board.archive_dir).get_text(self.aid)
+            if dumped is not None:
+                return json.loads(dumped)
         if os.path.exists(self.json_path):
             with open(self.json_path, "r") as f:
                 return json.load(f)
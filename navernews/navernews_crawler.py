@@ -9,6 +9,7 @@ from logging import Logger
 import traceback
 import os
 from util.env import get_iplist
+from util.misc import get_interval, get_concurrency
 
 
 class navernewsCrawler(Crawler):
@@ -40,15 +41,14 @@ class navernewsCrawler(Crawler):
         for ip, interval in zip(ips, intervals):
             argv = {"ip": ip, "interval": interval}
             private_args.append(argv)
-        shared_argv = {}
+        shared_argv = {"concurrency": data_dict.get("concurrency", 1)}
         tasks = []
 
         offices = data_dict["offices"]
         date_range = util.make_datelist(
             data_dict["start"], data_dict["end"]
         )
-        office_dict = navernews_util.build_office_dictionary()
-        oids = [office_dict[office] for office in offices]
+        oids = [self.OFFICEDICT[office] for office in offices]
 
         for oid in oids:
             navernews_util.make_officedir(oid)
@@ -70,10 +70,12 @@ class navernewsCrawler(Crawler):
         day, oid = payload
         office = self.get_office(oid)
         ip = private_argv["ip"]
-        interval = private_argv["interval"]
+        interval = get_interval(shared_argv, private_argv)
+        concurrency = get_concurrency(shared_argv, private_argv)
         logger.info("Start processing %s %s", office, day)
         navernews.worker.process_day(
-            ip, logger, save_queue, day, oid, interval)
+            ip, logger, save_queue, day, oid, office,
+            interval=interval, concurrency=concurrency)
         logger.info("Finished processing %s %s", office, day)
 
     def process_day(self, ip, logger, save_queue, day, oid, office):
@@ -1,5 +1,6 @@
 import os
 from util.crawler import get_soup, fetch_html
+from util.archive import ARCHIVE_DIR, get_archive, has_archive
 from datetime import datetime, timedelta
 import urllib.parse as urlparse
 
@@ -134,7 +135,18 @@ def html_save_path(oid, idx):
     return f"data/navernews/{oid}/htmls/{idx}.html"
 
 
+def html_archive_dir(oid):
+    return f"data/navernews/{oid}/{ARCHIVE_DIR}"
+
+
 def read_cached_html(oid, idx):
+    """Reads the html from the office archive, or from the htmls
+    files written by earlier versions"""
+    archive_dir = html_archive_dir(oid)
+    if has_archive(archive_dir):
+        html = get_archive(archive_dir).get_text(idx)
+        if html is not None:
+            return html
     path = html_save_path(oid, idx)
     try:
         if os.path.isfile(path):
@@ -157,18 +169,16 @@ def jsonl_save_path(oid, day):
 
 
 def save_html(oid, idx, html):
-    path = html_save_path(oid, idx)
-    with open(path, "w") as f:
-        f.write(html)
+    get_archive(html_archive_dir(oid)).put(idx, html)
 
 
-def read_cached_or_fetch_html(uri, logger, ip, cache=True):
+def read_cached_or_fetch_html(uri, logger, ip, cache=True, interval=0.75):
     oid, aid = parse_uri(uri)
     html = read_cached_html(oid, aid)
     if html:
         logger.info(f"Read cached html: {uri}")
         return html, uri
-    result = fetch_html(uri, logger, ip, return_uri=True)
+    result = fetch_html(uri, logger, ip, interval=interval, return_uri=True)
     if result is None:
         return None
     html, real_uri = result
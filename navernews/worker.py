@@ -3,11 +3,52 @@ from navernews.navernews_util import (
     build_daylist,
 )
 from navernews.navernewsparser import handle_navernews_html
+from util.aio import get_fetcher, chunks, raise_critical
+from util.customexception import TooManyRequestsError
+from engine.pipeline import submit_parse
 import os
 import traceback
 
 
-def process_day(ip, logger, save_queue, day, oid, office):
+def fetch_articles(articles, logger, ip, interval, concurrency):
+    """Yields (article, read_cached_or_fetch_html result) in order.
+    With concurrency > 1, up to concurrency articles are fetched at once.
+    Request starts are still spaced by the ip's rate limiter"""
+    if concurrency <= 1:
+        for article in articles:
+            yield article, read_cached_or_fetch_html(
+                article, logger, ip, interval=interval)
+        return
+
+    fetcher = get_fetcher(ip, concurrency)
+
+    def fetch(article):
+        return read_cached_or_fetch_html(article, logger, ip, interval=interval)
+
+    for chunk in chunks(articles, concurrency):
+        results = fetcher.map(fetch, chunk)
+        raise_critical(results, (TooManyRequestsError,))
+        for article, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to fetch {article}, Exception: {result}")
+                result = None
+            yield article, result
+
+
+def parse_article(html, office, uri=None, real_uri=None, logger=None):
+    try:
+        parsed = handle_navernews_html(
+            html, logger, office, uri=uri, real_uri=real_uri
+        )
+    except Exception as e:
+        print(traceback.format_exc())
+        parsed = None
+    if parsed is None:
+        logger.error(f"process_day:Failed to parse {uri}")
+    return parsed
+
+
+def process_day(ip, logger, save_queue, day, oid, office, interval=0.75, concurrency=1):
     # get days
     # this function leaves cache at cache/navernews/{oid}/{day}.txt
     day_articles = build_daylist(day, oid, ip, logger, check_yesterday=True)
@@ -34,8 +75,8 @@ def process_day(ip, logger, save_queue, day, oid, office):
     # for every undone articles
     # get article
     with open(done_path, "a") as f:
-        for article in to_process:
-            res = read_cached_or_fetch_html(article, logger, ip)
+        fetched = fetch_articles(to_process, logger, ip, interval, concurrency)
+        for article, res in fetched:
             if res is None:
                 continue
             html, real_uri = res
@@ -43,17 +84,8 @@ def process_day(ip, logger, save_queue, day, oid, office):
             f.write("\n")
             if html is None:
                 continue
-            try:
-                parsed = handle_navernews_html(
-                    html, logger, office, uri=article, real_uri=real_uri
-                )
-            except Exception as e:
-                print(traceback.format_exc())
-                parsed = None
-            if parsed is None:
-                logger.error(f"process_day:Failed to parse {article}")
-                continue
-            save_queue.put(parsed)
+            submit_parse(save_queue, logger, parse_article, html, office,
+                         uri=article, real_uri=real_uri)
 
     # put to save_queue
 
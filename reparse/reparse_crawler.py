@@ -0,0 +1,111 @@
+import os
+import time
+import yaml
+import multiprocessing as mp
+from logging import Logger
+from typing import Any, Dict, List
+
+from model.crawler import Crawler
+from engine.scheduler import Subtask
+from reparse.sources import SOURCES, Source, NaverNewsSource
+import navernews.navernews_util as navernews_util
+
+
+class Chunk:
+    """Pages of a unit parsed as one sub-task. Its key in the ledger is
+    source/unit/index, so a resumed run skips the chunks already done"""
+
+    source = None  # type: str
+    unit = None  # type: str
+    index = 0  # type: int
+    keys = None  # type: List[str]
+
+    def __init__(self, source: str, unit: str, index: int, keys: List[str]):
+        self.source = source
+        self.unit = unit
+        self.index = index
+        self.keys = keys
+
+    def __str__(self):
+        return f"{self.source}/{self.unit}/{self.index}"
+
+
+def parse_chunk(chunk: Chunk, shared_argv: Dict[str, Any], private_argv: Dict[str, Any],
+                logger: Logger, save_queue=None):
+    source = shared_argv["source"]  # type: Source
+    begin = time.time()
+    parsed = 0
+    for key in chunk.keys:
+        try:
+            document = source.parse(chunk.unit, key, logger)
+        except Exception as e:
+            logger.error(f"Failed to reparse {chunk.unit} {key}, Exception: {e}")
+            continue
+        if document:
+            save_queue.put(document)
+            parsed += 1
+    elapsed = max(time.time() - begin, 1e-6)
+    counter = shared_argv["pages"]
+    with counter.get_lock():
+        counter.value += len(chunk.keys)
+        total = counter.value
+    total_elapsed = max(time.time() - shared_argv["started"], 1e-6)
+    logger.info("Reparsed %s: %d/%d pages, %.1f pages/s (%d pages in total, %.1f pages/s)",
+                chunk, parsed, len(chunk.keys), len(chunk.keys) / elapsed,
+                total, total / total_elapsed)
+
+
+class reparseCrawler(Crawler):
+    """Re-runs the parser of a source over its stored raw pages, e.g. after
+    a selector fix. Every unit (board, office or kin directory) is a task,
+    split into chunks of chunk_size pages that idle workers take, so a few
+    large units do not leave the other workers waiting"""
+
+    def __init__(self, **kwargs):
+        super(reparseCrawler, self).__init__()
+        self.save_id = "reparsed"
+        self.save_dir = "data/reparsed"
+
+    def load_configuration(self, config_file: str):
+        with open(config_file, "r") as file:
+            data_dict = yaml.safe_load(file)
+
+        name = data_dict["source"]
+        if name not in SOURCES:
+            raise ValueError(f"Unknown source {name}, expected one of {sorted(SOURCES)}")
+        if name == NaverNewsSource.name:
+            offices = navernews_util.build_office_dictionary()
+            source = NaverNewsSource({oid: office for office, oid in offices.items()})
+        else:
+            source = SOURCES[name]()
+        self.save_id = data_dict.get("save_id", f"{name}_reparsed")
+        self.save_dir = data_dict.get("save_dir", os.path.join("data/reparsed", name))
+
+        workers = data_dict.get("workers") or mp.cpu_count()
+        private_args = [{"ip": f"reparse{i}"} for i in range(workers)]
+        shared_argv = {
+            "source": source,
+            "chunk_size": data_dict.get("chunk_size", 1000),
+            "pages": mp.Value("q", 0),
+            "started": time.time(),
+        }
+        tasks = []
+        if self.build_tasks:
+            tasks = source.list_units(data_dict.get("units"))
+        return tasks, shared_argv, private_args
+
+    def worker_routine(self, unit: str, shared_argv: Dict[str, Any], private_argv: Dict[str, Any],
+                       logger: Logger, save_queue=None):
+        source = shared_argv["source"]  # type: Source
+        chunk_size = shared_argv["chunk_size"]
+        keys = source.list_keys(unit)
+        chunks = [Chunk(source.name, unit, index, keys[begin:begin + chunk_size])
+                  for index, begin in enumerate(range(0, len(keys), chunk_size))]
+        logger.info("Reparsing %s: %d pages in %d chunks", unit, len(keys), len(chunks))
+        scheduler = shared_argv.get("scheduler")
+        if scheduler is None or len(chunks) <= 1:
+            for chunk in chunks:
+                parse_chunk(chunk, shared_argv, private_argv, logger, save_queue=save_queue)
+            return
+        scheduler.submit([Subtask(parse_chunk, chunk, cost=len(chunk.keys))
+                          for chunk in chunks])
@@ -0,0 +1,139 @@
+"""Stored raw pages of each source and the parser that turns them into documents.
+
+A unit is a directory of raw pages, parsed as one downloader task:
+
+    navercafe   data/navercafe/{cafe}/{board}     json_files/{aid}.json[.gz]
+    daumcafe    data/daumcafe/{cafe}/{board}      htmls/{aid}.html[.gz]
+    navernews   data/navernews/{oid}              htmls/{aid}.html
+    kin         data/kin/{dirId}                  {docId}.html
+
+Pages are read through the same structs the crawlers use, so pages packed
+into the unit's archive and pages in the per-file layout are both found.
+"""
+import os
+import glob
+from logging import Logger
+from typing import Dict, List, Optional
+
+from util.archive import ARCHIVE_DIR, get_archive, has_archive
+from util.htmlparse import make_soup
+from navercafe.structs import Cafe as NaverCafe, Board as NaverBoard, Article as NaverArticle
+from navercafe.handler import parse_article_json
+from daumcafe.structs import Cafe as DaumCafe, Board as DaumBoard, Article as DaumArticle
+from daumcafe.parser import parse_article
+from navernews.navernewsparser import parse_navernews_soup, comment_ptrn
+from navernews.navernews_util import read_cached_html
+from kin.structs import Document
+from kin.parser import parse_html
+
+
+def list_keys(unit: str, file_dir: str, extensions) -> List[str]:
+    """Keys of the pages in the unit archive and in file_dir, sorted"""
+    keys = set()
+    archive_dir = os.path.join(unit, ARCHIVE_DIR)
+    if has_archive(archive_dir):
+        keys.update(get_archive(archive_dir).keys())
+    if os.path.isdir(file_dir):
+        with os.scandir(file_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(extensions):
+                    keys.add(entry.name.split(".", 1)[0])
+    return sorted(keys)
+
+
+class Source:
+    name = None  # type: str
+    pattern = None  # type: str
+
+    def list_units(self, selected: Optional[List[str]] = None) -> List[str]:
+        """Unit directories, optionally only those whose first path
+        component after the source (cafe, oid, dirId) is selected"""
+        units = [path for path in sorted(glob.glob(self.pattern))
+                 if os.path.isdir(path) and os.path.basename(path) != ARCHIVE_DIR]
+        if selected:
+            selected = {str(name) for name in selected}
+            units = [path for path in units
+                     if path.split(os.sep)[2] in selected]
+        return units
+
+    def list_keys(self, unit: str) -> List[str]:
+        raise NotImplementedError
+
+    def parse(self, unit: str, key: str, logger: Logger) -> Optional[str]:
+        """Returns the document of a page as a json line, or None"""
+        raise NotImplementedError
+
+
+class NaverCafeSource(Source):
+    name = "navercafe"
+    pattern = "data/navercafe/*/*"
+
+    def list_keys(self, unit):
+        return list_keys(unit, os.path.join(unit, "json_files"), (".json", ".json.gz"))
+
+    def parse(self, unit, key, logger):
+        _, _, cafeid, bid = unit.split(os.sep)
+        article = NaverArticle(NaverBoard(NaverCafe(cafeid), bid, ""), key)
+        json_message = article.read_json()
+        if json_message is None:
+            return None
+        result = parse_article_json(article, json_message, logger)
+        return None if result is None else result.to_json()
+
+
+class DaumCafeSource(Source):
+    name = "daumcafe"
+    pattern = "data/daumcafe/*/*"
+
+    def list_keys(self, unit):
+        return list_keys(unit, os.path.join(unit, "htmls"), (".html", ".html.gz"))
+
+    def parse(self, unit, key, logger):
+        _, _, cafeid, bid = unit.split(os.sep)
+        article = DaumArticle(DaumBoard(DaumCafe(cafeid), bid, "", ""), key)
+        html = article.load_from_file()
+        if html is None:
+            return None
+        parse_article(article, make_soup(html), logger)
+        return article.to_json()
+
+
+class NaverNewsSource(Source):
+    name = "navernews"
+    pattern = "data/navernews/*"
+    offices = None  # type: Dict[str, str]
+
+    def __init__(self, offices: Optional[Dict[str, str]] = None):
+        # oid -> office name
+        self.offices = offices or {}
+
+    def list_keys(self, unit):
+        return list_keys(unit, os.path.join(unit, "htmls"), (".html",))
+
+    def parse(self, unit, key, logger):
+        oid = os.path.basename(unit)
+        html = read_cached_html(oid, key)
+        if not html:
+            return None
+        soup = make_soup(comment_ptrn.sub("", html))
+        return parse_navernews_soup(soup, logger, self.offices.get(oid, oid)) or None
+
+
+class KinSource(Source):
+    name = "kin"
+    pattern = "data/kin/*"
+
+    def list_keys(self, unit):
+        return list_keys(unit, unit, (".html",))
+
+    def parse(self, unit, key, logger):
+        document = Document(os.path.basename(unit), key)
+        html = document.read_html()
+        if html is None:
+            return None
+        document = parse_html(html, document)
+        return None if document is None else document.to_json()
+
+
+SOURCES = {source.name: source for source in
+           (NaverCafeSource, DaumCafeSource, NaverNewsSource, KinSource)}
@@ -0,0 +1,90 @@
+"""Packs raw documents stored one file per document into archives.
+
+    python scripts/archive/convert_to_archive.py --source navercafe
+    python scripts/archive/convert_to_archive.py --source daumcafe --remove
+
+navercafe   data/navercafe/{cafe}/{board}/json_files/{aid}.json[.gz]
+daumcafe    data/daumcafe/{cafe}/{board}/htmls/{aid}.html[.gz]
+navernews   data/navernews/{oid}/htmls/{aid}.html
+kin         data/kin/{dirId}/{docId}.html
+naverblog   data/naverblog/html/{blogid}/{logNo}.html, postlist_{page}.html
+
+The files of a directory go into the archive next to it, keyed by the file
+name without extensions. Files already in the archive are skipped, so the
+conversion can be interrupted and run again. With --remove, converted files
+are deleted.
+"""
+import os
+import sys
+import glob
+import gzip
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from util.archive import ARCHIVE_DIR, Archive
+
+# source -> (pattern of the directories holding files, extensions,
+#            whether the archive is in the parent of the directory)
+SOURCES = {
+    "navercafe": ("data/navercafe/*/*/json_files", (".json", ".json.gz"), True),
+    "daumcafe": ("data/daumcafe/*/*/htmls", (".html", ".html.gz"), True),
+    "navernews": ("data/navernews/*/htmls", (".html",), True),
+    "kin": ("data/kin/*", (".html",), False),
+    "naverblog": ("data/naverblog/html/*", (".html",), False),
+}
+
+
+def read_file(path: str) -> bytes:
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def convert_dir(file_dir: str, extensions, archive_dir: str, remove: bool) -> int:
+    names = [name for name in os.listdir(file_dir) if name.endswith(extensions)]
+    if not names:
+        return 0
+    archive = Archive(archive_dir)
+    count = 0
+    for name in sorted(names):
+        key = name.split(".", 1)[0]
+        path = os.path.join(file_dir, name)
+        if key not in archive:
+            try:
+                archive.put(key, read_file(path))
+            except (OSError, EOFError) as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            count += 1
+        if remove:
+            os.remove(path)
+    archive.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=sorted(SOURCES), required=True)
+    parser.add_argument("--remove", action="store_true",
+                        help="Delete files once they are in the archive")
+    args = parser.parse_args()
+
+    pattern, extensions, in_parent = SOURCES[args.source]
+    total = 0
+    for file_dir in sorted(glob.glob(pattern)):
+        if not os.path.isdir(file_dir) or os.path.basename(file_dir) == ARCHIVE_DIR:
+            continue
+        parent = os.path.dirname(file_dir) if in_parent else file_dir
+        count = convert_dir(file_dir, extensions, os.path.join(parent, ARCHIVE_DIR),
+                            args.remove)
+        if count:
+            print(f"{file_dir}: {count} files")
+        total += count
+    print(f"Converted {total} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares serial fetching with AsyncFetcher against a local mock server.
+
+The server answers every GET after --latency seconds. The serial path sleeps
+--interval before each request like get_html does; the async path keeps
+--concurrency requests in flight and spaces their starts with a TokenBucket.
+
+    python scripts/benchmark/async_fetch.py --requests 40 --latency 0.3 --interval 0.1
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from util.aio import AsyncFetcher
+from util.connection import ConnectionPool
+from util.ratelimit import TokenBucket
+
+
+def make_handler(latency, body):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.3,
+                        help="seconds the server takes per response")
+    parser.add_argument("--interval", type=float, default=0.1,
+                        help="politeness interval between request starts")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[2, 4, 8])
+    parser.add_argument("--size", type=int, default=32 * 1024)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(args.latency, b"x" * args.size))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    netloc = f"127.0.0.1:{server.server_address[1]}"
+    pool = ConnectionPool(
+        connection_factory=lambda netloc, ip: http.client.HTTPConnection(netloc))
+
+    def fetch(i):
+        resp, data = pool.request(netloc, f"/article/{i}", {})
+        return len(data)
+
+    begin = time.perf_counter()
+    for i in range(args.requests):
+        time.sleep(args.interval)
+        fetch(i)
+    elapsed = time.perf_counter() - begin
+    print(f"{'serial':>14}: {elapsed:.2f}s ({args.requests / elapsed:.1f} req/s)")
+
+    for concurrency in args.concurrency:
+        fetcher = AsyncFetcher(concurrency, TokenBucket.from_interval(args.interval))
+        begin = time.perf_counter()
+        results = fetcher.map(fetch, range(args.requests))
+        elapsed = time.perf_counter() - begin
+        fetcher.close()
+        assert all(result == args.size for result in results)
+        print(f"{f'concurrency {concurrency}':>14}: {elapsed:.2f}s "
+              f"({args.requests / elapsed:.1f} req/s)")
+
+    print(f"pool: {pool.stats()}")
+    pool.close_all()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Startup filtering of a synthetic daumcafe cafe list: line counts vs board meta.
+
+Creates --cafes finished cafes of --boards boards, each with an aids.txt of
+--articles ids and a board.jsonl holding a document of about --doc-bytes per
+article, as earlier versions left them. Then filters the cafe list as
+daumcafeCrawler._build_cafelist does, first with the old check (reads
+aids.txt and counts the board.jsonl lines of every board), then with
+daumcafe.checker: once recording the finished boards, then reading board.json
+only.
+
+    python scripts/benchmark/daumcafe_startup.py --cafes 1000 --boards 10
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+import daumcafe.checker as dchecker
+from daumcafe.structs import Cafe, Board, Article
+from daumcafe.cache import (
+    read_cafe_cachefile,
+    read_board_cachefile,
+    write_cafe_cachefile,
+    write_articlelist_cachefile,
+)
+
+
+def make_cafes(count, boards, articles, doc_bytes):
+    document = '{"text": "%s"}\n' % ("x" * doc_bytes)
+    cids = []
+    for c in range(count):
+        cafe = Cafe(f"cafe{c}")
+        boardlist = [Board(cafe, f"B{b}", "normal", f"board {b}") for b in range(boards)]
+        write_cafe_cachefile(cafe, boardlist)
+        for board in boardlist:
+            write_articlelist_cachefile(
+                board, [Article(board, str(aid)) for aid in range(articles, 0, -1)])
+            os.makedirs(os.path.dirname(board.board_jsonl_savepath), exist_ok=True)
+            with open(board.board_jsonl_savepath, "w", encoding="utf-8") as f:
+                f.write(document * articles)
+        cids.append(cafe.cafeid)
+    return cids
+
+
+def legacy_is_processed(cafe):
+    """The check before board.json, reading every board.jsonl"""
+    if not os.path.isfile(cafe.boardlist_cache):
+        return False
+    for board in read_cafe_cachefile(cafe):
+        if not os.path.isfile(board.board_jsonl_savepath):
+            return False
+        with open(board.board_jsonl_savepath, "r", encoding="utf-8") as f:
+            line_count = len(f.readlines())
+        if len(read_board_cachefile(board)) != line_count:
+            return False
+    return True
+
+
+def filter_cafes(cids, is_processed):
+    begin = time.perf_counter()
+    cafes = [cafe for cafe in map(Cafe, cids) if not is_processed(cafe)]
+    return time.perf_counter() - begin, cafes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cafes", type=int, default=300)
+    parser.add_argument("--boards", type=int, default=10)
+    parser.add_argument("--articles", type=int, default=200,
+                        help="articles per board")
+    parser.add_argument("--doc-bytes", type=int, default=2000)
+    parser.add_argument("--dir", default=None, help="where to build the cafes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        os.chdir(tmp)
+        begin = time.perf_counter()
+        cids = make_cafes(args.cafes, args.boards, args.articles, args.doc_bytes)
+        print(f"built {args.cafes} cafes x {args.boards} boards x {args.articles} articles "
+              f"({time.perf_counter() - begin:.1f}s)")
+
+        for name, is_processed in [("lines", legacy_is_processed),
+                                   ("migrate", dchecker.is_processed),
+                                   ("meta", dchecker.is_processed)]:
+            elapsed, left = filter_cafes(cids, is_processed)
+            assert not left
+            print(f"{name:>8}: {elapsed:7.2f}s  {len(cids) / elapsed:10,.0f} cafes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Extraction time and output of each source's parser, before and after
+util.htmlparse: html.parser on the whole page vs make_soup.
+
+    navercafe   navercafe.handler.extract_text on the article contentHtml
+    kin         kin.parser.parse_html, whole page vs #content only
+
+Pages are the saved pages under data/ (archives and per-file layout, read as
+in the reparse task), at most --pages per source, or the pages of
+tests/data/html repeated --repeat times when there are none. Pages whose
+output differs are counted and the first few are listed.
+
+    python scripts/benchmark/html_parsing.py --source navercafe --pages 2000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from util import htmlparse
+import kin.parser as kparser
+from kin.structs import Document
+from navercafe.handler import extract_text
+from navercafe.structs import Cafe, Board, Article
+from reparse.sources import SOURCES
+
+FIXTURE_DIR = os.path.join("tests", "data", "html")
+
+
+class Page:
+    pass
+
+
+def saved_pages(source, limit):
+    pages = []
+    handler = SOURCES[source]()
+    for unit in handler.list_units():
+        for key in handler.list_keys(unit):
+            if len(pages) >= limit:
+                return pages
+            if source == "navercafe":
+                _, _, cafeid, bid = unit.split(os.sep)
+                message = Article(Board(Cafe(cafeid), bid, ""), key).read_json()
+                html = ((message or {}).get("article") or {}).get("contentHtml")
+            else:
+                html = Document(os.path.basename(unit), key).read_html()
+            if html:
+                pages.append(html)
+    return pages
+
+
+def fixture_pages(source, repeat):
+    pages = []
+    for name in sorted(os.listdir(FIXTURE_DIR)):
+        if name.startswith(source) and name.endswith(".html"):
+            with open(os.path.join(FIXTURE_DIR, name), "r", newline="") as f:
+                pages.append(f.read())
+    return pages * repeat
+
+
+def navercafe_parse(html):
+    return extract_text(html)
+
+
+def kin_parse(html):
+    document = kparser.parse_html(html, Page())
+    if document is None:
+        return None
+    return (document.title, document.question, document.question_badges, document.answers)
+
+
+def run(parse, pages):
+    begin = time.perf_counter()
+    outputs = [parse(html) for html in pages]
+    return time.perf_counter() - begin, outputs
+
+
+def baseline():
+    """Sets the module state the code had before util.htmlparse"""
+    os.environ[htmlparse.BACKEND_ENV] = htmlparse.HTML_PARSER
+    kparser.CONTENT = None
+
+
+def current(strainer):
+    os.environ.pop(htmlparse.BACKEND_ENV, None)
+    kparser.CONTENT = strainer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["navercafe", "kin"], default="navercafe")
+    parser.add_argument("--pages", type=int, default=1000,
+                        help="Saved pages to parse at most")
+    parser.add_argument("--repeat", type=int, default=200,
+                        help="Times to repeat the test pages when there are no saved pages")
+    args = parser.parse_args()
+
+    pages = saved_pages(args.source, args.pages)
+    origin = "saved"
+    if not pages:
+        pages = fixture_pages(args.source, args.repeat)
+        origin = "test"
+    size = sum(len(html) for html in pages)
+    print(f"{args.source}: {len(pages)} {origin} pages, {size / len(pages) / 1024:.1f} KiB/page")
+
+    parse = navercafe_parse if args.source == "navercafe" else kin_parse
+    fast = sum(not htmlparse.diverges(html) for html in pages)
+    print(f"  {fast} pages without markup lxml parses differently")
+
+    strainer = kparser.CONTENT
+    baseline()
+    before, expected = run(parse, pages)
+    current(strainer)
+    after, outputs = run(parse, pages)
+    print(f"  html.parser  {before:.2f}s  {len(pages) / before:.0f} pages/s")
+    print(f"  make_soup    {after:.2f}s  {len(pages) / after:.0f} pages/s"
+          f"  (backend {htmlparse.default_backend()}, x{before / after:.2f})")
+
+    mismatches = [index for index, (a, b) in enumerate(zip(expected, outputs)) if a != b]
+    print(f"  {len(mismatches)} pages with different output")
+    for index in mismatches[:5]:
+        print(f"    page {index}: {expected[index]!r:.200} != {outputs[index]!r:.200}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Bytes written per board page: legacy boardcache.json vs the SQLite store.
+
+Replays the cache writes handle_board makes for a board of --pages pages
+with 50 article ids each. The legacy writer rewrote the whole indented
+boardcache.json twice per page (listed, then done). The store writes one
+page row, then flips its done flag. Bytes are the write() totals of this
+process (/proc/self/io wchar), so they include the SQLite WAL.
+
+    python scripts/benchmark/navercafe_state.py --pages 1000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+import navercafe.cache as ncache
+
+
+def written_bytes():
+    with open("/proc/self/io") as f:
+        for line in f:
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    raise RuntimeError("wchar is not reported")
+
+
+def make_page(page):
+    first = 10_000_000 - page * 50
+    return {"page": page, "articles": [str(first - i) for i in range(50)]}
+
+
+def legacy_board(path, pages):
+    status = {"member_only": False, "pages": []}
+    for page in range(1, pages + 1):
+        entry = make_page(page)
+        status["pages"].append(entry)
+        for _ in range(2):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(status, ensure_ascii=False, indent=2))
+            entry["done"] = True
+
+
+def store_board(key, pages):
+    ncache.write_payload(key, {"member_only": False}, board=True)
+    store = ncache.get_store()
+    for page in range(1, pages + 1):
+        entry = make_page(page)
+        store.write_page(key, entry)
+        store.set_page_done(key, page)
+
+
+def measure(name, function, pages):
+    before = written_bytes()
+    begin = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - begin
+    written = written_bytes() - before
+    print(f"{name:>8}: {written / 2 ** 20:10.1f} MiB written, "
+          f"{written / pages / 1024:8.1f} KiB/page, {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ncache.STATE_DB = os.path.join(tmp, "state.db")
+        ncache.get_store()
+        measure("json", lambda: legacy_board(
+            os.path.join(tmp, "boardcache.json"), args.pages), args.pages)
+        measure("sqlite", lambda: store_board("cafe/1", args.pages), args.pages)
+        pages = ncache.get_store().read_pages("cafe/1")
+        assert len(pages) == args.pages and all(page["done"] for page in pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Resume check of a synthetic navercafe board: file stats vs processed index.
+
+Creates --articles ids of which --processed are processed: most as empty
+json_files/{aid}.json.gz files, the oldest ones listed in a legacy
+cache/{bid}_{batch}.txt file. Then checks every id the old way (two stats
+plus the batch cache lookup) and with navercafe.index (one scan to build,
+then bisect over the memory-mapped index).
+
+    python scripts/benchmark/processed_index.py --articles 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import functools
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from navercafe.index import ProcessedIndex
+
+BATCH_SIZE = 100000
+
+
+def make_board(data_dir, ids, cached):
+    json_dir = os.path.join(data_dir, "json_files")
+    cache_dir = os.path.join(data_dir, "cache")
+    os.makedirs(json_dir)
+    os.makedirs(cache_dir)
+    batches = {}
+    for aid in cached:
+        batches.setdefault(aid // BATCH_SIZE, []).append(aid)
+    for batchid, aids in batches.items():
+        with open(os.path.join(cache_dir, f"board_{batchid}.txt"), "w") as f:
+            f.writelines(f"{aid}.json\n" for aid in aids)
+    for aid in ids:
+        open(os.path.join(json_dir, f"{aid}.json.gz"), "wb").close()
+
+
+def legacy_checker(data_dir):
+    @functools.lru_cache(maxsize=256)
+    def get_article_cache_content(batchid):
+        cache_path = os.path.join(data_dir, "cache", f"board_{batchid}.txt")
+        if not os.path.exists(cache_path):
+            return set()
+        with open(cache_path, "r") as f:
+            lines = f.readlines()
+        return set([int(line.split(".")[0].strip()) for line in lines])
+
+    def is_processed(aid):
+        json_path = os.path.join(data_dir, "json_files", f"{aid}.json")
+        return (os.path.exists(json_path)
+                or os.path.exists(json_path + ".gz")
+                or aid in get_article_cache_content(aid // BATCH_SIZE))
+
+    return is_processed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=1_000_000)
+    parser.add_argument("--processed", type=float, default=0.9,
+                        help="fraction of articles already processed")
+    parser.add_argument("--cached", type=float, default=0.1,
+                        help="fraction of processed ids only in cache/*.txt")
+    parser.add_argument("--dir", default=None, help="where to build the board")
+    args = parser.parse_args()
+
+    ids = list(range(10_000_000, 10_000_000 + args.articles))
+    processed = ids[:int(len(ids) * args.processed)]
+    split = int(len(processed) * args.cached)
+    cached, files = processed[:split], processed[split:]
+    queries = ids[:]
+    random.Random(0).shuffle(queries)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        data_dir = os.path.join(tmp, "board")
+        begin = time.perf_counter()
+        make_board(data_dir, files, cached)
+        print(f"built board: {len(files)} files, {len(cached)} cached ids "
+              f"({time.perf_counter() - begin:.1f}s)")
+
+        is_processed = legacy_checker(data_dir)
+        begin = time.perf_counter()
+        legacy = sum(is_processed(aid) for aid in queries)
+        elapsed = time.perf_counter() - begin
+        print(f"{'stat':>8}: {elapsed:7.2f}s  {len(queries) / elapsed:12,.0f} checks/s")
+
+        begin = time.perf_counter()
+        index = ProcessedIndex(data_dir)
+        built = time.perf_counter() - begin
+        begin = time.perf_counter()
+        found = sum(aid in index for aid in queries)
+        elapsed = time.perf_counter() - begin
+        print(f"{'index':>8}: {elapsed:7.2f}s  {len(queries) / elapsed:12,.0f} checks/s "
+              f"(+{built:.2f}s first build, "
+              f"{os.path.getsize(index.index_path) / 2 ** 20:.1f} MiB)")
+
+        begin = time.perf_counter()
+        index.close()
+        index = ProcessedIndex(data_dir)
+        print(f"{'reopen':>8}: {time.perf_counter() - begin:7.4f}s")
+        index.close()
+        assert legacy == found == len(processed)
+
+
+if __name__ == "__main__":
+    main()
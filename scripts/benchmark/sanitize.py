@@ -0,0 +1,91 @@
+"""Compares surrogate scrubbing implementations over saved documents.
+
+Reads jsonl shards (plain, .gz or .zst) and times each implementation on the
+raw document lines, the way the saver sees them.
+
+    python scripts/benchmark/sanitize.py data/navercafe/*.jsonl --limit 20000
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from util import compression as codec
+from util.sanitize import replace_surrogates, encode_utf8
+
+
+def legacy_generator(s, placeholder='�'):
+    return ''.join(c if not (0xD800 <= ord(c) <= 0xDFFF) else placeholder for c in s)
+
+
+LEGACY_PATTERN = r'[\ud800-\udbff\udc00-\udfff]'
+
+
+def legacy_regex(s):
+    return re.sub(LEGACY_PATTERN, '', s)
+
+
+def guess_compression(path):
+    for name, ext in codec.EXTENSIONS.items():
+        if ext and path.endswith(ext):
+            return name
+    return codec.NONE
+
+
+def load_documents(paths, limit, dirty_every):
+    documents = []
+    for path in paths:
+        with codec.open_stream(path, guess_compression(path)) as f:
+            for line in f:
+                document = line.decode("utf-8", "surrogatepass").rstrip("\n")
+                # saved shards are already clean; put a lone surrogate back
+                # into some documents to exercise the slow path
+                if dirty_every and len(documents) % dirty_every == 0:
+                    middle = len(document) // 2
+                    document = document[:middle] + "\ud800" + document[middle:]
+                documents.append(document)
+                if len(documents) >= limit:
+                    return documents
+    return documents
+
+
+def measure(function, documents, repeat):
+    best = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        for document in documents:
+            function(document)
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="jsonl shards to read documents from")
+    parser.add_argument("--limit", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dirty-every", type=int, default=100,
+                        help="insert a lone surrogate into every n-th document, 0 to disable")
+    args = parser.parse_args()
+
+    documents = load_documents(args.paths, args.limit, args.dirty_every)
+    total_bytes = sum(len(d.encode("utf-8", "surrogatepass")) for d in documents)
+    print(f"{len(documents)} documents, {total_bytes / 1e6:.1f} MB")
+
+    candidates = [
+        ("legacy generator + encode", lambda s: legacy_generator(s).encode("utf-8")),
+        ("legacy re.sub", legacy_regex),
+        ("replace_surrogates", replace_surrogates),
+        ("encode_utf8", encode_utf8),
+    ]
+    for name, function in candidates:
+        elapsed = measure(function, documents, args.repeat)
+        print(f"{name:>26}: {elapsed:.3f}s ({total_bytes / elapsed / 1e6:,.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measures documents/sec through the engine saver path for each queue transport.
+
+Producer processes stand in for crawler workers and push synthetic article
+JSON through Engine.save_queue. The clock stops once the saver has written
+every document and exited.
+
+    python scripts/benchmark/saver_transport.py --producers 32 --documents 20000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import multiprocessing as mp
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from engine.engine import Engine
+from engine.transport import TRANSPORTS
+
+
+def make_document(index, size):
+    payload = {
+        "title": f"제목 {index}",
+        "text": ("가나다라마바사 " * (size // 8 + 1))[:size],
+        "uri": f"https://m.cafe.naver.com/bench/{index}",
+        "type": "benchmark",
+    }
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def producer(save_queue, start, count, size):
+    for i in range(start, start + count):
+        save_queue.put(make_document(i, size))
+
+
+def run(transport, producers, documents, size, savers):
+    save_dir = tempfile.mkdtemp(prefix=f"bench-{transport}-")
+    try:
+        engine = Engine(use_saver=True, task_name=f"bench-{transport}",
+                        transport=transport)
+        engine.launch_savers(f"bench-{transport}", save_dir, count=savers)
+        per_producer = documents // producers
+
+        begin = time.perf_counter()
+        processes = [
+            mp.Process(target=producer, args=(
+                engine.save_queue, k * per_producer, per_producer, size))
+            for k in range(producers)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        engine.stop_savers()
+        for saver in engine.savers:
+            saver.join()
+        elapsed = time.perf_counter() - begin
+
+        written = per_producer * producers
+        return written, elapsed
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--producers", type=int, default=8)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=4096,
+                        help="characters of text per document")
+    parser.add_argument("--savers", type=int, default=1)
+    parser.add_argument("--transport", nargs="*", default=TRANSPORTS)
+    args = parser.parse_args()
+
+    for transport in args.transport:
+        written, elapsed = run(transport, args.producers,
+                               args.documents, args.size, args.savers)
+        print(f"{transport:>8}: {written} docs in {elapsed:.2f}s "
+              f"({written / elapsed:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
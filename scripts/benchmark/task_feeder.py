@@ -0,0 +1,88 @@
+"""Time to the first task of a synthetic daumcafe run: serial filtering vs feeders.
+
+Creates --cafes cafes of --boards boards left unfinished by earlier versions
+(a board.jsonl one document short of aids.txt), so checking a cafe counts
+the lines of its first board.jsonl. Then starts an engine the way downloader.py did,
+filtering the cafe list in the master before queuing it, and the way it does
+now, with Engine.launch_feeders. Workers only record when they get a task.
+
+    python scripts/benchmark/task_feeder.py --cafes 300 --articles 1000 --feeders 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from engine.engine import Engine
+from daumcafe.checker import is_pending
+from daumcafe.structs import Cafe, Board, Article
+from daumcafe.cache import write_cafe_cachefile, write_articlelist_cachefile
+
+
+def make_cafes(count, boards, articles, doc_bytes):
+    document = '{"text": "%s"}\n' % ("x" * doc_bytes)
+    cids = []
+    for c in range(count):
+        cafe = Cafe(f"cafe{c}")
+        boardlist = [Board(cafe, f"B{b}", "normal", f"board {b}") for b in range(boards)]
+        write_cafe_cachefile(cafe, boardlist)
+        for board in boardlist:
+            write_articlelist_cachefile(
+                board, [Article(board, str(aid)) for aid in range(articles, 0, -1)])
+            os.makedirs(os.path.dirname(board.board_jsonl_savepath), exist_ok=True)
+            with open(board.board_jsonl_savepath, "w", encoding="utf-8") as f:
+                f.write(document * (articles - 1))
+        cids.append(cafe.cafeid)
+    return cids
+
+
+def record_start(cafe, shared_argv, private_argv, logger, save_queue=None):
+    shared_argv["started"].put(time.time())
+
+
+def run(cids, feeders):
+    begin = time.time()
+    engine = Engine(task_name="benchmark", transport="native")
+    started = engine.transport.make_queue()
+    engine.launch_workers(record_start, {"started": started},
+                          [{"ip": f"worker{i}"} for i in range(4)])
+    tasks = [Cafe(cid) for cid in cids]
+    if feeders:
+        engine.launch_feeders(tasks, is_pending, count=feeders)
+    else:
+        engine.enqueue_tasks([cafe for cafe in tasks if is_pending(cafe)])
+    engine.enqueue_stopwork()
+    while not engine.poll_routine():
+        time.sleep(0.1)
+    first = min(started.get() for _ in cids)
+    return first - begin, time.time() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cafes", type=int, default=300)
+    parser.add_argument("--boards", type=int, default=10)
+    parser.add_argument("--articles", type=int, default=200,
+                        help="articles per board")
+    parser.add_argument("--doc-bytes", type=int, default=2000)
+    parser.add_argument("--feeders", type=int, default=os.cpu_count())
+    parser.add_argument("--dir", default=None, help="where to build the cafes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        os.chdir(tmp)
+        begin = time.perf_counter()
+        cids = make_cafes(args.cafes, args.boards, args.articles, args.doc_bytes)
+        print(f"built {args.cafes} cafes x {args.boards} boards x {args.articles} articles "
+              f"({time.perf_counter() - begin:.1f}s)")
+
+        for name, feeders in [("serial", 0), (f"{args.feeders} feeders", args.feeders)]:
+            first, total = run(cids, feeders)
+            print(f"{name:>12}: first task after {first:6.2f}s, all tasks done after {total:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ from util.slack import send_slack_message
 def main():
     parser = ArgumentParser()
     parser.add_argument("--config", required=True, help="Configuration File")
+    parser.add_argument("--parsers", type=int, default=0,
+                        help="Parser processes parsing fetched pages, 0 parses in the workers")
 
     args = parser.parse_args()
     config_path = args.config
@@ -23,6 +25,8 @@ def main():
     os.makedirs(save_dir, exist_ok=True)
 
     engine = Engine(use_saver=True, task_name="kin")
+    if args.parsers > 0:
+        engine.launch_parsers(args.parsers)
     engine.launch_workers(handle_user, shared_argv, private_args)
 
     engine.enqueue_tasks(users)
@@ -0,0 +1,39 @@
+"""Prints the task counts of a downloader.py ledger and its failed tasks.
+
+    python scripts/ledger/show_ledger.py cache/ledger/navercafe.db
+
+Failed tasks are retried with downloader.py --ledger ... --retry-failed [PATTERN].
+"""
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from engine.ledger import TaskLedger, TASK, SUBTASK
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ledger")
+    parser.add_argument("--failures", type=int, default=20,
+                        help="Number of failed tasks to list")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.ledger):
+        print(f"No ledger at {args.ledger}")
+        return
+    ledger = TaskLedger(args.ledger)
+    for kind in (TASK, SUBTASK):
+        counts = ledger.counts(kind)
+        print(f"{kind:>8}: " + "  ".join(f"{state} {count}"
+                                         for state, count in counts.items()))
+    failures = ledger.failures()
+    if failures:
+        print(f"{len(failures)} failed:")
+    for key, attempts, error in failures[:args.failures]:
+        print(f"  {key}  (attempts {attempts})  {error}")
+
+
+if __name__ == "__main__":
+    main()
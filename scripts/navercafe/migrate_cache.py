@@ -0,0 +1,77 @@
+"""Imports the legacy navercafe JSON caches into cache/navercafe/state.db.
+
+    cache/navercafe/{cafeid}/cafecache.json        -> status row {cafeid}
+    cache/navercafe/{cafeid}/{bid}/boardcache.json -> status row {cafeid}/{bid}
+                                                      and one row per page
+
+Rows already in the store are newer than the files and are kept unless
+--force is given. The crawler imports a missing row on first read as well,
+so running this is optional; it avoids the import cost during a crawl.
+
+    python scripts/navercafe/migrate_cache.py [--remove]
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+import navercafe.cache as ncache
+from navercafe.structs import CACHE_BASE
+
+CAFE_CACHE = "cafecache.json"
+BOARD_CACHE = "boardcache.json"
+
+
+def iter_legacy_files(cache_dir):
+    """Yields (key, path, is_board) of every legacy cache file"""
+    for cafeid in sorted(os.listdir(cache_dir)):
+        cafe_dir = os.path.join(cache_dir, cafeid)
+        if not os.path.isdir(cafe_dir):
+            continue
+        cafe_cache = os.path.join(cafe_dir, CAFE_CACHE)
+        if os.path.isfile(cafe_cache):
+            yield cafeid, cafe_cache, False
+        for bid in sorted(os.listdir(cafe_dir)):
+            board_cache = os.path.join(cafe_dir, bid, BOARD_CACHE)
+            if os.path.isfile(board_cache):
+                yield f"{cafeid}/{bid}", board_cache, True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-dir", default=CACHE_BASE)
+    parser.add_argument("--force", action="store_true",
+                        help="Overwrite rows already in the store")
+    parser.add_argument("--remove", action="store_true",
+                        help="Delete each JSON file once it is imported")
+    args = parser.parse_args()
+
+    ncache.STATE_DB = os.path.join(args.cache_dir, "state.db")
+    store = ncache.get_store()
+    imported = skipped = failed = 0
+    json_bytes = 0
+    for key, path, is_board in iter_legacy_files(args.cache_dir):
+        if not args.force and store.read_status(key) is not None:
+            skipped += 1
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.loads(f.read())
+        except ValueError as e:
+            print(f"Failed to read {path}: {e}")
+            failed += 1
+            continue
+        ncache.write_payload(key, payload, board=is_board)
+        json_bytes += os.path.getsize(path)
+        imported += 1
+        if args.remove:
+            os.remove(path)
+
+    print(f"imported {imported}, skipped {skipped}, failed {failed} "
+          f"({json_bytes / 2 ** 20:.1f} MiB of JSON) into {ncache.STATE_DB}")
+
+
+if __name__ == "__main__":
+    main()
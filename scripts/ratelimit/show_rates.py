@@ -0,0 +1,34 @@
+"""Prints the request rates learned per ip and host.
+
+Workers persist their adaptive rates to cache/ratelimit/{ip}.json; running
+crawls refresh the files at least once a minute.
+
+    python scripts/ratelimit/show_rates.py
+"""
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from util.ratelimit import RATELIMIT_CACHE_DIR, read_rates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-dir", default=RATELIMIT_CACHE_DIR)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"No rates recorded in {args.cache_dir}")
+        return
+    for name in sorted(os.listdir(args.cache_dir)):
+        if not name.endswith(".json"):
+            continue
+        ip = name[:-len(".json")]
+        for host, rate in sorted(read_rates(os.path.join(args.cache_dir, name)).items()):
+            print(f"{ip:>16}  {host:<28} {rate:8.3f} req/s  ({1 / rate:.2f}s interval)")
+
+
+if __name__ == "__main__":
+    main()
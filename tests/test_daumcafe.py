@@ -10,6 +10,13 @@ from unittest.mock import Mock
 from util.connection import get_html
 from daumcafe.header import daumheader
 from daumcafe.handler import peek_article, build_board_articlelist, build_cafe_boardlist, handle_article
+import daumcafe.handler as dhandler
+import daumcafe.cache as dcache
+import daumcafe.checker as dchecker
+import json
+import os
+import time
+from urllib.parse import urlparse, parse_qs
 
 
 @pytest.fixture
@@ -119,3 +126,87 @@ def test_build_cafe_boardlist(cafe, dummy_logger):
     )
     assert len(boards) > 0
     assert all(isinstance(board, Board) for board in boards)
+
+
+def test_articlelist_refresh_fetches_newer_pages(tmp_path, monkeypatch, dummy_logger):
+    monkeypatch.chdir(tmp_path)
+    board = Board(cafe=Cafe(cafeid="test34563"), bid="WDZS", btype="normal", bname="Public Board")
+    # newest first, 20 articles per page
+    listing = [list(range(100, 40, -1))]
+    requested = []
+
+    def get_html(uri, headers, **kwargs):
+        if "common-articles" not in uri:
+            return 200, "<html></html>"
+        page = int(parse_qs(urlparse(uri).query)["targetPage"][0])
+        requested.append(page)
+        ids = listing[0][(page - 1) * 20:page * 20]
+        if not ids:
+            return 200, json.dumps({"code": 0})
+        return 200, json.dumps({"articles": [{"dataid": aid} for aid in ids]})
+
+    monkeypatch.setattr(dhandler, "get_html", get_html)
+    monkeypatch.setattr(dhandler, "extract_board_info", lambda soup: {"GRPID": "g", "FLDID": "f"})
+    monkeypatch.setattr(dhandler, "peek_article", lambda *args, **kwargs: True)
+
+    articles = dhandler.update_articlelist(board, "ip", dummy_logger)
+    assert [int(article.aid) for article in articles] == list(range(100, 40, -1))
+    assert requested == [1, 2, 3, 4]
+    meta = dcache.read_board_meta(board)
+    assert meta["complete"] and meta["newest"] == 100 and dcache.is_fresh(meta)
+
+    # a fresh list is read from the cache
+    requested.clear()
+    assert len(dhandler.update_articlelist(board, "ip", dummy_logger)) == 60
+    assert requested == []
+
+    # a stale list is refreshed with the pages holding newer articles only
+    listing[0] = list(range(125, 40, -1))
+    dcache.write_board_meta(board, {**meta, "listed": time.time() - dcache.FRESH_SECONDS - 1})
+    articles = dhandler.update_articlelist(board, "ip", dummy_logger)
+    assert requested == [1, 2, 3]
+    assert [int(article.aid) for article in articles] == list(range(125, 40, -1))
+    meta = dcache.read_board_meta(board)
+    assert meta["newest"] == 125 and dcache.is_fresh(meta)
+
+    # a list whose listing failed is built again
+    dcache.write_board_meta(board, {"listed": time.time(), "complete": False, "newest": None})
+    monkeypatch.setattr(dhandler, "get_html", lambda uri, headers, **kwargs: (500, None))
+    assert dhandler.update_articlelist(board, "ip", dummy_logger) == []
+    assert not dcache.read_board_meta(board)["complete"]
+
+
+def test_board_completion_meta(tmp_path, monkeypatch, dummy_logger):
+    monkeypatch.chdir(tmp_path)
+    cafe = Cafe(cafeid="test34563")
+    board = Board(cafe=cafe, bid="WDZS", btype="normal", bname="Public Board")
+    skipped = Board(cafe=cafe, bid="WDZT", btype="normal", bname="가입인사")
+    dcache.write_cafe_cachefile(cafe, [board, skipped])
+    articles = [Article(board, aid) for aid in ("3", "2")]
+    dcache.write_articlelist_cachefile(board, articles)
+    assert not dchecker.is_processed(board)
+
+    # boards finished by earlier versions are counted once, then recorded
+    os.makedirs(os.path.dirname(board.board_jsonl_savepath))
+    with open(board.board_jsonl_savepath, "w") as f:
+        f.write("{}\n{}")
+    assert dchecker.is_processed(board)
+    os.remove(board.board_jsonl_savepath)
+    assert dchecker.is_processed(board) and dchecker.is_processed(cafe)
+
+    # a refreshed list is processed once handle_board went through it
+    articles.insert(0, Article(board, "4"))
+    dcache.write_articlelist_cachefile(board, articles)
+    dcache.write_board_meta(board, dcache.listed_meta(articles, True, dcache.read_board_meta(board)))
+    assert not dchecker.is_processed(cafe)
+
+    def handle_article(article, *args, **kwargs):
+        article.text = "text"
+
+    monkeypatch.setattr(dhandler, "update_articlelist", lambda *args, **kwargs: articles)
+    monkeypatch.setattr(dhandler, "handle_article", handle_article)
+    save_queue = Mock()
+    dhandler.handle_board(board, "ip", 0, dummy_logger, save_queue)
+    assert save_queue.put.call_count == 3
+    assert dcache.read_board_meta(board)["finished"]["saved"] == 3
+    assert dchecker.is_processed(cafe)
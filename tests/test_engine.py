@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import signal
+import pytest
+from unittest.mock import Mock
+
+from engine.engine import Engine
+from engine.command import StopCommand
+from engine.scheduler import Subtask
+from engine.pipeline import submit_parse
+from engine import ledger as ledgerlib
+from engine.ledger import TaskLedger
+from engine.saver import JsonAggregator, read_manifest, read_frame
+from util import compression as codec
+
+
+@pytest.fixture
+def dummy_logger():
+    return Mock()
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # setup_logger writes into ./logs
+    monkeypatch.chdir(tmp_path)
+    yield
+
+
+def read_jsonl(save_dir, compression=codec.NONE):
+    lines = []
+    suffix = ".jsonl" + codec.EXTENSIONS[compression]
+    for name in sorted(os.listdir(save_dir)):
+        if not name.endswith(suffix):
+            continue
+        with codec.open_stream(os.path.join(save_dir, name), compression) as f:
+            data = f.read().decode("utf-8")
+        lines.extend(line for line in data.split("\n") if line)
+    return lines
+
+
+def test_aggregator_write_batch(tmp_path, dummy_logger):
+    aggregator = JsonAggregator(str(tmp_path), "test", dummy_logger)
+    aggregator.write_batch(['{"a": 1}', "", '{"a": 2}'])
+    aggregator.close()
+    assert read_jsonl(str(tmp_path)) == ['{"a": 1}', '{"a": 2}']
+
+
+@pytest.mark.parametrize("compression", [codec.NONE, codec.GZIP, codec.ZSTD])
+def test_aggregator_frames_and_manifest(tmp_path, dummy_logger, compression):
+    if compression == codec.ZSTD:
+        pytest.importorskip("zstandard")
+    documents = [json.dumps({"i": i, "text": "가나다라" * 20}, ensure_ascii=False)
+                 for i in range(25)]
+    aggregator = JsonAggregator(str(tmp_path), "test", dummy_logger,
+                                compression=compression, frame_documents=10)
+    aggregator.write_batch(documents)
+    aggregator.close()
+
+    assert read_jsonl(str(tmp_path), compression) == documents
+    shard = aggregator.save_filename
+    entries = read_manifest(shard + ".manifest")
+    assert [e["documents"] for e in entries] == [10, 10, 5]
+    assert [e["first_document"] for e in entries] == [0, 10, 20]
+    assert entries[-1]["offset"] + entries[-1]["length"] == os.path.getsize(shard)
+    assert read_frame(shard, entries[1], compression) == documents[10:20]
+
+    # a new aggregator keeps appending frames to the same shard
+    aggregator = JsonAggregator(str(tmp_path), "test", dummy_logger,
+                                compression=compression, frame_documents=10)
+    assert aggregator.save_filename == shard
+    aggregator.write_batch(documents[:3])
+    aggregator.close()
+    entries = read_manifest(shard + ".manifest")
+    assert entries[-1]["first_document"] == 25
+    assert read_jsonl(str(tmp_path), compression) == documents + documents[:3]
+
+
+def test_aggregator_rotates_on_written_bytes(tmp_path, dummy_logger):
+    aggregator = JsonAggregator(str(tmp_path), "test", dummy_logger,
+                                frame_documents=1, max_file_bytes=100)
+    aggregator.write_batch([json.dumps({"i": i, "pad": "x" * 40})
+                            for i in range(6)])
+    aggregator.close()
+    # each shard takes two frames to pass 100 bytes; the last one is opened empty
+    counts = [sum(e["documents"] for e in read_manifest(
+        os.path.join(tmp_path, f"test_{k:05d}.jsonl.manifest"))) for k in (1, 2, 3)]
+    assert counts == [2, 2, 2]
+    assert os.path.getsize(aggregator.save_filename) == 0
+    assert len(read_jsonl(str(tmp_path))) == 6
+
+
+@pytest.mark.parametrize("transport", ["manager", "native"])
+def test_saver_drains_queue(tmp_path, transport):
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    engine = Engine(use_saver=True, task_name="test", transport=transport)
+    engine.save_batch_size = 7
+    engine.launch_saver("test", str(save_dir))
+    for i in range(50):
+        engine.save_queue.put(json.dumps({"i": i}))
+    engine.save_queue.put(StopCommand())
+    engine.savers[0].join(timeout=30)
+    assert not engine.savers[0].is_alive()
+
+    lines = read_jsonl(str(save_dir))
+    assert [json.loads(line)["i"] for line in lines] == list(range(50))
+
+
+def test_sharded_savers_flush_every_shard(tmp_path):
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    engine = Engine(use_saver=True, task_name="test", transport="native")
+    engine.launch_savers("test", str(save_dir), count=3)
+    for i in range(300):
+        engine.save_queue.put(json.dumps({"i": i}))
+
+    # no workers are running, so poll_routine goes straight to draining savers
+    for _ in range(30):
+        if engine.poll_routine():
+            break
+    assert engine.savers == []
+
+    names = sorted(os.listdir(save_dir))
+    assert all(name.startswith(("test-0_", "test-1_", "test-2_"))
+               for name in names)
+    lines = read_jsonl(str(save_dir))
+    assert sorted(json.loads(line)["i"] for line in lines) == list(range(300))
+
+
+def parse_page(page, broken=None, logger=None):
+    if page % 10 == 0:
+        return None
+    if page == broken:
+        raise ValueError("broken page")
+    return json.dumps({"page": page})
+
+
+def fetch_pages(task, shared_argv, private_argv, logger, save_queue=None):
+    for page in range(task * 100, task * 100 + 100):
+        submit_parse(save_queue, logger, parse_page, page, broken=shared_argv["broken"])
+
+
+@pytest.mark.parametrize("parsers", [0, 2])
+def test_parsers_feed_savers(tmp_path, parsers):
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    engine = Engine(use_saver=True, task_name="test", transport="native")
+    if parsers:
+        engine.launch_parsers(parsers, maxsize=3)
+    # inline, a parse error is the worker's and restarts it
+    shared_argv = {"broken": 7 if parsers else None}
+    engine.launch_workers(fetch_pages, shared_argv, [{"ip": "127.0.0.1"}, {"ip": "127.0.0.2"}])
+    engine.enqueue_tasks([0, 1, 2])
+    engine.enqueue_stopwork()
+    engine.launch_savers("test", str(save_dir))
+
+    for _ in range(60):
+        if engine.poll_routine():
+            break
+        time.sleep(0.5)
+    assert engine.workers == [] and engine.parsers == [] and engine.savers == []
+
+    # pages without a document are skipped, a failing page does not stop the parser
+    expected = [page for page in range(300) if page % 10 and page != shared_argv["broken"]]
+    pages = [json.loads(line)["page"] for line in read_jsonl(str(save_dir))]
+    assert sorted(pages) == expected
+
+
+def is_odd(task):
+    time.sleep(0.01)
+    return task % 2 == 1
+
+
+def record_task(task, shared_argv, private_argv, logger, save_queue=None):
+    shared_argv["results"].put(task)
+
+
+def test_feeder_queues_filtered_tasks(tmp_path):
+    ledger = TaskLedger(str(tmp_path / "ledger.db"))
+    engine = Engine(task_name="test", transport="native", ledger=ledger)
+    results = engine.transport.make_queue()
+    engine.launch_workers(record_task, {"results": results},
+                          [{"ip": "127.0.0.1"}, {"ip": "127.0.0.2"}])
+    tasks = list(range(200))
+    ledger.add(tasks)
+    engine.launch_feeders(tasks, is_odd, count=3)
+    # stop commands wait for the feeder
+    engine.enqueue_stopwork()
+    assert not engine.worker_stop_sent
+
+    for _ in range(60):
+        if engine.poll_routine():
+            break
+        time.sleep(0.5)
+    assert engine.feeders == [] and engine.workers == []
+    done = sorted(results.get(timeout=5) for _ in range(100))
+    assert done == list(range(1, 200, 2))
+    assert ledger.counts()[ledgerlib.DONE] == 200
+
+
+def record_subtask(payload, shared_argv, private_argv, logger, save_queue=None):
+    time.sleep(0.3)
+    shared_argv["results"].put((payload, private_argv["rank"]))
+
+
+def split_task(task, shared_argv, private_argv, logger, save_queue=None):
+    subtasks = [Subtask(record_subtask, (task, i), cost=i) for i in range(6)]
+    shared_argv["scheduler"].submit(subtasks)
+
+
+def test_idle_worker_takes_subtasks():
+    engine = Engine(task_name="test", transport="native")
+    results = engine.transport.make_queue()
+    private_args = [{"ip": "127.0.0.1"}, {"ip": "127.0.0.2"}]
+    engine.launch_workers(split_task, {"results": results}, private_args)
+    engine.enqueue_tasks(["cafe"])
+    engine.enqueue_stopwork()
+
+    for _ in range(60):
+        if engine.poll_routine():
+            break
+        time.sleep(0.5)
+    assert engine.workers == []
+    assert engine.scheduler.idle()
+    assert engine.scheduler.remaining_requests() == 0
+
+    done = [results.get(timeout=5) for _ in range(6)]
+    # largest estimated cost first, and both workers took sub-tasks
+    assert {payload for payload, _ in done[:2]} == {("cafe", 5), ("cafe", 4)}
+    assert {rank for _, rank in done} == {0, 1}
+
+
+def kill_on_subtask(payload, shared_argv, private_argv, logger, save_queue=None):
+    if payload[1] == 5:
+        os.kill(os.getpid(), signal.SIGKILL)
+    record_subtask(payload, shared_argv, private_argv, logger, save_queue)
+
+
+def split_task_killing(task, shared_argv, private_argv, logger, save_queue=None):
+    subtasks = [Subtask(kill_on_subtask, (task, i), cost=i) for i in range(6)]
+    shared_argv["scheduler"].submit(subtasks)
+    if task == "killed after submit":
+        # before the thread of the queue sent the sub-tasks
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.mark.parametrize("task", ["killed on sub-task", "killed after submit"])
+def test_killed_worker_does_not_keep_engine_running(task):
+    engine = Engine(task_name="test", transport="native")
+    results = engine.transport.make_queue()
+    private_args = [{"ip": "127.0.0.1"}, {"ip": "127.0.0.2"}]
+    engine.launch_workers(split_task_killing, {"results": results}, private_args)
+    engine.enqueue_tasks([task])
+    engine.enqueue_stopwork()
+
+    for _ in range(60):
+        if engine.poll_routine():
+            break
+        time.sleep(0.5)
+    stopped = engine.workers == []
+    for worker in engine.workers:
+        worker.process.terminate()
+    # the sub-task of the killed worker is ended for it, and those it did
+    # not send are never counted
+    assert stopped
+    assert engine.scheduler.idle()
+    done = []
+    while not results.empty():
+        done.append(results.get(timeout=5)[0])
+    assert len(done) == len(set(done))
+    assert set(done) <= {(task, i) for i in range(5)}
+
+
+def test_ledger_lease_reclaim_and_retry(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = TaskLedger(path, lease_seconds=60)
+    assert ledger.add(["a", "b", ("20240101", "001")]) == 3
+    assert ledger.add(["a"]) == 0
+    ledger.lease("a")
+    ledger.lease("b")
+    ledger.fail("b", ValueError("broken"))
+    ledger.lease(("20240101", "001"))
+    ledger.done(("20240101", "001"))
+    assert ledger.counts() == {"pending": 0, "leased": 1, "done": 1, "failed": 1}
+
+    # a live owner keeps its lease until it expires
+    assert TaskLedger(path).reclaim() == 0
+    with ledger.connection:
+        ledger.connection.execute(
+            "UPDATE tasks SET owner = ? WHERE key = 'a'", (ledgerlib.get_owner(2 ** 22 + 1),))
+    resumed = TaskLedger(path)
+    assert resumed.reclaim() == 1
+    assert resumed.pending() == ["a"]
+    assert resumed.failures()[0][0] == "b"
+    assert resumed.retry_failed("c*") == 0
+    assert resumed.retry_failed() == 1
+    assert resumed.pending() == ["a", "b"]
+
+    # a rescan returns done tasks to pending
+    resumed.add([("20240101", "001")], reset=True)
+    assert resumed.counts()["done"] == 0
+
+
+def fail_on_b(task, shared_argv, private_argv, logger, save_queue=None):
+    if task == "b":
+        raise ValueError("broken")
+
+
+def test_engine_records_tasks_in_ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr("engine.engine.send_slack_message", lambda msg: None)
+    ledger = TaskLedger(str(tmp_path / "ledger.db"))
+    ledger.add(["a", "b", "c"])
+    engine = Engine(task_name="test", transport="native", ledger=ledger)
+    engine.restart_delay = 0
+    engine.launch_workers(fail_on_b, {}, [{"ip": "127.0.0.1"}])
+    engine.enqueue_tasks(ledger.pending())
+    engine.enqueue_stopwork()
+    for _ in range(100):
+        if engine.poll_routine():
+            break
+        time.sleep(0.1)
+
+    assert ledger.counts() == {"pending": 0, "leased": 0, "done": 2, "failed": 1}
+    assert ledger.failures()[0][0] == "b"
@@ -0,0 +1,59 @@
+import os
+import json
+import pytest
+
+from util import htmlparse
+from navercafe.handler import extract_text
+from kin.parser import parse_html
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "html")
+
+
+def read_page(name):
+    with open(os.path.join(DATA_DIR, name), "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with open(os.path.join(DATA_DIR, "golden.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(params=htmlparse.available_backends())
+def backend(request, monkeypatch):
+    monkeypatch.setenv(htmlparse.BACKEND_ENV, request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("name", [
+    "navercafe_se3.html", "navercafe_se2.html", "navercafe_office.html"])
+def test_navercafe_extract_text_golden(golden, backend, name):
+    assert extract_text(read_page(name)) == golden[name]
+
+
+def test_kin_parse_html_golden(golden, backend):
+    class Document:
+        pass
+
+    document = parse_html(read_page("kin_document.html"), Document())
+    parsed = {"title": document.title, "question": document.question,
+              "question_badges": document.question_badges,
+              "answers": document.answers}
+    assert parsed == golden["kin_document.html"]
+
+
+def test_divergent_markup_falls_back_to_html_parser():
+    assert not htmlparse.diverges("<p>R&D &amp; a&b=2 &nbsp;&copy</p>")
+    # full pages are parsed by lxml
+    assert not htmlparse.diverges(read_page("kin_document.html"))
+    assert not htmlparse.diverges(
+        "<!DOCTYPE html><html><head><title>t</title><script>var b = '<b>';</script>"
+        "</head>\n<body><p>x</p></body></html><!-- end -->")
+    for markup in ["<p>a\r\nb</p>", "<![endif]>", "&lt3", "&bogus;",
+                   "<p>x<!-- open", "<textarea><p></textarea>",
+                   "<html><head><div>x</div></head><body></body></html>",
+                   "<html><head></head>x<body></body></html>"]:
+        assert htmlparse.diverges(markup)
+    soup = htmlparse.make_soup("<p>a\r\nb</p>", backend=htmlparse.LXML)
+    assert soup.p.string == "a\r\nb"
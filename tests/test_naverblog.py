@@ -0,0 +1,277 @@
+import os
+import gzip
+import json
+import queue
+import threading
+from unittest.mock import Mock
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from bs4 import BeautifulSoup
+
+import naverblog.completion as ncompletion
+import naverblog.naverblog_crawler as ncrawler
+import naverblog.NaverBlogScrapper as nscrapper
+import naverblog.__utils as nutils
+import naverblog.frontier as nfrontier
+from naverblog.frontier import BlogFrontier
+from util.archive import ARCHIVE_DIR, get_archive
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "html")
+
+
+def test_completion_log(tmp_path):
+    log = str(tmp_path / "naverblog" / "completed.tsv")
+    legacy = str(tmp_path / "naverblog" / "blog_info.csv")
+    os.makedirs(os.path.dirname(legacy))
+    with open(legacy, "w", encoding="utf-8") as f:
+        f.write(",blogid,save_path,checkpoint\n")
+        f.write("0,oldblog,data/naverblog/jsonl/naverblog_00000.jsonl,2231\n")
+        f.write("1,emptyblog,-1,-1\n")
+
+    ncompletion.mark_completed("blog1", "data/naverblog/jsonl/naverblog_00000.jsonl", "100", path=log)
+    ncompletion.mark_completed("blog2", path=log)
+    ncompletion.mark_completed("blog1", "data/naverblog/jsonl/naverblog_00001.jsonl", "200", path=log)
+    # a line cut short by a crash
+    with open(log, "a", encoding="utf-8") as f:
+        f.write("blog3\tdata/nav")
+
+    entries = ncompletion.load_completion(log, legacy)
+    assert set(entries) == {"oldblog", "emptyblog", "blog1", "blog2"}
+    assert entries["blog1"] == ("data/naverblog/jsonl/naverblog_00001.jsonl", "200")
+    assert entries["blog2"] == (ncompletion.NO_POSTS, ncompletion.NO_POSTS)
+
+    assert ncompletion.compact_completion_log(log, legacy) == entries
+    assert not os.path.exists(legacy)
+    assert os.path.exists(legacy + ".imported")
+    with open(log, "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 4
+    assert ncompletion.load_completion(log, legacy) == entries
+
+    ncompletion.mark_completed("blog3", path=log)
+    assert "blog3" in ncompletion.load_completion(log, legacy)
+
+
+def test_frontier(tmp_path):
+    bloglist = str(tmp_path / "bloglist.json")
+    visited = str(tmp_path / "visited_bloglist.json")
+    with open(bloglist, "w") as f:
+        json.dump(["a", "b", "c", "d"], f)
+    with open(visited, "w") as f:
+        json.dump(["a"], f)
+
+    frontier = BlogFrontier(str(tmp_path / "frontier.db"))
+    assert frontier.import_lists(bloglist, visited) == 4
+    assert frontier.import_lists(bloglist, visited) == 0
+    assert frontier.counts() == {nfrontier.PENDING: 3, nfrontier.CLAIMED: 0, nfrontier.VISITED: 1}
+
+    until = frontier.last_rowid()
+    assert frontier.claim(2, until) == ["b", "c"]
+    assert frontier.visit(["b", "c"], ["a", "c", "e", "f", "e"]) == 2
+    # blogs found during the run are left for a later one
+    assert frontier.claim(10, until) == ["d"]
+    assert frontier.claim(10, until) == []
+    assert frontier.release() == 1
+    assert frontier.claim(10) == ["d", "e", "f"]
+
+    frontier.write_bloglist(bloglist)
+    with open(bloglist) as f:
+        assert json.load(f) == ["a", "b", "c", "d", "e", "f"]
+
+
+def test_frontier_threads(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    BlogFrontier(path).add(str(i) for i in range(100))
+
+    def visit_all(worker_id):
+        frontier = BlogFrontier(path)
+        claimed = []
+        while True:
+            blogids = frontier.claim(7)
+            if not blogids:
+                return claimed
+            # only the seeds have neighbors
+            frontier.visit(blogids, [f"{worker_id}-{blogid}" for blogid in blogids
+                                     if "-" not in blogid])
+            claimed.extend(blogids)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        claimed = [blogid for blogids in executor.map(visit_all, range(4))
+                   for blogid in blogids]
+    frontier = BlogFrontier(path)
+    # every blog is claimed once, the neighbors found are claimed too
+    assert len(claimed) == len(set(claimed)) == len(frontier) == 200
+    assert frontier.counts()[nfrontier.VISITED] == len(frontier)
+
+
+class FakeScrapper:
+    """Yields a post per logNo of POSTS, failing once after FAIL_AFTER"""
+    POSTS = [str(postid) for postid in range(100, 110)]
+    FAIL_AFTER = "104"
+    failed = False
+
+    def __init__(self, ip, config, interval=1):
+        pass
+
+    def scrap_naverblog(self, blogid, lock, resume_after=None):
+        postlist = self.POSTS
+        if resume_after in postlist:
+            postlist = postlist[postlist.index(resume_after) + 1:]
+        for postid in postlist:
+            yield {"uri": f"m.blog.naver.com/{blogid}/{postid}", "text": postid}
+            if postid == self.FAIL_AFTER and not FakeScrapper.failed:
+                FakeScrapper.failed = True
+                raise Exception("Connection reset")
+
+
+def test_worker_resumes_blog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ncrawler, "NaverBlogScrapper", FakeScrapper)
+    crawler = ncrawler.naverblogCrawler()
+    saved = queue.Queue()
+    private_argv = {"ip": "127.0.0.1", "interval": 0}
+    shared_argv = {"configuration": {}}
+
+    with pytest.raises(Exception):
+        crawler.worker_routine("blog", shared_argv, private_argv, Mock(), saved)
+    assert ncompletion.read_checkpoint("blog") == "104"
+    assert "blog" not in ncompletion.load_completion()
+
+    assert crawler.worker_routine("blog", shared_argv, private_argv, Mock(), saved) == 5
+    texts = [json.loads(saved.get())["text"] for _ in range(saved.qsize())]
+    assert texts == FakeScrapper.POSTS
+    assert ncompletion.load_completion()["blog"][1] == "109"
+    assert ncompletion.read_checkpoint("blog") is None
+
+
+POSTLIST = json.dumps({"resultCode": "S", "tagQueryString": "&logNo=11&logNo=12", "totalCount": "2"})
+POST = """<html><body>
+<div class="se-module se-module-text se-title-text"><p>title {postid}</p></div>
+<span class="blog_date">2024. 1. 2. 13:45</span>
+<div class="se-component se-text se-l-default"><p>text of {postid}</p></div>
+</body></html>"""
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def getheader(self, name):
+        return self.headers.get(name)
+
+
+def test_scrapper_stores_raw_pages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    def request(netloc, path, headers, ip=None):
+        requests.append(path)
+        if path.startswith("/PostTitleListAsync.naver"):
+            return FakeResponse({}), POSTLIST.encode("utf-8")
+        postid = path.split("logNo=")[1]
+        return FakeResponse({"Content-Encoding": "gzip"}), gzip.compress(
+            POST.format(postid=postid).encode("utf-8"))
+
+    monkeypatch.setattr(nutils.CONNECTION_POOL, "request", request)
+    config = {"bloglist_path": "bloglist.json", "postlist_path": "postlist",
+              "html_path": str(tmp_path / "html"), "jsonl_path": "jsonl"}
+    os.makedirs("postlist")
+
+    scrapper = nscrapper.NaverBlogScrapper("127.0.0.1", config, interval=0)
+    posts = list(scrapper.scrap_naverblog("blog", None))
+    assert [post["text"] for post in posts] == ["text of 11", "text of 12"]
+    assert len(requests) == 3
+
+    # raw responses are kept uncompressed by http and unprettified
+    archive = get_archive(str(tmp_path / "html" / "blog" / ARCHIVE_DIR))
+    assert archive.get("11") == POST.format(postid="11").encode("utf-8")
+    assert archive.get("postlist_1") == POSTLIST.encode("utf-8")
+
+    # a later attempt reads the parsed posts
+    monkeypatch.setattr(scrapper, "parse_post", Mock(side_effect=AssertionError))
+    assert list(scrapper.scrap_naverblog("blog", None)) == posts
+    assert len(requests) == 3
+
+
+def test_posts_fetched_while_listing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    post_fetched = threading.Event()
+    requests = []
+
+    def request(netloc, path, headers, ip=None):
+        page = path.split("currentPage=")[1].split("&")[0] if "currentPage=" in path else None
+        if page == "2":
+            # the second page is listed only once a post of the first was fetched
+            assert post_fetched.wait(timeout=10)
+        requests.append(path)
+        if page == "1":
+            postlist = {"resultCode": "S", "tagQueryString": "&logNo=11", "totalCount": "31"}
+        elif page == "2":
+            postlist = {"resultCode": "S", "tagQueryString": "&logNo=12", "totalCount": "31"}
+        else:
+            post_fetched.set()
+            postid = path.split("logNo=")[1]
+            return FakeResponse({}), POST.format(postid=postid).encode("utf-8")
+        return FakeResponse({}), json.dumps(postlist).encode("utf-8")
+
+    monkeypatch.setattr(nutils.CONNECTION_POOL, "request", request)
+    config = {"bloglist_path": "bloglist.json", "postlist_path": "postlist",
+              "html_path": str(tmp_path / "html"), "jsonl_path": "jsonl"}
+    os.makedirs("postlist")
+
+    scrapper = nscrapper.NaverBlogScrapper("127.0.0.1", config, interval=0)
+    posts = list(scrapper.scrap_naverblog("blog", None))
+    assert [post["text"] for post in posts] == ["text of 11", "text of 12"]
+    assert [path.split("?")[0] for path in requests] == [
+        "/PostTitleListAsync.naver", "/PostView.naver", "/PostTitleListAsync.naver", "/PostView.naver"]
+    with open(os.path.join("postlist", "blog.txt")) as f:
+        assert json.load(f) == ["11", "12"]
+
+
+def test_closing_cached_postlist(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    request = Mock(side_effect=AssertionError("no request expected"))
+    monkeypatch.setattr(nutils.CONNECTION_POOL, "request", request)
+    os.makedirs("postlist")
+    with open(os.path.join("postlist", "blog.txt"), "w") as f:
+        json.dump(["11", "12", "13"], f)
+    config = {"bloglist_path": "bloglist.json", "postlist_path": "postlist",
+              "html_path": str(tmp_path / "html"), "jsonl_path": "jsonl"}
+
+    scrapper = nscrapper.NaverBlogScrapper("127.0.0.1", config, interval=0)
+    threads = threading.active_count()
+    listing = scrapper.get_postlist("blog", None)
+    assert next(listing) == "11"
+    # e.g. a skipped blog, or a Blocked exception in scrap_naverblog
+    listing.close()
+    assert threading.active_count() == threads
+    assert not any(thread.name == "postlist-blog" for thread in threading.enumerate())
+    request.assert_not_called()
+
+
+@pytest.mark.parametrize("prettified", [False, True])
+def test_parse_post_golden(prettified, tmp_path, monkeypatch):
+    """Pages fetched now are stored raw, earlier versions saved them prettified"""
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(DATA_DIR, "naverblog_post.html"), "r", encoding="utf-8") as f:
+        html = f.read()
+    with open(os.path.join(DATA_DIR, "golden.json"), "r", encoding="utf-8") as f:
+        expected = json.load(f)["naverblog_post.html"]
+    config = {"bloglist_path": "bloglist.json", "postlist_path": "postlist",
+              "html_path": str(tmp_path / "html"), "jsonl_path": "jsonl"}
+    scrapper = nscrapper.NaverBlogScrapper("127.0.0.1", config, interval=0)
+    if prettified:
+        os.makedirs(tmp_path / "html" / "blog")
+        with open(tmp_path / "html" / "blog" / "11.html", "w", encoding="utf-8") as f:
+            f.write(BeautifulSoup(html, "html.parser").prettify())
+    else:
+        get_archive(scrapper.archive_dir("blog")).put("11", html)
+
+    soup = scrapper.load_page("blog", "11")
+    overlays, _ = scrapper.handle_http_call(soup, 1, 0, "11")
+    js = scrapper.parse_post(soup, overlays, "m.blog.naver.com/blog/11")
+    assert js.pop("uri") == "m.blog.naver.com/blog/11"
+    js.pop("retrieval_date")
+    assert js == expected
@@ -8,9 +8,15 @@ from navercafe.handler import (
     set_article
 )
 from unittest.mock import Mock
+import datetime
+import navercafe.handler as nhandler
 from util.env import get_iplist
 import navercafe.structs
+import navercafe.cache as ncache
+import navercafe.index as nindex
+import json
 import os
+import time
 
 
 @pytest.fixture(autouse=True)
@@ -110,3 +116,125 @@ def test_set_article(article, ip, dummy_logger):
 def test_article_parsing(article, ip, dummy_logger):
     data = get_article_json(article, ip, dummy_logger, interval=1)
     assert data is not None
+
+
+def test_state_store_imports_legacy_cache(tmp_path, monkeypatch, cafe, board):
+    monkeypatch.setattr(ncache, "STATE_DB", str(tmp_path / "state.db"))
+    legacy = {"member_only": False, "pages": [
+        {"page": 1, "articles": ["10", "9"], "done": True},
+        {"page": 2, "articles": ["8"]},
+    ]}
+    board.cache = str(tmp_path / "boardcache.json")
+    with open(board.cache, "w", encoding="utf-8") as f:
+        f.write(json.dumps(legacy, indent=2))
+    cafe.cache = str(tmp_path / "missing.json")
+
+    assert ncache.read_cache(board) == legacy
+    assert ncache.read_cache(cafe) == {}
+
+    # pages are written one by one, the status without its pages
+    ncache.set_page_done(board, {"page": 2})
+    ncache.write_page(board, {"page": 3, "articles": ["7"]})
+    ncache.write_status(board, {"member_only": False, "done": True, "pages": []})
+    status = ncache.read_cache(board)
+    assert status["done"] and [page.get("done", False) for page in status["pages"]] == [True, True, False]
+
+    ncache.clear_pages(board)
+    assert ncache.read_cache(board)["pages"] == []
+    ncache.update_cache(cafe, lambda status: {**status, "pending_boards": ["1"]})
+    assert ncache.read_cache(cafe) == {"pending_boards": ["1"]}
+
+
+def test_processed_index(tmp_path, monkeypatch):
+    data_dir = str(tmp_path)
+    os.mkdir(tmp_path / "json_files")
+    os.mkdir(tmp_path / "cache")
+    (tmp_path / "json_files" / "12.json.gz").write_bytes(b"")
+    (tmp_path / "json_files" / "7.json").write_bytes(b"")
+    (tmp_path / "cache" / "1_0.txt").write_text("3.json\n5.json\n")
+
+    index = nindex.ProcessedIndex(data_dir)
+    assert [aid in index for aid in (3, 5, 7, 12, 4, 13)] == [True] * 4 + [False] * 2
+    index.add(4)
+    index.close()
+
+    # added ids come back from the log, files added behind its back trigger a rebuild
+    index = nindex.ProcessedIndex(data_dir)
+    assert 4 in index and len(index) == 5
+    index.close()
+    os.utime(tmp_path / "processed.idx", (0, 0))
+    os.utime(tmp_path / "processed.log", (0, 0))
+    (tmp_path / "json_files" / "20.json.gz").write_bytes(b"")
+    index = nindex.ProcessedIndex(data_dir)
+    assert 20 in index and 4 not in index
+    index.close()
+
+    monkeypatch.setattr(nindex, "MERGE_THRESHOLD", 1)
+    index = nindex.ProcessedIndex(data_dir)
+    index.add(30)
+    index.add(31)
+    index.close()
+    index = nindex.ProcessedIndex(data_dir)
+    assert not os.path.exists(index.log_path)
+    assert list(index.ids) == [3, 5, 7, 12, 20, 30, 31]
+    index.close()
+
+
+def test_get_index_builds_once_across_threads(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    built = []
+
+    class SlowIndex(nindex.ProcessedIndex):
+        def rebuild(self):
+            built.append(self.data_dir)
+            time.sleep(0.1)
+            super().rebuild()
+
+    monkeypatch.setattr(nindex, "ProcessedIndex", SlowIndex)
+    data_dir = str(tmp_path)
+    with ThreadPoolExecutor(4) as executor:
+        indexes = list(executor.map(nindex.get_index, [data_dir] * 8))
+    assert built == [data_dir]
+    assert all(index is indexes[0] for index in indexes)
+    indexes[0].close()
+
+
+def test_board_refresh_stops_at_watermark(tmp_path, monkeypatch, board, dummy_logger):
+    monkeypatch.setattr(ncache, "STATE_DB", str(tmp_path / "state.db"))
+    board.cache = str(tmp_path / "missing.json")
+    # newest first, 3 articles per page
+    listing = [list(range(120, 100, -1))]
+    requested = []
+
+    def get_page_json(board, page, ip, logger, interval=1):
+        requested.append(page)
+        ids = listing[0][(page - 1) * 3:page * 3]
+        articles = [{"articleId": aid, "blindArticle": False, "openArticle": True}
+                    for aid in ids]
+        return {"result": {"hasNext": page * 3 < len(listing[0]), "articleList": articles}}
+
+    handled = []
+    monkeypatch.setattr(nhandler, "get_page_json", get_page_json)
+    monkeypatch.setattr(nhandler, "handle_page",
+                        lambda board, entry, *args, **kwargs: handled.extend(entry["articles"]) or True)
+    old = (datetime.datetime.now() - datetime.timedelta(days=40)).isoformat()
+
+    # boards finished before watermarks take it from their pages
+    ncache.write_cache(board, {"member_only": False, "done": True, "timestamp": old,
+                               "pages": [{"page": 1, "articles": ["110", "108"], "done": True}]})
+    nhandler.handle_board(board, "ip", dummy_logger, save_queue=Mock())
+    assert requested == [1, 2, 3, 4, 5]
+    assert handled == [str(aid) for aid in range(120, 110, -1)]
+    status = ncache.read_cache(board)
+    assert status["done"] and status["watermark"] == 120 and "since" not in status
+
+    # a month later, only the pages with new articles are listed
+    listing[0] = list(range(124, 100, -1))
+    ncache.write_status(board, {**status, "timestamp": old})
+    requested.clear()
+    handled.clear()
+    assert nhandler.estimate_board_requests(ncache.read_cache(board)) < nhandler.UNKNOWN_COST
+    nhandler.handle_board(board, "ip", dummy_logger, save_queue=Mock())
+    assert requested == [1, 2, 3]
+    assert handled == ["124", "123", "122", "121"]
+    assert ncache.read_cache(board)["watermark"] == 124
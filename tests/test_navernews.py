@@ -67,3 +67,18 @@ def test_fecth_and_parse_article(monkeypatch, article, dummy_logger, ip):
     assert len(parsed["text"]) > 100
     assert len(parsed["uri"]) > 10
     assert len(parsed["title"]) > 10
+
+
+def test_concurrent_fetch_raises_critical(monkeypatch, dummy_logger):
+    from navernews import worker
+    from util.customexception import TooManyRequestsError
+
+    def read_cached_or_fetch_html(article, logger, ip, interval=0.75):
+        if article == "banned":
+            raise TooManyRequestsError("429")
+        return article, article
+
+    monkeypatch.setattr(worker, "read_cached_or_fetch_html", read_cached_or_fetch_html)
+    fetched = worker.fetch_articles(["a", "banned"], dummy_logger, None, 0, 2)
+    with pytest.raises(TooManyRequestsError):
+        list(fetched)
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import pytest
+
+from engine.engine import Engine
+from reparse.reparse_crawler import reparseCrawler
+from util.archive import get_archive
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield
+
+
+def article_json(aid):
+    return {
+        "article": {"contentHtml": f"<p>article {aid}</p>",
+                    "writeDate": 1700000000000, "subject": f"title {aid}"},
+        "comments": {"items": [{"content": "comment"}]},
+    }
+
+
+def test_reparse_navercafe_board(tmp_path):
+    data_dir = os.path.join("data", "navercafe", "cafe", "1")
+    os.makedirs(os.path.join(data_dir, "json_files"))
+    archive = get_archive(os.path.join(data_dir, "archive"))
+    for aid in range(1, 4):
+        archive.put(str(aid), json.dumps(article_json(aid)))
+    with open(os.path.join(data_dir, "json_files", "4.json"), "w") as f:
+        json.dump(article_json(4), f)
+    with open("reparse.yml", "w") as f:
+        f.write("source: navercafe\nworkers: 2\nchunk_size: 1\n")
+
+    crawler = reparseCrawler()
+    tasks, shared_argv, private_args = crawler.load_configuration("reparse.yml")
+    assert tasks == [data_dir]
+    engine = Engine(use_saver=True, task_name="reparse", transport="native")
+    engine.launch_workers(crawler.worker_routine, shared_argv, private_args)
+    engine.enqueue_tasks(tasks)
+    engine.enqueue_stopwork()
+    os.makedirs(crawler.save_dir)
+    engine.launch_savers(crawler.save_id, crawler.save_dir)
+    for _ in range(100):
+        if engine.poll_routine():
+            break
+        time.sleep(0.1)
+
+    documents = []
+    for name in os.listdir(crawler.save_dir):
+        if name.endswith(".jsonl"):
+            with open(os.path.join(crawler.save_dir, name)) as f:
+                documents.extend(json.loads(line) for line in f if line.strip())
+    assert sorted(document["title"] for document in documents) == [
+        f"title {aid}" for aid in range(1, 5)]
+    assert shared_argv["pages"].value == 4
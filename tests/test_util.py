@@ -1,6 +1,7 @@
 from util.env import get_iplist
 import pytest
 import re
+import os
 
 
 @pytest.fixture
@@ -17,3 +18,197 @@ def test_get_iplist():
     for ip in ips:
         assert isinstance(ip, str)
         assert ip_pattern.match(ip) is not None, f"Invalid IP format: {ip}"
+
+
+def test_replace_surrogates():
+    from util.sanitize import replace_surrogates, remove_surrogates, encode_utf8
+    clean = "ascii only"
+    assert replace_surrogates(clean) is clean
+    korean = "가나다 😀"
+    assert replace_surrogates(korean) is korean
+
+    broken = "가\ud800나\udfff"
+    assert replace_surrogates(broken) == "가�나�"
+    assert remove_surrogates(broken) == "가나"
+    assert encode_utf8(broken) == "가�나�".encode("utf-8")
+    assert encode_utf8(korean) == korean.encode("utf-8")
+
+
+def test_connection_pool_reuses_and_reconnects():
+    import http.client
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from util.connection import ConnectionPool
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            # drop the keep-alive socket without telling the client
+            if self.path == "/drop":
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    netloc = f"127.0.0.1:{server.server_address[1]}"
+    pool = ConnectionPool(
+        connection_factory=lambda netloc, ip: http.client.HTTPConnection(netloc))
+    try:
+        for i in range(3):
+            resp, data = pool.request(netloc, f"/{i}", {})
+            assert resp.status == 200 and data == f"/{i}".encode()
+        assert pool.stats()["reused"] == 2
+
+        pool.request(netloc, "/drop", {})
+        resp, data = pool.request(netloc, "/after", {})
+        assert data == b"/after"
+        assert pool.reconnects == 1
+        assert pool.requests == 5
+    finally:
+        pool.close_all()
+        server.shutdown()
+
+
+def test_fetch_html_copies_headers(tmp_path, monkeypatch):
+    from unittest.mock import Mock
+    from util import crawler
+    monkeypatch.chdir(tmp_path)
+    sent = []
+
+    def request(netloc, path, headers, ip=None):
+        sent.append(dict(headers))
+        resp = Mock(status=200)
+        resp.getheader = {"Set-Cookie": "NID=1; path=/"}.get
+        return resp, path.encode("utf-8")
+
+    monkeypatch.setattr(crawler.CONNECTION_POOL, "request", request)
+    before = dict(crawler.HEADERS)
+    uris = [f"https://n.news.naver.com/article/{i}?a=1" for i in range(2)]
+    assert [crawler.fetch_html(uri, None, interval=0) for uri in uris] == [
+        "/article/0?a=1", "/article/1?a=1"]
+    # the Referer and Cookie of one request do not leak into the next
+    assert crawler.HEADERS == before
+    assert sent == [before, before]
+
+
+def test_token_bucket_spaces_requests():
+    from util.ratelimit import TokenBucket
+    bucket = TokenBucket.from_interval(0.5)
+    assert bucket.reserve() == 0
+    assert abs(bucket.reserve() - 0.5) < 0.05
+    assert abs(bucket.reserve() - 1.0) < 0.05
+    assert TokenBucket.from_interval(0) is None
+
+
+def test_async_fetcher_overlaps_calls():
+    import time
+    from util.aio import AsyncFetcher
+    from util.ratelimit import TokenBucket
+
+    def slow_square(x):
+        time.sleep(0.2)
+        if x == 3:
+            raise ValueError(x)
+        return x * x
+
+    fetcher = AsyncFetcher(4, TokenBucket.from_interval(0.01))
+    try:
+        begin = time.perf_counter()
+        results = fetcher.map(slow_square, range(4))
+        elapsed = time.perf_counter() - begin
+    finally:
+        fetcher.close()
+    assert results[:3] == [0, 1, 4]
+    assert isinstance(results[3], ValueError)
+    assert elapsed < 0.5
+
+
+def test_rate_controller_aimd_and_persistence(tmp_path):
+    from util.ratelimit import RateController
+    controller = RateController(cache_dir=str(tmp_path))
+    host = "apis.naver.com"
+    assert controller.wait_time("1.2.3.4", host, 1) == 0
+
+    for _ in range(10):
+        controller.record("1.2.3.4", host, 1, 200, 0.1)
+    fast = controller.current_rates()["1.2.3.4"][host]
+    assert fast > 1.0
+
+    controller.record("1.2.3.4", host, 1, 429, 0.1)
+    assert abs(controller.current_rates()["1.2.3.4"][host] - fast / 2) < 1e-3
+
+    # bounded by the configured interval
+    for _ in range(1000):
+        controller.record("1.2.3.4", host, 1, 200, 0.1)
+    assert controller.current_rates()["1.2.3.4"][host] == RateController.max_factor
+
+    controller.record("1.2.3.4", host, 1, 403, 0.1)
+    restarted = RateController(cache_dir=str(tmp_path))
+    restarted.wait_time("1.2.3.4", host, 1)
+    assert restarted.current_rates() == controller.current_rates()
+
+
+def test_archive_put_get_and_reindex(tmp_path):
+    from util.archive import Archive, INDEX_NAME
+    root = str(tmp_path / "archive")
+    archive = Archive(root, segment_bytes=64)
+    archive.put("1", "가나다" * 10)
+    archive.put("2", b"second")
+    archive.put("1", "replaced")
+    assert archive.get_text("1") == "replaced"
+    assert archive.get("2") == b"second"
+    assert archive.get("3") is None
+    assert "2" in archive and "3" not in archive
+    assert len(archive.segments()) > 1
+    assert dict(archive.items()) == {"1": b"replaced", "2": b"second"}
+
+    # a record cut short by a crash is dropped when the index is rebuilt
+    with open(tmp_path / "archive" / archive.segments()[-1], "ab") as f:
+        f.write(b"ARC1\x01")
+    archive.close()
+    os.remove(os.path.join(root, INDEX_NAME))
+    restored = Archive(root)
+    assert restored.reindex() == 3
+    assert restored.get_text("1") == "replaced"
+    assert sorted(restored.keys()) == ["1", "2"]
+    restored.close()
+
+
+def test_archive_put_from_fetcher_threads(tmp_path):
+    from util.aio import AsyncFetcher
+    from util.archive import get_archive
+    root = str(tmp_path / "archive")
+
+    def put(key):
+        get_archive(root).put(key, f"page {key} " * (int(key) + 1))
+        return get_archive(root).get_text(key)
+
+    fetcher = AsyncFetcher(4)
+    keys = [str(i) for i in range(16)]
+    try:
+        results = fetcher.map(put, keys)
+    finally:
+        fetcher.close()
+    expected = [f"page {key} " * (int(key) + 1) for key in keys]
+    assert results == expected
+    archive = get_archive(root)
+    assert len(archive) == 16
+    assert [archive.get_text(key) for key in keys] == expected
+    archive.close()
+
+
+def test_count_file_lines(tmp_path):
+    from util import fileutil
+    path = tmp_path / "lines.txt"
+    for content in ["", "a", "a\n", "a\nb", "a\n\nb\n"]:
+        path.write_text(content, encoding="utf-8")
+        with open(path, "r", encoding="utf-8") as f:
+            assert fileutil.count_file_lines(str(path)) == len(f.readlines())
@@ -3,6 +3,8 @@ import os.path as osp
 
 from logging import Logger
 
+from util.sanitize import replace_surrogates
+
 
 class JsonAggregator:
     save_dir = None
@@ -55,7 +57,7 @@ class JsonAggregator:
             self.file_io = open(self.save_filename, "a")
         if not document_line:
             return
-        self.file_io.write(document_line)
+        self.file_io.write(replace_surrogates(document_line))
         if newline:
             self.file_io.write("\n")
         self.document_count_in_file += 1
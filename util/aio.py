@@ -0,0 +1,95 @@
+"""Keeps several blocking fetches in flight from one worker process.
+
+The fetch helpers (util.connection, util.crawler) are blocking. AsyncFetcher
+runs each call as a coroutine on the process' event loop and hands the
+blocking part to a thread, so up to `concurrency` requests overlap their
+network latency. The fetch helpers still wait for RATE_CONTROLLER before
+every request, so the per-ip politeness is kept. Connections come from the
+thread-safe CONNECTION_POOL.
+"""
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional
+
+from util.ratelimit import TokenBucket
+
+
+class AsyncFetcher:
+    concurrency = 1  # type: int
+    bucket = None  # type: Optional[TokenBucket]
+    executor = None  # type: ThreadPoolExecutor
+    loop = None  # type: asyncio.AbstractEventLoop
+
+    def __init__(self, concurrency: int, bucket: Optional[TokenBucket] = None):
+        self.concurrency = max(1, concurrency)
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.loop = asyncio.new_event_loop()
+
+    async def fetch(
+        self,
+        semaphore: asyncio.Semaphore,
+        function: Callable,
+        item: Any,
+        throttle: bool = True,
+    ):
+        async with semaphore:
+            if throttle and self.bucket is not None:
+                await self.bucket.wait_async()
+            call = functools.partial(function, item)
+            return await self.loop.run_in_executor(self.executor, call)
+
+    async def gather(self, function, items, throttle=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        coroutines = [
+            self.fetch(semaphore, function, item,
+                       throttle=throttle(item) if throttle else True)
+            for item in items
+        ]
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    def map(
+        self,
+        function: Callable,
+        items: Iterable[Any],
+        throttle: Optional[Callable[[Any], bool]] = None,
+    ) -> List[Any]:
+        """Calls function on every item and returns the results in order.
+        An exception raised by a call is returned in place of its result.
+        throttle(item) returning False skips the rate limiter, e.g. for cached items"""
+        return self.loop.run_until_complete(self.gather(function, list(items), throttle))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.loop.close()
+
+
+_FETCHERS = {}
+_FETCHERS_PID = None
+
+
+def get_fetcher(ip, concurrency: int) -> AsyncFetcher:
+    """Returns the fetcher of this process for ip, creating it on first use.
+    It has no bucket of its own; the fetch helpers are rate limited per host"""
+    global _FETCHERS, _FETCHERS_PID
+    if _FETCHERS_PID != os.getpid():
+        _FETCHERS = {}
+        _FETCHERS_PID = os.getpid()
+    key = (ip, concurrency)
+    if key not in _FETCHERS:
+        _FETCHERS[key] = AsyncFetcher(concurrency)
+    return _FETCHERS[key]
+
+
+def chunks(items: List[Any], size: int):
+    for begin in range(0, len(items), size):
+        yield items[begin:begin + size]
+
+
+def raise_critical(results: List[Any], criticals: tuple):
+    """Re-raises the first critical exception found among map() results"""
+    for result in results:
+        if isinstance(result, criticals):
+            raise result
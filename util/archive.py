@@ -0,0 +1,292 @@
+"""Append-only archives of raw documents, in place of one file per document.
+
+An archive is a directory holding segment files and an index:
+
+    {host}-{pid}-{nnnn}.seg   records appended by one writer process
+    index.db                  key -> (segment, offset, length) of the latest record
+
+Every record is self-describing, so segments can be read in bulk or the
+index rebuilt from them (reindex):
+
+    magic "ARC1" | codec (1 byte) | key length (2) | payload length (4) | key | payload
+
+The payload is compressed per record, with zstd when the zstandard package
+is installed and gzip otherwise. Each writer process appends to segments
+of its own, so processes handling the same archive never interleave
+records. A segment is rotated once it passes SEGMENT_BYTES. Threads of
+a process share the segment files of an archive under its lock, and the
+index under a connection of their own.
+"""
+import os
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+from util import compression as codec
+from util.sqlitedb import SqliteStore
+
+MAGIC = b"ARC1"
+HEADER = struct.Struct("<4sBHI")
+CODECS = [codec.NONE, codec.GZIP, codec.ZSTD]
+SEGMENT_BYTES = 1 << 30
+SEGMENT_SUFFIX = ".seg"
+INDEX_NAME = "index.db"
+ARCHIVE_DIR = "archive"
+MAX_OPEN_ARCHIVES = 64
+
+# guards get_archive and the first use of an archive after fork. Replaced in
+# a forked child, where a thread of the parent may have left it held
+_LOCK = threading.Lock()
+
+
+def _reset_lock():
+    global _LOCK
+    _LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+def default_codec() -> str:
+    return codec.ZSTD if codec.zstandard is not None else codec.GZIP
+
+
+def encode_record(key: str, data: bytes, name: str, level=None) -> bytes:
+    key_bytes = key.encode("utf-8")
+    payload = codec.compress(data, name, level)
+    header = HEADER.pack(MAGIC, CODECS.index(name), len(key_bytes), len(payload))
+    return header + key_bytes + payload
+
+
+def decode_record(record: bytes) -> Tuple[str, bytes]:
+    magic, codec_id, key_length, payload_length = HEADER.unpack_from(record)
+    if magic != MAGIC:
+        raise ValueError("Not an archive record")
+    begin = HEADER.size + key_length
+    key = record[HEADER.size:begin].decode("utf-8")
+    payload = record[begin:begin + payload_length]
+    return key, codec.decompress(payload, CODECS[codec_id])
+
+
+def scan_segment(path: str) -> Iterator[Tuple[str, int, int, bytes]]:
+    """Yields (key, offset, length, record) of every complete record.
+    Stops at a record cut short, e.g. by a crash while writing"""
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            magic, _, key_length, payload_length = HEADER.unpack(header)
+            if magic != MAGIC:
+                return
+            body = f.read(key_length + payload_length)
+            if len(body) < key_length + payload_length:
+                return
+            record = header + body
+            yield body[:key_length].decode("utf-8"), offset, len(record), record
+            offset += len(record)
+
+
+class ArchiveIndex(SqliteStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS records (
+        key TEXT PRIMARY KEY,
+        segment TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL
+    );
+    """
+
+    def put(self, key: str, segment: str, offset: int, length: int):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO records (key, segment, offset, length) "
+                "VALUES (?, ?, ?, ?)", (key, segment, offset, length))
+
+    def get(self, key: str) -> Optional[Tuple[str, int, int]]:
+        return self.connection.execute(
+            "SELECT segment, offset, length FROM records WHERE key = ?",
+            (key,)).fetchone()
+
+    def keys(self) -> Iterator[str]:
+        for key, in self.connection.execute("SELECT key FROM records"):
+            yield key
+
+    def rows(self):
+        """Rows in segment order, so reading them is sequential"""
+        return self.connection.execute(
+            "SELECT key, segment, offset, length FROM records ORDER BY segment, offset")
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+class Archive:
+    root = None  # type: str
+    codec = None  # type: str
+    level = None  # type: Optional[int]
+    segment_bytes = SEGMENT_BYTES  # type: int
+    index = None  # type: ArchiveIndex
+    _writer = None
+    _segment = None  # type: str
+    _sequence = 0  # type: int
+    _readers = None  # type: Dict[str, object]
+    _lock = None  # type: threading.Lock
+    _pid = None  # type: int
+
+    def __init__(self, root: str, compression: Optional[str] = None, level=None,
+                 segment_bytes: int = SEGMENT_BYTES):
+        if compression is None:
+            compression = default_codec()
+        codec.check_compression(compression)
+        self.root = root
+        self.codec = compression
+        self.level = level
+        self.segment_bytes = segment_bytes
+        os.makedirs(root, exist_ok=True)
+        self.index = ArchiveIndex(os.path.join(root, INDEX_NAME))
+        self._readers = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_process(self):
+        # file handles must not be shared with a forked child, nor the lock,
+        # which another thread of the parent may have held
+        if self._pid == os.getpid():
+            return
+        with _LOCK:
+            if self._pid != os.getpid():
+                self._writer = None
+                self._readers = {}
+                self._sequence = 0
+                self._lock = threading.Lock()
+                self._pid = os.getpid()
+
+    def _open_segment(self):
+        # created exclusively, so two Archive objects of one root, e.g. of
+        # two threads, never append to the same segment
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        while True:
+            self._sequence += 1
+            name = f"{prefix}-{self._sequence:04d}{SEGMENT_SUFFIX}"
+            try:
+                self._writer = open(os.path.join(self.root, name), "xb")
+            except FileExistsError:
+                continue
+            break
+        self._segment = name
+
+    def put(self, key: str, data: Union[bytes, str]):
+        self._check_process()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        record = encode_record(str(key), data, self.codec, self.level)
+        # the offset is only right if no other thread writes in between
+        with self._lock:
+            if self._writer is None or self._writer.tell() >= self.segment_bytes:
+                if self._writer is not None:
+                    self._writer.close()
+                self._open_segment()
+            offset = self._writer.tell()
+            self._writer.write(record)
+            self._writer.flush()
+            self.index.put(str(key), self._segment, offset, len(record))
+
+    def _read(self, segment: str, offset: int, length: int) -> bytes:
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = open(os.path.join(self.root, segment), "rb")
+            self._readers[segment] = reader
+        reader.seek(offset)
+        return reader.read(length)
+
+    def get(self, key: str) -> Optional[bytes]:
+        self._check_process()
+        location = self.index.get(str(key))
+        if location is None:
+            return None
+        # readers are shared, so seek and read must not interleave
+        with self._lock:
+            record = self._read(*location)
+        _, data = decode_record(record)
+        return data
+
+    def get_text(self, key: str) -> Optional[str]:
+        data = self.get(key)
+        return None if data is None else data.decode("utf-8")
+
+    def __contains__(self, key: str) -> bool:
+        return self.index.get(str(key)) is not None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self) -> Iterator[str]:
+        return self.index.keys()
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        """Yields (key, data) of the latest record of every key, reading
+        each segment front to back"""
+        self._check_process()
+        for _, segment, offset, length in self.index.rows():
+            with self._lock:
+                record = self._read(segment, offset, length)
+            yield decode_record(record)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.root)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def reindex(self) -> int:
+        """Rebuilds the index from the segments. Later records of a key win"""
+        count = 0
+        for segment in self.segments():
+            for key, offset, length, _ in scan_segment(os.path.join(self.root, segment)):
+                self.index.put(key, segment, offset, length)
+                count += 1
+        return count
+
+    def close(self):
+        self._check_process()
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+            for reader in self._readers.values():
+                reader.close()
+            self._writer = None
+            self._readers = {}
+            self.index.close()
+
+
+_ARCHIVES = OrderedDict()
+_ARCHIVES_PID = None
+
+
+def get_archive(root: str) -> Archive:
+    """Returns the archive at root, keeping the most recently used
+    MAX_OPEN_ARCHIVES open in this process"""
+    global _ARCHIVES, _ARCHIVES_PID
+    with _LOCK:
+        if _ARCHIVES_PID != os.getpid():
+            _ARCHIVES = OrderedDict()
+            _ARCHIVES_PID = os.getpid()
+        archive = _ARCHIVES.get(root)
+        evicted = None
+        if archive is None:
+            archive = Archive(root)
+            _ARCHIVES[root] = archive
+            if len(_ARCHIVES) > MAX_OPEN_ARCHIVES:
+                _, evicted = _ARCHIVES.popitem(last=False)
+        else:
+            _ARCHIVES.move_to_end(root)
+    # closed outside the lock, which close takes after fork
+    if evicted is not None:
+        evicted.close()
+    return archive
+
+
+def has_archive(root: str) -> bool:
+    return os.path.isfile(os.path.join(root, INDEX_NAME))
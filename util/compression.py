@@ -0,0 +1,65 @@
+"""Frame based compression helpers.
+Every call to compress() produces a self-contained gzip member or zstd frame,
+so frames can be concatenated into one file and still be read back as a
+single stream, or decompressed individually from a known byte range."""
+import io
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+NONE = "none"
+GZIP = "gzip"
+ZSTD = "zstd"
+COMPRESSIONS = [NONE, GZIP, ZSTD]
+
+EXTENSIONS = {NONE: "", GZIP: ".gz", ZSTD: ".zst"}
+DEFAULT_LEVELS = {NONE: None, GZIP: 6, ZSTD: 3}
+
+
+def check_compression(name: str):
+    if name not in COMPRESSIONS:
+        raise ValueError(
+            f"Unknown compression {name}. Use one of {COMPRESSIONS}")
+    if name == ZSTD and zstandard is None:
+        raise ImportError(
+            "zstd compression requires the zstandard package: pip install zstandard")
+
+
+def compress(data: bytes, name: str, level=None) -> bytes:
+    if level is None:
+        level = DEFAULT_LEVELS[name]
+    if name == NONE:
+        return data
+    if name == GZIP:
+        return gzip.compress(data, compresslevel=level)
+    if name == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unknown compression {name}")
+
+
+def decompress(data: bytes, name: str) -> bytes:
+    """Decompresses one or more concatenated frames"""
+    if name == NONE:
+        return data
+    if name == GZIP:
+        return gzip.decompress(data)
+    if name == ZSTD:
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(data), read_across_frames=True)
+        return reader.read()
+    raise ValueError(f"Unknown compression {name}")
+
+
+def open_stream(path: str, name: str):
+    """Opens a framed file for reading as a binary stream of decompressed bytes"""
+    if name == NONE:
+        return open(path, "rb")
+    if name == GZIP:
+        return gzip.open(path, "rb")
+    if name == ZSTD:
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True)
+    raise ValueError(f"Unknown compression {name}")
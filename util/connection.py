@@ -1,12 +1,25 @@
+import os
 import time
+import zlib
+import threading
 from urllib.parse import urlparse
 import gzip
 import brotli
 import http.client
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from logging import Logger
 
 from util.customexception import TooManyRequestsError
+from util.ratelimit import RATE_CONTROLLER
+
+# errors raised when a kept-alive socket was closed by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
 
 
 def make_https_connection(netloc, ip=None):
@@ -17,6 +30,178 @@ def make_https_connection(netloc, ip=None):
     return conn
 
 
+def decompress_body(data: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "deflate":
+        return zlib.decompress(data)
+    return data
+
+
+class ConnectionPool:
+    """Keep-alive HTTPS connections keyed by (netloc, source ip).
+
+    A connection is checked out for exactly one request and its response is
+    read to the end before it goes back to the pool, so one pool can be
+    shared by threads. Connections idle for longer than idle_timeout are
+    closed instead of reused. A forked child drops the parent's connections.
+    """
+
+    idle_timeout = 30  # type: float
+    max_idle_per_key = 8  # type: int
+    report_interval = 300  # type: float
+
+    connection_factory = None  # type: callable
+    pid = None  # type: int
+    lock = None  # type: threading.Lock
+    idle = None  # type: Dict[Tuple[str, Optional[str]], list]
+    requests = 0
+    reused = 0
+    reconnects = 0
+    last_sweep = 0  # type: float
+    last_report = 0  # type: float
+
+    def __init__(
+        self,
+        idle_timeout: float = 30,
+        max_idle_per_key: int = 8,
+        connection_factory: callable = make_https_connection,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.connection_factory = connection_factory
+        self.lock = threading.Lock()
+        self.__reset()
+
+    def __reset(self):
+        self.pid = os.getpid()
+        self.idle = {}
+        self.requests = 0
+        self.reused = 0
+        self.reconnects = 0
+        self.last_sweep = time.monotonic()
+        self.last_report = self.last_sweep
+
+    def __check_pid(self):
+        # sockets inherited over fork belong to the parent; forget them
+        if self.pid != os.getpid():
+            self.lock = threading.Lock()
+            self.__reset()
+
+    def acquire(self, netloc: str, ip: Optional[str] = None):
+        """Returns (connection, reused)"""
+        self.__check_pid()
+        now = time.monotonic()
+        if now - self.last_sweep > self.idle_timeout:
+            self.close_idle()
+        with self.lock:
+            entries = self.idle.get((netloc, ip), [])
+            while entries:
+                conn, last_used = entries.pop()
+                if now - last_used <= self.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self.connection_factory(netloc, ip), False
+
+    def release(self, netloc: str, ip: Optional[str], conn):
+        self.__check_pid()
+        with self.lock:
+            entries = self.idle.setdefault((netloc, ip), [])
+            if len(entries) < self.max_idle_per_key:
+                entries.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(
+        self,
+        netloc: str,
+        path: str,
+        headers: Dict[str, Any],
+        ip: Optional[str] = None,
+        method: str = "GET",
+        body=None,
+    ):
+        """Sends a request over a pooled connection and returns (response, raw body).
+        A reused connection the server already closed is replaced once"""
+        for attempt in range(2):
+            conn, reused = self.acquire(netloc, ip)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    with self.lock:
+                        self.reconnects += 1
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            with self.lock:
+                self.requests += 1
+                self.reused += int(reused)
+            if resp.will_close:
+                conn.close()
+            else:
+                self.release(netloc, ip, conn)
+            return resp, data
+
+    def close_idle(self):
+        """Closes connections that have been idle for longer than idle_timeout"""
+        now = time.monotonic()
+        with self.lock:
+            self.last_sweep = now
+            for key, entries in self.idle.items():
+                alive = []
+                for conn, last_used in entries:
+                    if now - last_used <= self.idle_timeout:
+                        alive.append((conn, last_used))
+                    else:
+                        conn.close()
+                self.idle[key] = alive
+
+    def close_all(self):
+        with self.lock:
+            for entries in self.idle.values():
+                for conn, _ in entries:
+                    conn.close()
+            self.idle = {}
+
+    @property
+    def reuse_ratio(self) -> float:
+        if self.requests == 0:
+            return 0.0
+        return self.reused / self.requests
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            idle = sum(len(entries) for entries in self.idle.values())
+        return {
+            "requests": self.requests,
+            "reused": self.reused,
+            "reconnects": self.reconnects,
+            "reuse_ratio": round(self.reuse_ratio, 3),
+            "idle": idle,
+        }
+
+    def report(self, logger: Logger, force: bool = False):
+        """Logs pool statistics at most once per report_interval"""
+        self.__check_pid()
+        now = time.monotonic()
+        if not force and now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        logger.info(f"Connection pool: {self.stats()}")
+
+
+# shared by every fetch helper in the process
+CONNECTION_POOL = ConnectionPool()
+
+
 def _get_html(
     uri: str,
     headers: Dict[str, Any],
@@ -35,26 +220,30 @@ def _get_html(
         if verbose:
             print(msg)
 
-    def _decode(resp):
-        encoding = resp.getheader("Content-Encoding")
-        if encoding == "gzip":
-            return gzip.decompress(resp.read())
-        if encoding == "br":
-            return brotli.decompress(resp.read())
-        return resp.read()
+    def _decode(resp, body):
+        return decompress_body(body, resp.getheader("Content-Encoding"))
 
     def send_message(msg): return _handle_message(msg, logger, verbose)
     parsed = urlparse(uri)
     other_path = parsed.path + "?" + parsed.query
 
+    host = parsed.netloc
+
     for i in range(5):
-        conn = None
         resp = None
+        body = None
         try:
+            # interval seeds the adaptive rate of (ip, host)
+            RATE_CONTROLLER.wait(ip, host, interval)
             send_message(f"GET {uri}")
-            conn = make_https_connection(parsed.netloc, ip)
-            conn.request("GET", other_path, headers=headers)
-            resp = conn.getresponse()
+            started = time.monotonic()
+            try:
+                resp, body = CONNECTION_POOL.request(host, other_path, headers, ip=ip)
+            except Exception:
+                RATE_CONTROLLER.record(ip, host, interval, None)
+                raise
+            RATE_CONTROLLER.record(
+                ip, host, interval, resp.status, time.monotonic() - started)
             headers["Referer"] = uri
 
             if resp.status == 302:
@@ -85,7 +274,7 @@ def _get_html(
 
                 if error_override_function:
                     try:
-                        data = _decode(resp).decode("utf-8", errors="ignore")
+                        data = _decode(resp, body).decode("utf-8", errors="ignore")
                     except:
                         data = None
                     if error_override_function(data):
@@ -95,13 +284,12 @@ def _get_html(
 
                 if ignore_error:
                     try:
-                        data = _decode(resp)
+                        data = _decode(resp, body)
                     except:
                         data = None
                     return resp.status, data
 
-                time.sleep(retry_interval)
-                retry_interval = retry_interval * 2
+                # the rate controller has already slowed (ip, host) down
                 continue
 
             try:
@@ -115,7 +303,7 @@ def _get_html(
                 else:
                     headers["Cookie"] = cookie
 
-            data = _decode(resp)
+            data = _decode(resp, body)
             return resp.status, data.decode("utf-8", errors="ignore")
 
         except Exception as e:
@@ -126,7 +314,7 @@ def _get_html(
     data = None
     if resp:
         status = resp.status
-        data = _decode(resp)
+        data = _decode(resp, body)
     logger.error("Too many errors have occured obtaining %s", uri)
     return status, data.decode("utf-8", errors="ignore")
 
@@ -143,7 +331,9 @@ def get_html(
     retry_interval=15,
     error_override_function=None,
 ):
-    time.sleep(interval)
+    """GETs uri. Requests to a host are paced by RATE_CONTROLLER, starting at
+    one per interval seconds. retry_interval is the wait after a connection
+    failure or a 429"""
     return _get_html(
         uri,
         headers,
@@ -1,10 +1,14 @@
 import urllib.parse
-from time import sleep
+from time import sleep, monotonic
 import gzip
 import http.client
 from bs4 import BeautifulSoup
 import logging
 from io import BytesIO
+
+from util.connection import CONNECTION_POOL
+from util.ratelimit import RATE_CONTROLLER
+
 HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
     "Accept-Encoding": "gzip, deflate, br",
@@ -31,7 +35,9 @@ def make_conn(netloc, ip):
     return conn
 
 
-def _fetch_html(uri, logger, ip, retry=5, retry_interval=30, return_uri=False):
+def _fetch_html(
+    uri, logger, ip, retry=5, retry_interval=30, return_uri=False, interval=0.75
+):
     if logger is None:
         logger = logging.getLogger(__name__)
     parsed_uri = urllib.parse.urlparse(uri)
@@ -39,25 +45,36 @@ def _fetch_html(uri, logger, ip, retry=5, retry_interval=30, return_uri=False):
     query = parsed_uri.query
     netloc = parsed_uri.netloc
     sendpath = path + "?" + query
-    headers = HEADERS
+    # Referer and Cookie are set per request, and fetches may run in threads
+    headers = dict(HEADERS)
 
+    failed = False
     for i in range(retry):
-        conn = None
         resp = None
-        if i > 0:
+        # non-200 responses already slowed (ip, host) down in the rate
+        # controller; connection failures and bans also wait retry_interval
+        if failed:
             sleep(retry_interval)
             retry_interval *= 2
+        failed = False
         try:
-            conn = make_conn(netloc, ip)
+            RATE_CONTROLLER.wait(ip, netloc, interval)
             logger.info(f"uri: {uri}, retry: {i}")
-            conn.request("GET", sendpath, headers=headers)
-            resp = conn.getresponse()
+            started = monotonic()
+            try:
+                resp, raw = CONNECTION_POOL.request(netloc, sendpath, headers, ip=ip)
+            except Exception:
+                RATE_CONTROLLER.record(ip, netloc, interval, None)
+                raise
+            RATE_CONTROLLER.record(
+                ip, netloc, interval, resp.status, monotonic() - started)
             headers["Referer"] = uri
 
             # handle redirection
             if resp.status == 302 and "Location" in resp.headers:
                 res = fetch_html(
-                    resp.headers["Location"], logger, ip, return_uri=return_uri
+                    resp.headers["Location"], logger, ip,
+                    interval=interval, return_uri=return_uri
                 )
                 return res
 
@@ -81,7 +98,6 @@ def _fetch_html(uri, logger, ip, retry=5, retry_interval=30, return_uri=False):
 
             encoding = resp.getheader("Content-Encoding")
             if encoding == "gzip":
-                raw = resp.read()
                 charset = resp.getheader("Content-Type").split("charset=")
                 buf = BytesIO(raw)
                 with gzip.GzipFile(fileobj=buf) as f:
@@ -89,9 +105,10 @@ def _fetch_html(uri, logger, ip, retry=5, retry_interval=30, return_uri=False):
                     data = f.read().decode(resp_charset, errors="ignore")
                 return data, uri
             else:
-                data = resp.read()
+                data = raw
             return data.decode("utf-8", errors="ignore"), uri
         except Exception as e:
+            failed = True
             logger.error(f"Exception: {e}, uri: {uri}, retry: {i}")
     return None
 
@@ -99,7 +116,7 @@ def _fetch_html(uri, logger, ip, retry=5, retry_interval=30, return_uri=False):
 def fetch_html(
     uri, logger, ip=None, retry=5, interval=0.75, retry_interval=15, return_uri=False
 ):
-    sleep(interval)
+    """Requests to a host are paced by RATE_CONTROLLER, starting at one per interval seconds"""
     res = _fetch_html(
         uri,
         logger,
@@ -107,6 +124,7 @@ def fetch_html(
         retry=retry,
         retry_interval=retry_interval,
         return_uri=return_uri,
+        interval=interval,
     )
     if res is None:
         return res
@@ -116,8 +134,7 @@ def fetch_html(
 
 
 def get_soup(uri, logger=None, ip=None, conn=None, interval=1):
-    sleep(interval)
-    data = fetch_html(uri, logger, ip)
+    data = fetch_html(uri, logger, ip, interval=interval)
     if data is None:
         return None
     try:
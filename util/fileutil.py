@@ -3,8 +3,17 @@ from typing import List
 
 
 def count_file_lines(filepath: str) -> int:
-    with open(filepath, "r", encoding="utf-8") as f:
-        return len(f.readlines())
+    """Counts the lines of a file reading it in blocks"""
+    count = 0
+    last = b"\n"
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            count += block.count(b"\n")
+            last = block[-1:]
+    # a last line without a newline
+    if last != b"\n":
+        count += 1
+    return count
 
 
 def read_tsv(filepath: str, header=True) -> List[str]:
@@ -0,0 +1,97 @@
+"""Backend selection for BeautifulSoup parsing.
+
+html.parser is pure Python and is the slowest part of parsing a stored page.
+lxml builds the same tree a few times faster, so make_soup uses it when it
+is installed. The two differ on a few constructs, e.g. carriage returns,
+CDATA and conditional comments, legacy entities followed by letters and
+unknown entities, NUL characters, markup inside title/textarea and unterminated
+comments, and text or elements other than head elements before <body>,
+which lxml moves into the body. Markup containing any of them (see
+diverges) is parsed with html.parser, so extracted text stays the same
+whichever backend is used. Full pages otherwise parse the same, with lxml.
+tests/test_htmlparse.py checks this against saved pages.
+
+parse_only takes a SoupStrainer so only the containers an extractor reads
+are built, e.g. SoupStrainer(id="content").
+"""
+import os
+import re
+from html.entities import html5
+from typing import Optional, Union
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+HTML_PARSER = "html.parser"
+LXML = "lxml"
+BACKENDS = [HTML_PARSER, LXML]
+# overrides the backend, e.g. HTML_PARSER=html.parser to compare outputs
+BACKEND_ENV = "HTML_PARSER"
+
+DIVERGENT = re.compile(
+    r"\r|\x00|<!\[|<\?|<title[^>]*>[^<]*<(?!/title)"
+    r"|</?(?:textarea|xmp|iframe|plaintext|noembed|noframes|listing|pre|template"
+    r"|frameset)\b", re.IGNORECASE)
+BODY = re.compile(r"<body\b", re.IGNORECASE)
+# what may come before <body> without lxml moving it into the body
+HEAD_CONTENT = re.compile(
+    r"<(script|style|title|noscript)\b.*?</\1\s*>|<!--.*?-->|<!doctype[^>]*>"
+    r"|</?(?:html|head|meta|link|base)\b[^>]*>|\s+", re.IGNORECASE | re.DOTALL)
+ENTITY = re.compile(r"&([A-Za-z][A-Za-z0-9]*)(;?)")
+# entities html5 allows without the semicolon, e.g. &nbsp
+LEGACY_ENTITIES = {name for name in html5 if not name.endswith(";")}
+
+
+def available_backends():
+    return [HTML_PARSER] if lxml is None else list(BACKENDS)
+
+
+def default_backend() -> str:
+    backend = os.environ.get(BACKEND_ENV)
+    if backend:
+        check_backend(backend)
+        return backend
+    return HTML_PARSER if lxml is None else LXML
+
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown html parser {backend}, expected one of {BACKENDS}")
+    if backend == LXML and lxml is None:
+        raise ImportError("lxml is required for the lxml html parser: pip install lxml")
+
+
+def diverges(markup: Union[str, bytes]) -> bool:
+    """Whether lxml may parse markup into different text than html.parser"""
+    if isinstance(markup, bytes):
+        markup = markup.decode("utf-8", errors="replace")
+    if markup.count("<!--") > markup.count("-->"):
+        return True
+    if DIVERGENT.search(markup) is not None:
+        return True
+    body = BODY.search(markup)
+    if body is not None and HEAD_CONTENT.sub("", markup[:body.start()]):
+        return True
+    for match in ENTITY.finditer(markup):
+        name, semicolon = match.groups()
+        if semicolon:
+            # html.parser drops the semicolon of unknown entities
+            if name + ";" not in html5:
+                return True
+        elif any(name[:end] in LEGACY_ENTITIES for end in range(2, len(name))):
+            # lxml also decodes a legacy entity followed by letters, e.g. &lt3
+            return True
+    return False
+
+
+def make_soup(markup: Union[str, bytes], parse_only: Optional[SoupStrainer] = None,
+              backend: Optional[str] = None) -> BeautifulSoup:
+    if backend is None:
+        backend = default_backend()
+    if backend == LXML and diverges(markup):
+        backend = HTML_PARSER
+    return BeautifulSoup(markup, backend, parse_only=parse_only)
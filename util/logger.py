@@ -16,7 +16,7 @@ def setup_logger(log_name):
     logger.addHandler(console_handler)
     date_time = time.strftime("%Y%m%d-%H%M%S")
     if not os.path.exists("logs"):
-        os.makedirs("logs")
+        os.makedirs("logs", exist_ok=True)
     file_handler = logging.FileHandler(f"logs/{date_time}-{log_name}.log")
     file_handler.setFormatter(formatter)
     file_handler.setLevel(logging.INFO)
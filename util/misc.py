@@ -13,3 +13,13 @@ def get_backup(
 def get_interval(shared, private):
     """Finds interval from two dictionaries. Use default value if not found"""
     return get_backup("interval", shared, private, default_value=DEFAULT_INTERVAL)
+
+
+DEFAULT_CONCURRENCY = 1
+
+
+def get_concurrency(shared, private):
+    """Finds the number of requests a worker keeps in flight per ip.
+    1 keeps the serial fetch path"""
+    return int(get_backup("concurrency", shared, private,
+                          default_value=DEFAULT_CONCURRENCY))
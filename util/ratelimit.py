@@ -0,0 +1,252 @@
+"""Request rate limiting shared by the fetch helpers of one process"""
+import os
+import json
+import time
+import asyncio
+import threading
+from logging import Logger
+from typing import Dict, Optional, Tuple
+
+RATELIMIT_CACHE_DIR = "cache/ratelimit"
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second, holding at most capacity.
+
+    reserve() takes a token now or books the next free one, so concurrent
+    callers are spaced 1/rate seconds apart instead of all waking at once.
+    With capacity 1 this is the same politeness as sleeping interval
+    seconds between requests, but the time a request spends on the network
+    counts towards the interval.
+    """
+
+    rate = 1.0  # type: float
+    capacity = 1.0  # type: float
+    tokens = 1.0  # type: float
+    updated = 0  # type: float
+    lock = None  # type: threading.Lock
+
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_interval(cls, interval: float, capacity: float = 1):
+        """One request per interval seconds. interval <= 0 disables limiting"""
+        if interval <= 0:
+            return None
+        return cls(1.0 / interval, capacity)
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = rate
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Takes tokens and returns how many seconds the caller must wait before using them"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def wait(self, tokens: float = 1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, tokens: float = 1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveRate:
+    """AIMD state of one (ip, host) pair.
+    seed_rate is the configured 1/interval and bounds how far the rate moves"""
+
+    seed_rate = 1.0  # type: float
+    bucket = None  # type: TokenBucket
+    latency = None  # type: Optional[float]
+
+    def __init__(self, seed_rate: float, rate: Optional[float] = None):
+        self.seed_rate = seed_rate
+        self.bucket = TokenBucket(self.clip(rate or seed_rate))
+        self.latency = None
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def clip(self, rate: float) -> float:
+        low = self.seed_rate * RateController.min_factor
+        high = self.seed_rate * RateController.max_factor
+        return min(high, max(low, rate))
+
+
+class RateController:
+    """Adapts the request rate of every (ip, host) pair.
+
+    Starts at one request per configured interval, then additively speeds
+    up on every fast successful response and halves the rate on 429/403.
+    Server errors, connection failures and latency spikes slow it down
+    more gently. Learned rates are kept in cache/ratelimit/{ip}.json and
+    reused after a restart.
+    """
+
+    # the rate stays within [seed * min_factor, seed * max_factor]
+    min_factor = 1 / 32
+    max_factor = 4.0
+    # additive increase per success, as a fraction of the seed rate
+    increase = 0.02
+    # multiplicative decrease on 429/403 and on other failures
+    throttle_decrease = 0.5
+    failure_decrease = 0.8
+    # a response slower than spike_factor x the average latency is a spike
+    spike_factor = 3.0
+    spike_floor = 1.0
+    latency_alpha = 0.1
+    save_interval = 60  # type: float
+    report_interval = 300  # type: float
+
+    cache_dir = RATELIMIT_CACHE_DIR  # type: str
+    rates = None  # type: Dict[Tuple[str, str], AdaptiveRate]
+    persisted = None  # type: Dict[str, Dict[str, float]]
+    pid = None  # type: int
+    lock = None  # type: threading.Lock
+    last_save = 0  # type: float
+    last_report = 0  # type: float
+
+    def __init__(self, cache_dir: str = RATELIMIT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.__reset()
+
+    def __reset(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.rates = {}
+        self.persisted = {}
+        self.last_save = time.monotonic()
+        self.last_report = self.last_save
+
+    def __check_pid(self):
+        if self.pid != os.getpid():
+            self.__reset()
+
+    def __state(self, ip, host, interval) -> AdaptiveRate:
+        key = (ip or "", host)
+        state = self.rates.get(key)
+        if state is None:
+            rate = self.__load(key[0]).get(host)
+            state = AdaptiveRate(1.0 / interval, rate)
+            self.rates[key] = state
+        return state
+
+    def wait_time(self, ip, host: str, interval: float) -> float:
+        """Books the next request slot of (ip, host) and returns the seconds until it.
+        interval <= 0 disables limiting"""
+        if interval <= 0:
+            return 0.0
+        self.__check_pid()
+        with self.lock:
+            state = self.__state(ip, host, interval)
+        return state.bucket.reserve()
+
+    def wait(self, ip, host: str, interval: float):
+        delay = self.wait_time(ip, host, interval)
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, ip, host: str, interval: float, status: Optional[int], latency: float = 0):
+        """Feeds the outcome of a request back. status None means the request failed"""
+        if interval <= 0:
+            return
+        self.__check_pid()
+        with self.lock:
+            state = self.__state(ip, host, interval)
+            rate = state.rate
+            spike = (
+                state.latency is not None
+                and latency > self.spike_floor
+                and latency > state.latency * self.spike_factor
+            )
+            if status in (429, 403):
+                rate *= self.throttle_decrease
+            elif status is None or status >= 500 or spike:
+                rate *= self.failure_decrease
+            else:
+                rate += state.seed_rate * self.increase
+            if status is not None:
+                if state.latency is None:
+                    state.latency = latency
+                else:
+                    state.latency += self.latency_alpha * (latency - state.latency)
+            slowed = rate < state.rate
+            state.bucket.set_rate(state.clip(rate))
+        if slowed or time.monotonic() - self.last_save > self.save_interval:
+            self.save()
+
+    def current_rates(self) -> Dict[str, Dict[str, float]]:
+        """Requests per second of every (ip, host) used by this process"""
+        self.__check_pid()
+        rates = {}
+        with self.lock:
+            for (ip, host), state in self.rates.items():
+                rates.setdefault(ip, {})[host] = round(state.rate, 4)
+        return rates
+
+    def report(self, logger: Logger, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        logger.info(f"Request rates (req/s): {self.current_rates()}")
+
+    def __cache_path(self, ip: str) -> str:
+        return os.path.join(self.cache_dir, f"{ip or 'default'}.json")
+
+    def __load(self, ip: str) -> Dict[str, float]:
+        if ip not in self.persisted:
+            self.persisted[ip] = read_rates(self.__cache_path(ip))
+        return self.persisted[ip]
+
+    def save(self):
+        """Writes the learned rates of every ip, one file per ip"""
+        self.__check_pid()
+        self.last_save = time.monotonic()
+        for ip, rates in self.current_rates().items():
+            with self.lock:
+                merged = dict(self.__load(ip))
+                merged.update(rates)
+                self.persisted[ip] = merged
+            path = self.__cache_path(ip)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(merged, f, indent=2)
+                os.replace(temp_path, path)
+            except OSError:
+                pass
+
+
+def read_rates(path: str) -> Dict[str, float]:
+    try:
+        with open(path, "r") as f:
+            return {host: float(rate) for host, rate in json.load(f).items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+# shared by every fetch helper in the process
+RATE_CONTROLLER = RateController()
@@ -0,0 +1,42 @@
+"""Surrogate scrubbing for text that is about to be saved.
+
+Lone surrogates (U+D800..U+DFFF) come from broken pages and cannot be
+encoded as UTF-8. Almost every document is clean, so the common path is a
+single C-level isascii()/encode() check and the regex only runs on strings
+that actually contain a surrogate.
+"""
+import re
+
+PLACEHOLDER = "�"
+
+SURROGATE_PATTERN = re.compile("[\ud800-\udfff]")
+
+
+def has_surrogates(s: str) -> bool:
+    if s.isascii():
+        return False
+    try:
+        s.encode("utf-8")
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def replace_surrogates(s: str, placeholder: str = PLACEHOLDER) -> str:
+    """Replaces every lone surrogate with placeholder"""
+    if not has_surrogates(s):
+        return s
+    return SURROGATE_PATTERN.sub(placeholder, s)
+
+
+def remove_surrogates(s: str) -> str:
+    return replace_surrogates(s, "")
+
+
+def encode_utf8(s: str, placeholder: str = PLACEHOLDER) -> bytes:
+    """Encodes s as UTF-8, replacing lone surrogates.
+    Clean strings are encoded exactly once"""
+    try:
+        return s.encode("utf-8")
+    except UnicodeEncodeError:
+        return SURROGATE_PATTERN.sub(placeholder, s).encode("utf-8")
@@ -0,0 +1,77 @@
+"""SQLite databases shared by the processes of a run"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+class SqliteStore:
+    """Opens one connection per process and thread, since sqlite connections
+    must not cross fork and a connection is used by one thread at a time.
+    WAL mode lets readers run while one process writes.
+    Subclasses set SCHEMA, which is applied when the store is created."""
+
+    SCHEMA = ""
+    path = None  # type: str
+    _local = None  # type: threading.local
+    _connections = None  # type: List[Tuple[int, sqlite3.Connection]]
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        save_dir = os.path.dirname(path)
+        if save_dir and not os.path.isdir(save_dir):
+            os.makedirs(save_dir, exist_ok=True)
+        if self.SCHEMA:
+            self.connection.executescript(self.SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            # a thread that forked keeps its thread-local, holding the
+            # connection of the parent
+            connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection = connection
+            local.pid = os.getpid()
+            # kept so close() also closes the connections of other threads
+            self._connections.append((local.pid, connection))
+        return local.connection
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction taken before the first read, for read-modify-write
+        updates that other processes may run at the same time"""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_local", None)
+        state.pop("_connections", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._connections = []
+
+    def close(self):
+        """Closes the connections of every thread of this process. A thread
+        using the store afterwards opens a new one"""
+        pid = os.getpid()
+        for owner, connection in self._connections:
+            if owner == pid:
+                connection.close()
+        self._local = threading.local()
+        self._connections = []